@@ -0,0 +1,296 @@
+"""
+Módulo para evaluar respuestas localmente antes de recurrir al LLM.
+
+Resuelve de forma determinista los casos obvios (la respuesta exacta, con otras
+mayúsculas, sin tildes, con números escritos en palabras o con pequeños errores
+de tipeo) y los claramente incorrectos (un número o código distinto al esperado).
+Todo lo demás se considera ambiguo y se deriva al AnswerGrader.
+"""
+import random
+import re
+import unicodedata
+
+from clue_catalog import DEFAULT_PERSONA
+
+# Umbrales de similitud
+TYPO_RATIO = 0.88          # similitud mínima de una respuesta de una sola palabra con errores de tipeo
+TOKEN_RATIO = 0.8          # similitud mínima entre dos palabras de una respuesta de varias palabras
+MIN_TYPO_LENGTH = 5        # por debajo de este largo no se toleran errores de tipeo
+
+# Palabras que no aportan significado al comparar respuestas
+STOPWORDS = frozenset({
+    "a", "al", "con", "de", "del", "el", "en", "es", "la", "las", "lo", "los",
+    "o", "por", "que", "se", "su", "un", "una", "unos", "unas", "y", "era", "fue",
+})
+
+_UNITS = {
+    "cero": 0, "uno": 1, "un": 1, "una": 1, "dos": 2, "tres": 3, "cuatro": 4,
+    "cinco": 5, "seis": 6, "siete": 7, "ocho": 8, "nueve": 9, "diez": 10,
+    "once": 11, "doce": 12, "trece": 13, "catorce": 14, "quince": 15,
+    "dieciseis": 16, "diecisiete": 17, "dieciocho": 18, "diecinueve": 19,
+    "veinte": 20, "veintiuno": 21, "veintiun": 21, "veintidos": 22,
+    "veintitres": 23, "veinticuatro": 24, "veinticinco": 25, "veintiseis": 26,
+    "veintisiete": 27, "veintiocho": 28, "veintinueve": 29,
+}
+_TENS = {
+    "treinta": 30, "cuarenta": 40, "cincuenta": 50, "sesenta": 60,
+    "setenta": 70, "ochenta": 80, "noventa": 90,
+}
+_HUNDREDS = {
+    "cien": 100, "ciento": 100, "doscientos": 200, "trescientos": 300,
+    "cuatrocientos": 400, "quinientos": 500, "seiscientos": 600,
+    "setecientos": 700, "ochocientos": 800, "novecientos": 900,
+}
+_NUMBER_WORDS = set(_UNITS) | set(_TENS) | set(_HUNDREDS) | {"mil"}
+
+# Palabras que convierten un número en un rango o una aproximación ("entre 5 y 7")
+RANGE_WORDS = frozenset({
+    "a", "al", "aprox", "aproximadamente", "cerca", "desde", "entre", "hasta",
+    "mas", "menos", "o", "u", "y",
+})
+
+# Plantillas con el nombre de la persona de la búsqueda ({name})
+CORRECT_MESSAGES = (
+    "CORRECTO! ¡Bien ahí, {name}! La clavaste de una. 🎉",
+    "CORRECTO! ¡Qué memoria, {name}! No se te escapa nada. 🌟",
+    "CORRECTO! ¡Exacto! Se nota que no se te escapa una. 👏",
+)
+INCORRECT_MESSAGES = (
+    "INCORRECTO. Casi, pero no es ese número. Fijate bien en las pistas y probá de nuevo. 🔍",
+    "INCORRECTO. No es ese, {name}. Mirá otra vez las pistas, que ahí está la ayuda. 💡",
+)
+
+
+def strip_accents(text):
+    """Quitar tildes y diacríticos (ñ -> n incluida)."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def _words_to_numbers(tokens):
+    """
+    Reemplaza secuencias de números escritos en palabras por dígitos.
+
+    Args:
+        tokens (list): Palabras ya normalizadas
+
+    Returns:
+        list: Palabras con los números convertidos ("cuatro mil" -> "4000")
+    """
+    result = []
+    total = current = 0
+    in_number = False
+
+    def flush():
+        nonlocal total, current, in_number
+        if in_number:
+            result.append(str(total + current))
+        total = current = 0
+        in_number = False
+
+    for index, token in enumerate(tokens):
+        if token in _NUMBER_WORDS:
+            # "un"/"una" solos son artículos, no números
+            if token in ("un", "una") and not in_number:
+                following = tokens[index + 1] if index + 1 < len(tokens) else ""
+                if following != "mil":
+                    flush()
+                    result.append(token)
+                    continue
+            in_number = True
+            if token == "mil":
+                total += (current or 1) * 1000
+                current = 0
+            elif token in _HUNDREDS:
+                current += _HUNDREDS[token]
+            elif token in _TENS:
+                current += _TENS[token]
+            else:
+                current += _UNITS[token]
+        elif token == "y" and in_number and index + 1 < len(tokens) and tokens[index + 1] in _UNITS:
+            # "treinta y dos"
+            continue
+        else:
+            flush()
+            result.append(token)
+    flush()
+    return result
+
+
+def normalize(text):
+    """
+    Normaliza una respuesta para compararla: minúsculas, sin tildes ni
+    puntuación y con los números escritos en palabras convertidos a dígitos.
+
+    Args:
+        text (str): Texto original
+
+    Returns:
+        str: Texto normalizado (palabras separadas por un espacio)
+    """
+    text = strip_accents(str(text).lower())
+    text = re.sub(r"[^a-z0-9]+", " ", text)
+    return " ".join(_words_to_numbers(text.split()))
+
+
+def _content_tokens(normalized):
+    """Palabras con significado (sin artículos ni preposiciones)."""
+    return [token for token in normalized.split() if token not in STOPWORDS]
+
+
+def _numbers(normalized):
+    """Conjunto de números/códigos con dígitos presentes en el texto."""
+    return {token for token in normalized.split() if any(char.isdigit() for char in token)}
+
+
+def _digit_values(normalized):
+    """Números del texto sin ceros a la izquierda ("REU 081" y "reu81" -> {"81"})."""
+    return {run.lstrip("0") or "0" for run in re.findall(r"\d+", normalized)}
+
+
+def levenshtein(a, b):
+    """Distancia de edición entre dos cadenas."""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b)
+            ))
+        previous = current
+    return previous[-1]
+
+
+def similarity(a, b):
+    """Similitud entre 0 y 1 basada en la distancia de edición."""
+    if not a and not b:
+        return 1.0
+    return 1.0 - levenshtein(a, b) / max(len(a), len(b))
+
+
+def expected_answers(question):
+    """
+    Variantes aceptadas de la respuesta de una pregunta.
+
+    Incluye la respuesta completa, la respuesta sin el texto entre paréntesis,
+    el contenido de los paréntesis, las alternativas separadas por "/" y los
+    alias opcionales (`aliases`) definidos en clues.yaml.
+
+    Args:
+        question (Mapping): Pregunta del catálogo
+
+    Returns:
+        list: Respuestas normalizadas, sin duplicados
+    """
+    raw_answers = [question["answer"]] + list(question.get("aliases") or ())
+    variants = []
+    for answer in raw_answers:
+        answer = str(answer)
+        variants.append(answer)
+        without_parens = re.sub(r"\([^)]*\)", " ", answer)
+        variants.append(without_parens)
+        variants.extend(re.findall(r"\(([^)]*)\)", answer))
+        variants.extend(part for part in without_parens.split("/"))
+
+    result = []
+    for variant in variants:
+        normalized = normalize(variant)
+        if normalized and normalized not in result:
+            result.append(normalized)
+    return result
+
+
+def _tokens_match(expected_tokens, user_tokens):
+    """Cada palabra esperada tiene una palabra parecida en la respuesta del usuario."""
+    return all(
+        any(similarity(expected, given) >= TOKEN_RATIO for given in user_tokens)
+        for expected in expected_tokens
+    )
+
+
+def _is_obvious_match(expected, user):
+    """Determina si la respuesta del usuario coincide claramente con una variante."""
+    if expected == user or expected.replace(" ", "") == user.replace(" ", ""):
+        return True
+
+    expected_numbers = _numbers(expected)
+    user_numbers = _numbers(user)
+    if expected_numbers and expected_numbers == user_numbers:
+        # "6" o "seis" para "6 veces": mismo número y nada que lo contradiga
+        extra = set(_content_tokens(user)) - set(_content_tokens(expected))
+        if not extra:
+            return True
+
+    if expected_numbers or user_numbers:
+        # Con números/códigos no se toleran errores de tipeo
+        return False
+
+    expected_tokens = _content_tokens(expected)
+    user_tokens = _content_tokens(user)
+    if len(expected_tokens) == 1 and len(user_tokens) == 1:
+        # Una sola palabra: se tolera un error de tipeo en la palabra completa
+        expected_word, user_word = expected_tokens[0], user_tokens[0]
+        return len(expected_word) >= MIN_TYPO_LENGTH and similarity(expected_word, user_word) >= TYPO_RATIO
+
+    # Varias palabras: la tolerancia se aplica palabra por palabra, para que
+    # cambiar una palabra entera ("Juan Perez" por "Juan Paez") no pase por
+    # un error de tipeo de la frase completa
+    if expected_tokens and user_tokens and len(user_tokens) <= len(expected_tokens) + 2:
+        return _tokens_match(expected_tokens, user_tokens) and _tokens_match(user_tokens, expected_tokens)
+    return False
+
+
+def quick_grade(user_answer, question):
+    """
+    Evalúa la respuesta localmente.
+
+    Args:
+        user_answer (str): Respuesta del usuario
+        question (Mapping): Pregunta del catálogo (con `answer` y `aliases` opcionales)
+
+    Returns:
+        bool: True si es claramente correcta, False si es claramente incorrecta
+        o None si es ambigua y hay que consultar al LLM
+    """
+    user = normalize(user_answer)
+    if not user:
+        return None
+
+    candidates = expected_answers(question)
+    if any(_is_obvious_match(expected, user) for expected in candidates):
+        return True
+
+    # Respuestas numéricas o códigos (teléfonos, patentes, códigos postales):
+    # si el usuario dio otro número, es claramente incorrecta. Con varios números
+    # o un rango ("entre 5 y 7") la respuesta es ambigua y decide el LLM
+    user_numbers = _numbers(user)
+    if len(user.split()) > 1 and (len(user_numbers) > 1 or RANGE_WORDS & set(user.split())):
+        return None
+    numeric_candidates = [expected for expected in candidates if _numbers(expected)]
+    if user_numbers and numeric_candidates and len(numeric_candidates) == len(candidates):
+        user_values = _digit_values(user)
+        if all(not (_digit_values(expected) & user_values) for expected in numeric_candidates):
+            return False
+
+    return None
+
+
+def quick_feedback(is_correct, persona=None):
+    """
+    Mensaje para una evaluación resuelta localmente, con el mismo formato que
+    el AnswerGrader ("CORRECTO! ..." / "INCORRECTO. ...").
+
+    Args:
+        is_correct (bool): Resultado de la evaluación
+        persona (Mapping): Persona de la búsqueda (ver ClueCatalog.persona)
+
+    Returns:
+        str: Mensaje amistoso
+    """
+    persona = persona or DEFAULT_PERSONA
+    template = random.choice(CORRECT_MESSAGES if is_correct else INCORRECT_MESSAGES)
+    return template.format(name=persona["name"])
@@ -0,0 +1,248 @@
+"""
+Benchmark sin conexión: juega la búsqueda con N jugadores simulados.
+
+Levanta el servidor simulado de Azure OpenAI (mock_openai_server.py), ejecuta
+streamlit_app.py con el AppTest de Streamlit y hace que cada jugador recorra
+las preguntas de clues.yaml: enciende una pista, consulta al Genio, manda una
+respuesta incorrecta (la evalúa el LLM) y después la correcta. Informa reruns
+por segundo, latencias p50/p95/p99 por tipo de interacción y memoria por
+sesión.
+
+Uso:
+    python benchmark.py --players 8 --questions 3 --ttft 0.2 --tokens-per-second 80 --rate-limit 0.05
+    python benchmark.py --max-p95 1500   # sale con error si el p95 supera 1500 ms
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from mock_openai_server import MockSettings, start_server
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(APP_DIR, "streamlit_app.py")
+MOCK_DEPLOYMENT = "mock-deployment"
+# Versión que informa el uso de tokens también con streaming
+MOCK_API_VERSION = "2024-10-21"
+
+
+def percentile(values, fraction):
+    """
+    Percentil por el método del rango más cercano.
+
+    Args:
+        values (list): Valores (no hace falta que estén ordenados)
+        fraction (float): Percentil entre 0 y 1
+
+    Returns:
+        float: Valor del percentil (0.0 si no hay valores)
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def configure_environment(endpoint):
+    """Apuntar la aplicación al servidor simulado y usar almacenes en memoria."""
+    os.environ.update({
+        "AZURE_OPENAI_API_KEY": "mock",
+        "AZURE_OPENAI_ENDPOINT": endpoint,
+        "OPENAI_API_VERSION": MOCK_API_VERSION,
+        "AZURE_OPENAI_DEPLOYMENT_NAME": MOCK_DEPLOYMENT,
+        "AZURE_OPENAI_BACKENDS": "",
+        "GRADING_CACHE_PATH": "",
+        "GENIE_POOL_PATH": "",
+        "PROGRESS_STORE": "memory",
+        "USAGE_STORE": "memory",
+    })
+
+
+class Player:
+    """Un jugador simulado con su propia sesión de AppTest."""
+
+    def __init__(self, number, timeout):
+        """
+        Args:
+            number (int): Número de jugador (para que sus respuestas sean únicas)
+            timeout (float): Segundos máximos por rerun
+        """
+        from streamlit.testing.v1 import AppTest
+
+        self.number = number
+        self.app = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.app.secrets["azure_openai"] = {
+            "AZURE_OPENAI_API_KEY": os.environ["AZURE_OPENAI_API_KEY"],
+            "AZURE_OPENAI_ENDPOINT": os.environ["AZURE_OPENAI_ENDPOINT"],
+            "OPENAI_API_VERSION": MOCK_API_VERSION,
+            "AZURE_OPENAI_DEPLOYMENT_NAME": MOCK_DEPLOYMENT,
+        }
+        self.latencies = {}
+        self.errors = 0
+        self.completed = 0
+
+    def _timed(self, kind, action=None):
+        """Ejecutar un rerun (tras `action`, si se indica) y medir su duración."""
+        if action is not None:
+            action()
+        started = time.perf_counter()
+        self.app.run()
+        self.latencies.setdefault(kind, []).append(time.perf_counter() - started)
+        if self.app.exception:
+            self.errors += 1
+
+    def _button(self, label):
+        return next(button for button in self.app.button if button.label == label)
+
+    def _answer(self, text):
+        self.app.text_input[0].input(text)
+        self._button("Enviar respuesta ✅").click()
+
+    def play(self, catalog, questions):
+        """
+        Recorrer las primeras `questions` preguntas de la búsqueda.
+
+        Args:
+            catalog (ClueCatalog): Catálogo de la búsqueda
+            questions (int): Cantidad de preguntas a jugar
+        """
+        self._timed("load")
+        for question_id in catalog.ids[:questions]:
+            question = catalog.get(question_id)
+            self._timed("clue", lambda: self.app.button(key="clue_0").click())
+            self._timed("genie", lambda: self._button("Consultar al Genio 🧞‍♂️").click())
+            self._timed("grade_llm", lambda: self._answer(f"quizás sea algo del jugador {self.number}"))
+            self._timed("grade_local", lambda: self._answer(question["answer"]))
+            # El temporizador de la celebración no corre en AppTest: simular su rerun
+            self._timed("transition")
+        self.completed = len(self.app.session_state["completed_questions"])
+
+
+def run_benchmark(players, questions, settings, concurrency, timeout, measure_memory):
+    """
+    Ejecutar el benchmark completo.
+
+    Args:
+        players (int): Jugadores simulados
+        questions (int): Preguntas por jugador
+        settings (MockSettings): Comportamiento del servidor simulado
+        concurrency (int): Jugadores jugando a la vez
+        timeout (float): Segundos máximos por rerun
+        measure_memory (bool): Medir memoria por sesión con tracemalloc (más lento)
+
+    Returns:
+        dict: Informe con latencias, reruns por segundo y memoria
+    """
+    server, endpoint = start_server(0, settings)
+    configure_environment(endpoint)
+    os.chdir(APP_DIR)
+    sys.path.insert(0, APP_DIR)
+
+    import clue_catalog
+    import usage_ledger
+
+    catalog = clue_catalog.load_catalog()
+    questions = min(questions, len(catalog))
+
+    # Calentar una vez (imports, catálogo, pasarela) fuera de la medición
+    Player(-1, timeout).app.run()
+
+    if measure_memory:
+        tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0] if measure_memory else 0
+
+    sessions = [Player(number, timeout) for number in range(players)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(player.play, catalog, questions) for player in sessions]:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    memory_per_session = None
+    if measure_memory:
+        memory_per_session = (tracemalloc.get_traced_memory()[0] - baseline) / players
+        tracemalloc.stop()
+    server.shutdown()
+
+    by_kind = {}
+    for player in sessions:
+        for kind, values in player.latencies.items():
+            by_kind.setdefault(kind, []).extend(values)
+    all_latencies = [value for values in by_kind.values() for value in values]
+
+    def summary(values):
+        return {
+            "count": len(values),
+            "p50_ms": round(percentile(values, 0.50) * 1000, 1),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 1),
+        }
+
+    return {
+        "players": players,
+        "questions": questions,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 2),
+        "reruns_per_s": round(len(all_latencies) / elapsed, 2) if elapsed else 0.0,
+        "errors": sum(player.errors for player in sessions),
+        # Si no coincide con players * questions, el flujo del juego se rompió
+        "completed_questions": sum(player.completed for player in sessions),
+        "server_requests": settings.requests,
+        "server_rate_limited": settings.rate_limited,
+        "memory_per_session_kb": round(memory_per_session / 1024, 1) if memory_per_session is not None else None,
+        "overall": summary(all_latencies),
+        "interactions": {kind: summary(values) for kind, values in sorted(by_kind.items())},
+        "tokens": usage_ledger.get_usage_ledger().report("agent"),
+    }
+
+
+def print_report(report):
+    """Mostrar el informe como tabla."""
+    print(f"Jugadores: {report['players']} (de a {report['concurrency']}), preguntas: {report['questions']}")
+    print(f"Duración: {report['elapsed_s']} s, reruns/s: {report['reruns_per_s']}, errores: {report['errors']}")
+    print(f"Preguntas resueltas: {report['completed_questions']} de {report['players'] * report['questions']}")
+    print(f"Peticiones al servidor simulado: {report['server_requests']} ({report['server_rate_limited']} con 429)")
+    if report["memory_per_session_kb"] is not None:
+        print(f"Memoria por sesión: {report['memory_per_session_kb']} KB")
+    print(f"{'interacción':<14}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for kind, stats in [*report["interactions"].items(), ("total", report["overall"])]:
+        print(f"{kind:<14}{stats['count']:>6}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+    for group in report["tokens"]:
+        print(
+            f"Tokens {group['agent']}: {group['calls']} llamadas, "
+            f"{group['prompt_tokens']} de entrada y {group['completion_tokens']} de salida"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark sin conexión de Regalo Misterioso")
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--questions", type=int, default=3, help="preguntas por jugador")
+    parser.add_argument("--concurrency", type=int, default=4, help="jugadores a la vez")
+    parser.add_argument("--ttft", type=float, default=0.2, help="segundos hasta el primer token")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="proporción de respuestas 429")
+    parser.add_argument("--retry-after", type=float, default=0.5)
+    parser.add_argument("--timeout", type=float, default=60.0, help="segundos máximos por rerun")
+    parser.add_argument("--memory", action="store_true", help="medir memoria por sesión (más lento)")
+    parser.add_argument("--output", help="guardar el informe en JSON")
+    parser.add_argument("--max-p95", type=float, help="fallar si el p95 total supera estos milisegundos")
+    args = parser.parse_args()
+
+    mock_settings = MockSettings(args.ttft, args.tokens_per_second, args.rate_limit, args.retry_after)
+    result = run_benchmark(args.players, args.questions, mock_settings, args.concurrency, args.timeout, args.memory)
+    print_report(result)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+    if args.max_p95 is not None and result["overall"]["p95_ms"] > args.max_p95:
+        sys.exit(f"p95 total {result['overall']['p95_ms']} ms supera el límite de {args.max_p95} ms")
+    if result["errors"]:
+        sys.exit(f"{result['errors']} reruns terminaron con excepción")
+    if result["completed_questions"] != result["players"] * result["questions"]:
+        sys.exit("Algunos jugadores no pudieron resolver sus preguntas")
@@ -0,0 +1,441 @@
+"""
+Módulo para cargar el catálogo de acertijos (clues.yaml) una sola vez por proceso.
+
+El catálogo se comparte entre todas las sesiones de Streamlit como un objeto
+inmutable y sólo se vuelve a parsear cuando el archivo cambia en disco, de modo
+que se pueden editar las pistas en caliente sin reiniciar la aplicación. Al
+cargarlo se construye un índice (id -> pregunta, orden, siguiente/anterior) para
+que las búsquedas no recorran la lista de preguntas en cada rerun.
+
+Para arrancar rápido con catálogos grandes, `python clue_catalog.py build`
+valida clues.yaml y lo compila en una instantánea JSON (clues.compiled.json)
+que se carga con el parser en C de la biblioteca estándar y trae ya contados
+los tokens de los prompts de cada pregunta (ver prompts.catalog_token_counts). Si la instantánea no
+existe o no corresponde al contenido actual del YAML, se usa el YAML.
+
+Además de clues.yaml (la búsqueda por defecto), puede haber muchas búsquedas
+en un directorio (hunts/<id>/clues.yaml), cada una con sus preguntas, su final
+y su persona (a quién está dirigido el juego). Se cargan recién cuando alguien
+las pide y se mantienen en un LRU acotado, de modo que la memoria no crece con
+la cantidad de búsquedas.
+
+Uso:
+    python clue_catalog.py build [clues.yaml]   # validar y compilar
+    python clue_catalog.py check [clues.yaml]   # solo validar
+"""
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+from types import MappingProxyType
+
+import yaml
+
+DEFAULT_CLUES_PATH = "clues.yaml"
+# Versión del formato de la instantánea compilada
+SNAPSHOT_FORMAT = 2
+# Directorio con una carpeta por búsqueda (hunts/<id>/clues.yaml)
+DEFAULT_HUNTS_DIR = os.getenv("HUNTS_DIR", "hunts")
+# Catálogos que se mantienen cargados a la vez
+DEFAULT_CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE", "256"))
+HUNT_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+# Persona por defecto (la de clues.yaml); cada búsqueda puede redefinir sus claves
+DEFAULT_PERSONA = MappingProxyType({
+    "name": "Claude",
+    "description": "una señora argentina de 70 años",
+    "authors": "sus hijos Jean-François Y Charlotte",
+})
+
+
+class CatalogValidationError(ValueError):
+    """El archivo de pistas no cumple el esquema esperado."""
+
+    def __init__(self, errors):
+        """
+        Args:
+            errors (list): Descripción de cada problema encontrado
+        """
+        super().__init__("\n".join(errors))
+        self.errors = errors
+
+
+class UnknownHuntError(LookupError):
+    """No existe una búsqueda con ese id."""
+
+_lock = threading.Lock()
+_entries = OrderedDict()
+
+
+def _freeze(value):
+    """
+    Convierte recursivamente dicts y listas en estructuras de solo lectura.
+
+    Args:
+        value: Valor parseado del YAML
+
+    Returns:
+        Valor equivalente inmutable (MappingProxyType / tuple)
+    """
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+class ClueCatalog:
+    """
+    Catálogo inmutable de preguntas con índice precalculado.
+
+    Los ids no tienen por qué ser contiguos: el orden de juego es el orden en
+    que aparecen las preguntas en el archivo.
+    """
+
+    def __init__(self, data, token_counts=None):
+        """
+        Args:
+            data (Mapping): Datos de las pistas ya congelados
+            token_counts (dict): Tokens de los prompts por id de pregunta, ya
+                contados al compilar (None para contarlos al primer uso)
+        """
+        self.data = data
+        self.token_counts = token_counts
+        questions = data.get("questions") or ()
+        self.ids = tuple(question["id"] for question in questions)
+        self.total_questions = data.get("total_questions", len(self.ids))
+        self.persona = MappingProxyType({**DEFAULT_PERSONA, **(data.get("persona") or {})})
+        # HTML del mensaje final (None para usar el genérico de la aplicación)
+        self.finale = data.get("finale")
+        self._by_id = {question["id"]: question for question in questions}
+        self._position = {question_id: index for index, question_id in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, question_id):
+        return question_id in self._by_id
+
+    @property
+    def first_id(self):
+        """Id de la primera pregunta o None si el catálogo está vacío."""
+        return self.ids[0] if self.ids else None
+
+    def get(self, question_id):
+        """
+        Obtiene una pregunta por su id.
+
+        Args:
+            question_id: Id de la pregunta
+
+        Returns:
+            Mapping: Pregunta o None si no existe
+        """
+        return self._by_id.get(question_id)
+
+    def position(self, question_id):
+        """
+        Posición de la pregunta dentro del juego (empezando en 1).
+
+        Returns:
+            int: Posición o None si el id no existe
+        """
+        index = self._position.get(question_id)
+        return None if index is None else index + 1
+
+    def next_id(self, question_id):
+        """
+        Id de la pregunta siguiente.
+
+        Returns:
+            Id siguiente o None si es la última (o el id no existe)
+        """
+        index = self._position.get(question_id)
+        if index is None or index + 1 >= len(self.ids):
+            return None
+        return self.ids[index + 1]
+
+    def previous_id(self, question_id):
+        """
+        Id de la pregunta anterior.
+
+        Returns:
+            Id anterior o None si es la primera (o el id no existe)
+        """
+        index = self._position.get(question_id)
+        if index is None or index == 0:
+            return None
+        return self.ids[index - 1]
+
+
+def validate_catalog(data):
+    """
+    Validar los datos de las pistas contra el esquema.
+
+    Comprueba que haya preguntas, que los ids sean únicos, que cada pregunta
+    tenga texto, respuesta y al menos una pista, y que `total_questions`
+    coincida con la cantidad de preguntas.
+
+    Args:
+        data (Mapping): Datos parseados del archivo de pistas
+
+    Raises:
+        CatalogValidationError: Con la lista de problemas encontrados
+    """
+    errors = []
+    if not isinstance(data, dict):
+        raise CatalogValidationError(["El archivo debe ser un mapa con la clave 'questions'"])
+
+    questions = data.get("questions")
+    if not isinstance(questions, list) or not questions:
+        errors.append("'questions' debe ser una lista no vacía")
+        questions = []
+
+    seen = set()
+    for position, question in enumerate(questions, start=1):
+        label = f"pregunta #{position}"
+        if not isinstance(question, dict):
+            errors.append(f"{label}: debe ser un mapa")
+            continue
+        question_id = question.get("id")
+        if question_id is None:
+            errors.append(f"{label}: falta 'id'")
+        elif question_id in seen:
+            errors.append(f"{label}: id {question_id!r} repetido")
+        else:
+            seen.add(question_id)
+            label = f"pregunta {question_id!r}"
+        for field in ("question", "answer"):
+            if not str(question.get(field) or "").strip():
+                errors.append(f"{label}: falta '{field}'")
+        clues = question.get("clues")
+        if not isinstance(clues, list) or not clues:
+            errors.append(f"{label}: 'clues' debe ser una lista no vacía")
+        elif any(not str(clue or "").strip() for clue in clues):
+            errors.append(f"{label}: hay pistas vacías")
+        aliases = question.get("aliases")
+        if aliases is not None and not isinstance(aliases, list):
+            errors.append(f"{label}: 'aliases' debe ser una lista")
+
+    total = data.get("total_questions")
+    if total is not None and total != len(questions):
+        errors.append(f"'total_questions' es {total} pero hay {len(questions)} preguntas")
+
+    persona = data.get("persona")
+    if persona is not None and not isinstance(persona, dict):
+        errors.append("'persona' debe ser un mapa")
+    finale = data.get("finale")
+    if finale is not None and not isinstance(finale, str):
+        errors.append("'finale' debe ser un texto (HTML)")
+
+    if errors:
+        raise CatalogValidationError(errors)
+
+
+def snapshot_path(path):
+    """
+    Ruta de la instantánea compilada de un archivo de pistas.
+
+    Args:
+        path (str): Ruta al archivo de pistas (p. ej. clues.yaml)
+
+    Returns:
+        str: Ruta de la instantánea (p. ej. clues.compiled.json)
+    """
+    return f"{os.path.splitext(path)[0]}.compiled.json"
+
+
+def compile_catalog(path=DEFAULT_CLUES_PATH, output=None):
+    """
+    Validar un archivo de pistas y compilarlo en una instantánea JSON.
+
+    La instantánea guarda el hash del YAML de origen para detectar si quedó
+    desactualizada, y los tokens de los prompts de cada pregunta (en el orden
+    de las preguntas) para no contarlos al arrancar.
+
+    Args:
+        path (str): Ruta al archivo de pistas
+        output (str): Ruta de la instantánea (por defecto, ver snapshot_path)
+
+    Returns:
+        str: Ruta de la instantánea escrita
+
+    Raises:
+        CatalogValidationError: Si el archivo no cumple el esquema
+    """
+    with open(path, 'rb') as file:
+        raw = file.read()
+    data = yaml.safe_load(raw.decode('utf-8'))
+    validate_catalog(data)
+    # Import diferido: prompts depende de este módulo
+    from prompts import question_token_counts
+    catalog = ClueCatalog(_freeze(data))
+
+    output = output or snapshot_path(path)
+    snapshot = {
+        "format": SNAPSHOT_FORMAT,
+        "source_sha256": hashlib.sha256(raw).hexdigest(),
+        "data": data,
+        "token_counts": [
+            question_token_counts(catalog.get(question_id), catalog.persona) for question_id in catalog.ids
+        ],
+    }
+    tmp_path = f"{output}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(snapshot, file, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, output)
+    return output
+
+
+def _load_snapshot(path, digest):
+    """
+    Cargar la instantánea compilada si corresponde al contenido actual.
+
+    Args:
+        path (str): Ruta al archivo de pistas
+        digest (str): SHA-256 del contenido actual del archivo de pistas
+
+    Returns:
+        ClueCatalog: Catálogo con los tokens ya contados o None si no hay instantánea vigente
+    """
+    try:
+        with open(snapshot_path(path), 'r', encoding='utf-8') as file:
+            snapshot = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if snapshot.get("format") != SNAPSHOT_FORMAT or snapshot.get("source_sha256") != digest:
+        return None
+    data = _freeze(snapshot.get("data"))
+    ids = [question["id"] for question in data.get("questions") or ()]
+    return ClueCatalog(data, dict(zip(ids, snapshot.get("token_counts") or ())) or None)
+
+
+def _stat_key(path):
+    """Firma barata del archivo para detectar cambios sin leerlo."""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def load_catalog(path=DEFAULT_CLUES_PATH):
+    """
+    Carga el catálogo de pistas, reutilizando el resultado entre reruns.
+
+    El archivo sólo se vuelve a leer si cambió su mtime o tamaño, y sólo se
+    vuelve a parsear si además cambió su contenido (hash SHA-256). Si hay una
+    instantánea compilada para ese contenido, se usa en lugar del YAML.
+
+    Args:
+        path (str): Ruta al archivo de pistas
+
+    Returns:
+        ClueCatalog: Catálogo indexado (de solo lectura, compartido entre sesiones)
+    """
+    key = os.path.abspath(path)
+    stat_key = _stat_key(key)
+
+    with _lock:
+        # Otro hilo pudo haber recargado mientras esperábamos el lock
+        entry = _entries.get(key)
+        if entry is not None and entry["stat"] == stat_key:
+            _entries.move_to_end(key)
+            return entry["catalog"]
+
+        with open(key, 'rb') as file:
+            raw = file.read()
+        digest = hashlib.sha256(raw).hexdigest()
+
+        if entry is not None and entry["sha256"] == digest:
+            # Solo cambió el mtime (p. ej. un "touch"): no hace falta parsear
+            catalog = entry["catalog"]
+        else:
+            catalog = _load_snapshot(key, digest)
+            if catalog is None:
+                catalog = ClueCatalog(_freeze(yaml.safe_load(raw.decode('utf-8'))))
+
+        _entries[key] = {"stat": stat_key, "sha256": digest, "catalog": catalog}
+        _entries.move_to_end(key)
+        while len(_entries) > DEFAULT_CACHE_SIZE:
+            _entries.popitem(last=False)
+        return catalog
+
+
+def hunt_path(hunt_id, hunts_dir=DEFAULT_HUNTS_DIR):
+    """
+    Ruta del archivo de pistas de una búsqueda.
+
+    Args:
+        hunt_id (str): Id de la búsqueda (None o vacío para clues.yaml)
+        hunts_dir (str): Directorio de búsquedas
+
+    Returns:
+        str: Ruta al archivo de pistas
+
+    Raises:
+        UnknownHuntError: Si el id no es válido o la búsqueda no existe
+    """
+    if not hunt_id:
+        return DEFAULT_CLUES_PATH
+    # El id viene de la URL: no permitir rutas fuera del directorio de búsquedas
+    if not HUNT_ID_PATTERN.fullmatch(hunt_id):
+        raise UnknownHuntError(hunt_id)
+    path = os.path.join(hunts_dir, hunt_id, "clues.yaml")
+    if not os.path.isfile(path):
+        raise UnknownHuntError(hunt_id)
+    return path
+
+
+def load_hunt(hunt_id=None):
+    """
+    Carga el catálogo de una búsqueda (ver load_catalog).
+
+    Args:
+        hunt_id (str): Id de la búsqueda (None para clues.yaml)
+
+    Returns:
+        ClueCatalog: Catálogo de la búsqueda
+
+    Raises:
+        UnknownHuntError: Si la búsqueda no existe
+    """
+    return load_catalog(hunt_path(hunt_id))
+
+
+def load_clues(path=DEFAULT_CLUES_PATH):
+    """
+    Carga los datos crudos de las pistas (ver load_catalog).
+
+    Args:
+        path (str): Ruta al archivo de pistas
+
+    Returns:
+        Mapping: Datos de las pistas (de solo lectura, compartidos entre sesiones)
+    """
+    return load_catalog(path).data
+
+
+def clear_cache():
+    """Olvidar todos los catálogos cargados (útil para scripts y pruebas manuales)."""
+    with _lock:
+        _entries.clear()
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "build"
+    source = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_CLUES_PATH
+    try:
+        if command == "check":
+            with open(source, 'r', encoding='utf-8') as file:
+                validate_catalog(yaml.safe_load(file))
+            print(f"{source}: OK")
+        elif command == "build":
+            print(f"Catálogo compilado en {compile_catalog(source)}")
+        else:
+            sys.exit("Uso: python clue_catalog.py [build|check] [archivo]")
+    except CatalogValidationError as error:
+        print(f"{source} tiene errores:", file=sys.stderr)
+        for message in error.errors:
+            print(f"  - {message}", file=sys.stderr)
+        sys.exit(1)
@@ -1,83 +1,341 @@
 """
 Módulo para gestionar el progreso y estado del juego.
+
+El progreso se guarda por jugador/sesión en el almacén configurado (ver
+progress_store), con actualizaciones atómicas de una sola fila. Las escrituras
+pasan por un búfer (write-behind) que agrupa los cambios de cada jugador y los
+vuelca en lotes desde un hilo en segundo plano, para no bloquear cada
+interacción con una escritura a disco.
 """
+import atexit
+import copy
+import logging
+import os
+import threading
+
 import yaml
 
+import clue_catalog
+import telemetry
+from progress_store import get_progress_store
+
+logger = logging.getLogger(__name__)
+
+# Jugador por defecto (compatibilidad con el antiguo progress.yaml único)
+DEFAULT_PLAYER_ID = "default"
+LEGACY_PROGRESS_PATH = "progress.yaml"
+# Antigüedad máxima (segundos) de un cambio sin volcar; 0 para escribir al instante
+DEFAULT_MAX_STALENESS = float(os.getenv("PROGRESS_FLUSH_INTERVAL", "1.0"))
+# Jugadores pendientes que fuerzan un volcado anticipado
+DEFAULT_MAX_BATCH = int(os.getenv("PROGRESS_FLUSH_BATCH", "256"))
+
+
+def _merge_progress(previous, progress_data):
+    """Combinar dos versiones del progreso sin perder preguntas completadas."""
+    merged = copy.deepcopy(progress_data)
+    completed = list(merged.get("completed_questions") or [])
+    for question_id in previous.get("completed_questions") or []:
+        if question_id not in completed:
+            completed.append(question_id)
+    merged["completed_questions"] = completed
+    return merged
+
+
+class ProgressWriteBuffer:
+    """Búfer write-behind que agrupa el progreso por jugador y lo vuelca en lotes."""
+
+    def __init__(self, store=None, max_staleness=DEFAULT_MAX_STALENESS, max_batch=DEFAULT_MAX_BATCH):
+        """
+        Args:
+            store (ProgressStore): Almacén de destino (por defecto el compartido)
+            max_staleness (float): Segundos máximos que un cambio espera en el búfer
+            max_batch (int): Jugadores pendientes que fuerzan un volcado anticipado
+        """
+        self._store = store
+        self.max_staleness = max_staleness
+        self.max_batch = max_batch
+        self._pending = {}
+        # Lote que se está volcando: sigue visible para get() hasta que el almacén confirma
+        self._inflight = {}
+        # Jugadores cuyo cambio pendiente es un reinicio: el reencolado no lo mezcla
+        self._resets = set()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self.flushes = 0
+        self.writes = 0
+        self.errors = 0
+        self._thread = None
+        if max_staleness > 0:
+            self._thread = threading.Thread(target=self._run, name="progress-writer", daemon=True)
+            self._thread.start()
+
+    @property
+    def store(self):
+        """Almacén de destino."""
+        return self._store or get_progress_store()
+
+    def _run(self):
+        """Volcar periódicamente (o antes, si se llena el lote) hasta cerrar el búfer."""
+        while not self._closed:
+            self._wakeup.wait(self.max_staleness)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                # El lote se reencoló en flush(); se reintenta en el próximo ciclo
+                self.errors += 1
+                telemetry.count("progress_flush_errors_total")
+                with self._lock:
+                    pending = len(self._pending)
+                logger.warning(
+                    "No se pudo volcar el progreso (%d jugadores pendientes)", pending, exc_info=True
+                )
+
+    def put(self, player_id, progress_data, merge=True):
+        """
+        Encolar el progreso de un jugador (reemplaza al pendiente anterior).
+
+        Args:
+            player_id (str): Identificador del jugador/sesión
+            progress_data (dict): Datos del progreso
+            merge (bool): Conservar las preguntas completadas del cambio pendiente
+                (False para reinicios, que sí deben borrarlas)
+        """
+        if self._thread is None:
+            # Sin hilo de volcado: escritura directa
+            self.store.save(player_id, progress_data)
+            self.writes += 1
+            return
+        with self._lock:
+            previous = self._pending.get(player_id)
+            if merge and previous is not None:
+                self._pending[player_id] = _merge_progress(previous, progress_data)
+            else:
+                self._pending[player_id] = copy.deepcopy(progress_data)
+            if not merge:
+                self._resets.add(player_id)
+            full = len(self._pending) >= self.max_batch
+        if full:
+            self._wakeup.set()
+
+    def get(self, player_id):
+        """
+        Progreso pendiente o en pleno volcado (para leer lo que uno mismo acaba de escribir).
+
+        Args:
+            player_id (str): Identificador del jugador/sesión
+
+        Returns:
+            dict: Copia del progreso todavía no confirmado por el almacén o None
+        """
+        with self._lock:
+            progress_data = self._pending.get(player_id)
+            if progress_data is None:
+                progress_data = self._inflight.get(player_id)
+            return copy.deepcopy(progress_data) if progress_data is not None else None
+
+    def flush(self):
+        """
+        Volcar al almacén todos los cambios pendientes en una sola operación.
+
+        Si el almacén falla, el lote vuelve al búfer sin pisar cambios más nuevos;
+        si el cambio más nuevo es un reinicio, gana entero y el lote fallido se descarta.
+
+        Returns:
+            int: Jugadores escritos
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._inflight = batch
+                self._resets = set()
+            if not batch:
+                return 0
+            try:
+                self.store.save_many(batch)
+            except Exception:
+                with self._lock:
+                    self._inflight = {}
+                    for player_id, progress_data in batch.items():
+                        newer = self._pending.get(player_id)
+                        if newer is None:
+                            self._pending[player_id] = progress_data
+                        elif player_id not in self._resets:
+                            self._pending[player_id] = _merge_progress(progress_data, newer)
+                raise
+            with self._lock:
+                self._inflight = {}
+            self.flushes += 1
+            self.writes += len(batch)
+            return len(batch)
+
+    def close(self):
+        """Detener el hilo y volcar lo pendiente (se llama al apagar el proceso)."""
+        self._closed = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=max(1.0, self.max_staleness * 2))
+        self.flush()
+
+
+_write_buffer = None
+_write_buffer_lock = threading.Lock()
+
+
+def get_write_buffer():
+    """
+    Búfer de escritura compartido por todas las sesiones del proceso.
+
+    Returns:
+        ProgressWriteBuffer: Instancia configurada con PROGRESS_FLUSH_*
+    """
+    global _write_buffer
+    if _write_buffer is None:
+        with _write_buffer_lock:
+            if _write_buffer is None:
+                _write_buffer = ProgressWriteBuffer()
+                # Volcar lo pendiente al apagar para no perder preguntas completadas
+                atexit.register(_write_buffer.close)
+    return _write_buffer
+
+
+def flush_progress():
+    """Volcar de inmediato el progreso pendiente de todos los jugadores."""
+    if _write_buffer is not None:
+        _write_buffer.flush()
+
 def load_clues():
     """
     Carga las pistas desde el archivo YAML.
     
+    El resultado se comparte entre sesiones y solo se recarga si el archivo cambia.
+    
+    Returns:
+        Mapping: Datos de las pistas (de solo lectura)
+    """
+    return clue_catalog.load_clues()
+
+def load_catalog():
+    """
+    Carga el catálogo indexado de pistas (id -> pregunta, siguiente/anterior).
+    
+    Returns:
+        ClueCatalog: Catálogo compartido entre sesiones
+    """
+    return clue_catalog.load_catalog()
+
+def _initial_progress(catalog=None):
+    """Progreso inicial: ninguna pregunta completada y la primera del catálogo."""
+    if catalog is None:
+        catalog = load_catalog()
+    return {"completed_questions": [], "current_question": catalog.first_id, "clues_revealed": 0}
+
+_legacy_migrated = False
+_legacy_lock = threading.Lock()
+
+
+def _migrate_legacy_progress():
+    """
+    Pasar el antiguo progress.yaml al almacén (solo para el jugador por defecto).
+
+    Se hace una sola vez por proceso: después, el progreso vive en el almacén y
+    el YAML ya no se vuelve a leer.
+
     Returns:
-        dict: Datos de las pistas
+        dict: Progreso migrado o None si no había archivo
     """
-    with open("clues.yaml", 'r', encoding='utf-8') as file:
-        return yaml.safe_load(file)
+    global _legacy_migrated
+    with _legacy_lock:
+        if _legacy_migrated:
+            return None
+        _legacy_migrated = True
+        if not os.path.exists(LEGACY_PROGRESS_PATH):
+            return None
+        with open(LEGACY_PROGRESS_PATH, 'r', encoding='utf-8') as file:
+            progress_data = yaml.safe_load(file)
+        if progress_data:
+            get_progress_store().save(DEFAULT_PLAYER_ID, progress_data)
+        return progress_data
 
-def load_progress():
+def load_progress(player_id=DEFAULT_PLAYER_ID, catalog=None):
     """
-    Carga el progreso desde el archivo YAML.
+    Carga el progreso de un jugador desde el almacén.
+    
+    Args:
+        player_id (str): Identificador del jugador/sesión
+        catalog (ClueCatalog): Catálogo de la búsqueda (por defecto el de clues.yaml)
     
     Returns:
         dict: Datos del progreso
     """
-    try:
-        with open("progress.yaml", 'r', encoding='utf-8') as file:
-            return yaml.safe_load(file)
-    except FileNotFoundError:
-        # Si el archivo no existe, devolver valores predeterminados
-        return {"completed_questions": [], "current_question": 1, "clues_revealed": 0}
+    progress_data = get_write_buffer().get(player_id)
+    if progress_data is None:
+        progress_data = get_progress_store().load(player_id)
+    if progress_data is None and player_id == DEFAULT_PLAYER_ID:
+        progress_data = _migrate_legacy_progress()
+    if progress_data is None:
+        # Si no hay nada guardado, devolver valores predeterminados
+        return _initial_progress(catalog)
+    return progress_data
 
-def save_progress(progress_data):
+def save_progress(progress_data, player_id=DEFAULT_PLAYER_ID):
     """
-    Guarda el progreso en el archivo YAML.
+    Guarda el progreso de un jugador.
+    
+    La escritura se agrupa en el búfer y se vuelca en segundo plano como
+    máximo PROGRESS_FLUSH_INTERVAL segundos después.
     
     Args:
         progress_data (dict): Datos del progreso a guardar
+        player_id (str): Identificador del jugador/sesión
     """
-    with open("progress.yaml", 'w', encoding='utf-8') as file:
-        yaml.dump(progress_data, file)
+    get_write_buffer().put(player_id, progress_data)
 
-def reset_progress():
+def reset_progress(player_id=DEFAULT_PLAYER_ID, catalog=None):
     """
     Reinicia el progreso a valores iniciales.
     
+    Args:
+        player_id (str): Identificador del jugador/sesión
+        catalog (ClueCatalog): Catálogo de la búsqueda (por defecto el de clues.yaml)
+    
     Returns:
         dict: Datos del progreso reiniciado
     """
-    progress_data = {"completed_questions": [], "current_question": 1, "clues_revealed": 0}
-    save_progress(progress_data)
+    progress_data = _initial_progress(catalog)
+    # Un reinicio reemplaza el pendiente en lugar de combinarse con él
+    get_write_buffer().put(player_id, progress_data, merge=False)
     return progress_data
 
-def get_current_question(clues_data, progress_data):
+def get_current_question(catalog, progress_data):
     """
     Obtiene la pregunta actual basada en el progreso.
     
     Args:
-        clues_data (dict): Datos de las pistas
+        catalog (ClueCatalog): Catálogo indexado de pistas
         progress_data (dict): Datos del progreso
         
     Returns:
-        dict: Pregunta actual o None si no se encuentra
+        Mapping: Pregunta actual o None si no se encuentra
     """
-    current_id = progress_data["current_question"]
-    
-    # Simplemente buscar y retornar la pregunta actual
-    for question in clues_data["questions"]:
-        if question["id"] == current_id:
-            return question
-            
-    return None
+    return catalog.get(progress_data["current_question"])
 
-def advance_to_next_question(progress_data):
+def advance_to_next_question(progress_data, catalog=None, player_id=DEFAULT_PLAYER_ID):
     """
     Avanza a la siguiente pregunta no completada.
     
     Args:
         progress_data (dict): Datos del progreso actual
+        catalog (ClueCatalog): Catálogo de pistas (por defecto el de clues.yaml)
+        player_id (str): Identificador del jugador/sesión
         
     Returns:
-        int: ID de la siguiente pregunta
+        int: ID de la siguiente pregunta o None si era la última
     """
-    progress_data["current_question"] += 1
-    save_progress(progress_data)
-    return progress_data["current_question"]
\ No newline at end of file
+    if catalog is None:
+        catalog = load_catalog()
+    progress_data["current_question"] = catalog.next_id(progress_data["current_question"])
+    save_progress(progress_data, player_id)
+    return progress_data["current_question"]
@@ -0,0 +1,379 @@
+"""
+Módulo para precalcular las explicaciones del Genio.
+
+Cuando se consulta al Genio sin una pregunta concreta, el prompt solo depende
+del texto de la pregunta y de cuántas pistas están reveladas, así que hay apenas
+len(clues) + 1 prompts distintos por pregunta. Este módulo guarda un pequeño
+conjunto de variantes por (búsqueda, pregunta, índice de pista) y las sirve al
+instante, generando en vivo solo cuando todavía no hay ninguna.
+
+Cuando cambia el texto de una pregunta (o sus pistas), las variantes viejas se
+descartan al guardar la primera nueva. El archivo se escribe como máximo una
+vez cada GENIE_POOL_SAVE_DELAY segundos, fuera del lock del pool.
+
+Uso para precalentar el pool antes de abrir el juego:
+    python genie_pool.py [variantes] [búsqueda]
+"""
+import atexit
+import hashlib
+import json
+import logging
+import os
+import random
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from clue_catalog import DEFAULT_PERSONA
+from llm_agents import (
+    build_clue_prompt,
+    generate_clue_response,
+    genie_fallback_message,
+    genie_max_tokens,
+    stream_clue_response,
+)
+from llm_resilience import LLMUnavailableError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VARIANTS = int(os.getenv("GENIE_POOL_VARIANTS", "3"))
+# Archivo JSON donde persistir el pool; vacío para usar solo memoria
+DEFAULT_POOL_PATH = os.getenv("GENIE_POOL_PATH", "genie_pool.json")
+DEFAULT_WORKERS = int(os.getenv("GENIE_POOL_WORKERS", "4"))
+# Segundos que se agrupan los cambios antes de reescribir el archivo
+DEFAULT_SAVE_DELAY = float(os.getenv("GENIE_POOL_SAVE_DELAY", "2.0"))
+
+
+def shared_scope(usage_scope):
+    """
+    Ámbito de uso de una variante del pool: se comparte entre jugadores, así que
+    se registra por búsqueda y pregunta pero no cuenta para el presupuesto de la sesión.
+    """
+    return {key: value for key, value in (usage_scope or {}).items() if key != "session_id"}
+
+
+def pool_key(question, clue_index, persona=None, hunt_id=None):
+    """
+    Clave del pool para una pregunta y una cantidad de pistas reveladas.
+
+    Empieza por la búsqueda y la pregunta, e incluye una huella del texto, las
+    pistas y la persona para que editar clues.yaml invalide las variantes
+    anteriores y que dos búsquedas con la misma pregunta no compartan respuestas.
+
+    Args:
+        question (Mapping): Pregunta del catálogo
+        clue_index (int): Índice de la última pista revelada (-1 si ninguna)
+        persona (Mapping): Persona de la búsqueda (ver ClueCatalog.persona)
+        hunt_id (str): Id de la búsqueda (None para clues.yaml)
+
+    Returns:
+        str: Clave del pool ("búsqueda/pregunta:huella:pista")
+    """
+    persona = persona or DEFAULT_PERSONA
+    content = "\x1f".join([
+        str(question["question"]),
+        *[str(clue) for clue in question["clues"]],
+        *[f"{key}={persona[key]}" for key in sorted(persona)]
+    ])
+    fingerprint = hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+    return f"{hunt_id or ''}/{question['id']}:{fingerprint}:{clue_index}"
+
+
+def _split_key(key):
+    """Separar una clave en (búsqueda/pregunta, huella)."""
+    slot, fingerprint, _ = key.rsplit(":", 2)
+    return slot, fingerprint
+
+
+def _hunt_id(usage_scope):
+    """Búsqueda de una llamada (según su ámbito de uso)."""
+    return (usage_scope or {}).get("hunt_id")
+
+
+class GeniePool:
+    """Variantes de respuestas del Genio por (pregunta, índice de pista)."""
+
+    def __init__(self, variants=DEFAULT_VARIANTS, path=None, workers=DEFAULT_WORKERS, save_delay=DEFAULT_SAVE_DELAY):
+        """
+        Args:
+            variants (int): Variantes a mantener por clave
+            path (str): Archivo JSON de persistencia (None para solo memoria)
+            workers (int): Hilos para generar variantes en segundo plano
+            save_delay (float): Segundos que se agrupan los cambios antes de escribir el archivo
+        """
+        self.variants = variants
+        self.path = path
+        self.save_delay = save_delay
+        self._responses = {}
+        self._refilling = set()
+        self._lock = threading.Lock()
+        # Serializa las escrituras del archivo (que se hacen sin self._lock)
+        self._write_lock = threading.Lock()
+        self._dirty = False
+        self._save_timer = None
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="genie-pool")
+        if path and os.path.exists(path):
+            with self._lock:
+                # Las claves sin búsqueda son de un formato anterior y ya no se usan
+                self._responses = {key: value for key, value in self._load().items() if "/" in key}
+
+    def _load(self):
+        """Leer el pool persistido (se llama con el lock tomado); un archivo dañado se ignora."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                responses = json.load(file)
+        except (OSError, ValueError) as error:
+            logger.warning("%s no se pudo leer (%s); se empieza con el pool vacío", self.path, error)
+            return {}
+        if not isinstance(responses, dict):
+            logger.warning("%s no tiene el formato esperado; se empieza con el pool vacío", self.path)
+            return {}
+        return responses
+
+    def _schedule_save(self):
+        """Programar una escritura del archivo (se llama con el lock tomado)."""
+        self._dirty = True
+        if not self.path or self._save_timer is not None:
+            return
+        self._save_timer = threading.Timer(max(0.0, self.save_delay), self.flush)
+        self._save_timer.daemon = True
+        self._save_timer.start()
+
+    def flush(self):
+        """Persistir el pool de forma atómica si hubo cambios desde la última escritura."""
+        with self._lock:
+            self._save_timer = None
+            if not self.path or not self._dirty:
+                return
+            content = json.dumps(self._responses, ensure_ascii=False)
+            self._dirty = False
+        with self._write_lock:
+            tmp_path = f"{self.path}.tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as file:
+                    file.write(content)
+                os.replace(tmp_path, self.path)
+            except OSError:
+                logger.warning("No se pudo guardar el pool del Genio en %s", self.path, exc_info=True)
+                with self._lock:
+                    self._schedule_save()
+
+    def _discard_stale(self, key):
+        """
+        Descartar las variantes de la misma pregunta con otra huella (se llama
+        con el lock tomado, solo al crear una clave nueva).
+        """
+        slot, fingerprint = _split_key(key)
+        for other in [other for other in self._responses if other.startswith(f"{slot}:")]:
+            if _split_key(other) != (slot, fingerprint):
+                del self._responses[other]
+
+    def _add(self, key, response):
+        """Agregar una variante si todavía falta alguna."""
+        with self._lock:
+            if key not in self._responses:
+                self._discard_stale(key)
+            responses = self._responses.setdefault(key, [])
+            if len(responses) < self.variants and response not in responses:
+                responses.append(response)
+                self._schedule_save()
+
+    def retain(self, catalog, hunt_id=None):
+        """
+        Descartar las variantes de una búsqueda que ya no corresponden a su catálogo
+        (preguntas borradas o con otro texto).
+
+        Args:
+            catalog (ClueCatalog): Catálogo actual de la búsqueda
+            hunt_id (str): Id de la búsqueda (None para clues.yaml)
+
+        Returns:
+            int: Claves descartadas
+        """
+        valid = {
+            pool_key(catalog.get(question_id), clue_index, catalog.persona, hunt_id)
+            for question_id in catalog.ids
+            for clue_index in range(-1, len(catalog.get(question_id)["clues"]))
+        }
+        prefix = f"{hunt_id or ''}/"
+        with self._lock:
+            stale = [key for key in self._responses if key.startswith(prefix) and key not in valid]
+            for key in stale:
+                del self._responses[key]
+            if stale:
+                self._schedule_save()
+        return len(stale)
+
+    def _generate(self, client, deployment_name, question, clue_index, persona=None, usage_scope=None):
+        """Generar una variante en vivo y guardarla en el pool."""
+        prompt = build_clue_prompt(question["clues"], question["question"], clue_index, persona=persona)
+        response = generate_clue_response(
+            client, deployment_name, prompt, genie_max_tokens(clue_index), usage_scope
+        )
+        self._add(pool_key(question, clue_index, persona, _hunt_id(usage_scope)), response)
+        return response
+
+    def _refill(self, client, deployment_name, question, clue_index, key, persona=None, usage_scope=None):
+        """Completar las variantes que faltan de una clave (en segundo plano)."""
+        try:
+            # Intentos acotados por si el modelo repite exactamente la misma respuesta
+            for _ in range(self.variants * 2):
+                with self._lock:
+                    complete = len(self._responses.get(key, ())) >= self.variants
+                if complete:
+                    break
+                self._generate(client, deployment_name, question, clue_index, persona, usage_scope)
+        except Exception:
+            # Un error de red no debe afectar a los jugadores: se reintenta en el próximo uso
+            pass
+        finally:
+            with self._lock:
+                self._refilling.discard(key)
+
+    def _schedule_refill(self, client, deployment_name, question, clue_index, key, persona=None, usage_scope=None):
+        """Lanzar la generación en segundo plano si no hay una en curso para la clave."""
+        with self._lock:
+            if key in self._refilling or len(self._responses.get(key, ())) >= self.variants:
+                return
+            self._refilling.add(key)
+        self._executor.submit(
+            self._refill, client, deployment_name, question, clue_index, key, persona, shared_scope(usage_scope)
+        )
+
+    def lookup(self, client, deployment_name, question, clue_index, persona=None, usage_scope=None):
+        """
+        Buscar una variante precalculada, completando el pool en segundo plano.
+
+        Args:
+            client: Pasarela LLM (ver llm_gateway)
+            deployment_name: Nombre del modelo desplegado
+            question (Mapping): Pregunta del catálogo
+            clue_index (int): Índice de la última pista revelada (-1 si ninguna)
+            persona (Mapping): Persona de la búsqueda (ver ClueCatalog.persona)
+            usage_scope (Mapping): hunt_id y question_id para el registro de uso
+
+        Returns:
+            str: Respuesta del Genio o None si todavía no hay ninguna
+        """
+        key = pool_key(question, clue_index, persona, _hunt_id(usage_scope))
+        with self._lock:
+            responses = list(self._responses.get(key, ()))
+
+        if not responses:
+            return None
+        self._schedule_refill(client, deployment_name, question, clue_index, key, persona, usage_scope)
+        return random.choice(responses)
+
+    def stream_response(self, client, deployment_name, question, clue_index, persona=None, usage_scope=None):
+        """
+        Generar en vivo con streaming (ante un fallo del pool) y guardar el resultado.
+
+        Args:
+            client: Pasarela LLM (ver llm_gateway)
+            deployment_name: Nombre del modelo desplegado
+            question (Mapping): Pregunta del catálogo
+            clue_index (int): Índice de la última pista revelada (-1 si ninguna)
+            persona (Mapping): Persona de la búsqueda (ver ClueCatalog.persona)
+            usage_scope (Mapping): hunt_id, question_id y session_id para el registro de uso
+
+        Yields:
+            str: Fragmentos de la respuesta del Genio
+        """
+        prompt = build_clue_prompt(question["clues"], question["question"], clue_index, persona=persona)
+        parts = []
+        try:
+            stream = stream_clue_response(
+                client, deployment_name, prompt, fallback=False, max_tokens=genie_max_tokens(clue_index),
+                usage_scope=usage_scope
+            )
+            for piece in stream:
+                parts.append(piece)
+                yield piece
+        except LLMUnavailableError:
+            # La respuesta de respaldo (o una respuesta cortada) no se guarda en el pool
+            if not parts:
+                yield genie_fallback_message(persona)
+            return
+
+        key = pool_key(question, clue_index, persona, _hunt_id(usage_scope))
+        self._add(key, "".join(parts))
+        self._schedule_refill(client, deployment_name, question, clue_index, key, persona, usage_scope)
+
+    def warm_up(self, client, deployment_name, catalog, hunt_id=None):
+        """
+        Precalcular todas las variantes de un catálogo (y descartar las que ya no le corresponden).
+
+        Args:
+            client: Pasarela LLM (ver llm_gateway)
+            deployment_name: Nombre del modelo desplegado
+            catalog (ClueCatalog): Catálogo de preguntas
+            hunt_id (str): Id de la búsqueda (None para clues.yaml)
+
+        Returns:
+            int: Cantidad de variantes generadas
+        """
+        self.retain(catalog, hunt_id)
+        jobs = []
+        for question_id in catalog.ids:
+            question = catalog.get(question_id)
+            for clue_index in range(-1, len(question["clues"])):
+                key = pool_key(question, clue_index, catalog.persona, hunt_id)
+                with self._lock:
+                    missing = self.variants - len(self._responses.get(key, ()))
+                jobs.extend([(question, clue_index)] * max(0, missing))
+
+        futures = [
+            self._executor.submit(
+                self._generate, client, deployment_name, question, clue_index, catalog.persona,
+                {"hunt_id": hunt_id, "question_id": question["id"]}
+            )
+            for question, clue_index in jobs
+        ]
+        for future in futures:
+            future.result()
+        self.flush()
+        return len(futures)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_genie_pool():
+    """
+    Pool compartido por todas las sesiones del proceso.
+
+    Returns:
+        GeniePool: Instancia configurada con las variables GENIE_POOL_*
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = GeniePool(path=DEFAULT_POOL_PATH or None)
+                # Escribir los últimos cambios al apagar el proceso
+                atexit.register(_pool.flush)
+    return _pool
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    import clue_catalog
+    from llm_agents import initialize_client
+
+    load_dotenv()
+    pool = get_genie_pool()
+    if len(sys.argv) > 1:
+        pool.variants = int(sys.argv[1])
+    genie_deployment = os.getenv("AZURE_OPENAI_GENIE_DEPLOYMENT") or os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME")
+    warm_client = initialize_client(
+        os.getenv("AZURE_OPENAI_API_KEY"),
+        os.getenv("OPENAI_API_VERSION"),
+        os.getenv("AZURE_OPENAI_ENDPOINT"),
+        deployments=[genie_deployment]
+    )
+    warm_hunt_id = sys.argv[2] if len(sys.argv) > 2 else None
+    hunt_catalog = clue_catalog.load_hunt(warm_hunt_id)
+    generated = pool.warm_up(warm_client, genie_deployment, hunt_catalog, warm_hunt_id)
+    print(f"Pool del Genio listo: {generated} variantes generadas.")
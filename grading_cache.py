@@ -0,0 +1,247 @@
+"""
+Módulo para memorizar las evaluaciones del AnswerGrader.
+
+Los jugadores envían una y otra vez las mismas respuestas (correctas e
+incorrectas) a las mismas preguntas. Este caché guarda el veredicto y el mensaje
+del modelo por (pregunta, respuesta normalizada) en un LRU en memoria con TTL,
+opcionalmente respaldado por un archivo SQLite para sobrevivir reinicios.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import telemetry
+from answer_matcher import normalize
+from clue_catalog import DEFAULT_PERSONA
+
+DEFAULT_MAX_ENTRIES = int(os.getenv("GRADING_CACHE_SIZE", "4096"))
+DEFAULT_TTL_SECONDS = float(os.getenv("GRADING_CACHE_TTL", str(7 * 24 * 3600)))
+# Ruta del archivo SQLite; vacío para usar solo memoria
+DEFAULT_DB_PATH = os.getenv("GRADING_CACHE_PATH", "grading_cache.db")
+
+
+def question_fingerprint(question, persona=None):
+    """
+    Huella del contenido evaluable de una pregunta.
+
+    Si se edita la pregunta, la respuesta o los alias en clues.yaml, las
+    evaluaciones anteriores dejan de ser válidas automáticamente. Incluye la
+    persona porque el mensaje del evaluador la nombra: dos búsquedas con la
+    misma pregunta para personas distintas no comparten evaluaciones.
+
+    Args:
+        question (Mapping): Pregunta del catálogo
+        persona (Mapping): Persona de la búsqueda (ver ClueCatalog.persona)
+
+    Returns:
+        str: Hash corto del contenido
+    """
+    persona = persona or DEFAULT_PERSONA
+    content = "\x1f".join([
+        str(question["question"]),
+        str(question["answer"]),
+        *[str(alias) for alias in question.get("aliases") or ()],
+        *[f"{key}={persona[key]}" for key in sorted(persona)]
+    ])
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+
+
+def cache_key(question, user_answer, persona=None):
+    """
+    Clave de caché para una respuesta a una pregunta.
+
+    Args:
+        question (Mapping): Pregunta del catálogo
+        user_answer (str): Respuesta del usuario
+        persona (Mapping): Persona de la búsqueda (ver ClueCatalog.persona)
+
+    Returns:
+        str: Clave (id, huella de la pregunta y la persona, y respuesta normalizada)
+    """
+    return f"{question['id']}:{question_fingerprint(question, persona)}:{normalize(user_answer)}"
+
+
+class GradingCache:
+    """
+    LRU con TTL en memoria, con respaldo opcional en SQLite.
+
+    El lock solo protege el LRU en memoria: las lecturas y escrituras en SQLite
+    se hacen fuera de él, con una conexión por hilo, para que una búsqueda que
+    va a disco no frene a las demás.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL_SECONDS, db_path=None):
+        """
+        Args:
+            max_entries (int): Máximo de entradas en memoria
+            ttl (float): Segundos de validez de cada entrada
+            db_path (str): Archivo SQLite de respaldo (None para solo memoria)
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if db_path:
+            connection = self._connection()
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS grading_cache ("
+                " key TEXT PRIMARY KEY,"
+                " is_correct INTEGER NOT NULL,"
+                " feedback TEXT NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+            connection.commit()
+
+    def _connection(self):
+        """Conexión propia de cada hilo (SQLite no comparte conexiones entre hilos)."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=5)
+            self._local.connection = connection
+        return connection
+
+    def _load_from_disk(self, key, now):
+        """Buscar una entrada vigente en SQLite (se llama sin el lock)."""
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT is_correct, feedback, created_at FROM grading_cache WHERE key = ?",
+            (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if now - row[2] > self.ttl:
+            with connection:
+                connection.execute("DELETE FROM grading_cache WHERE key = ? AND created_at = ?", (key, row[2]))
+            return None
+        return bool(row[0]), row[1], row[2]
+
+    def _count(self, result):
+        """Contar una búsqueda (en el objeto y en la telemetría)."""
+        if result == "miss":
+            self.misses += 1
+        else:
+            self.hits += 1
+            if result == "disk_hit":
+                self.disk_hits += 1
+        telemetry.count("grading_cache_lookups_total", result=result)
+
+    def get(self, key):
+        """
+        Obtener una evaluación memorizada.
+
+        Args:
+            key (str): Clave (ver cache_key)
+
+        Returns:
+            tuple: (is_correct, feedback) o None si no está o expiró
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[2] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._count("hit")
+                return entry[0], entry[1]
+            if self.db_path is None:
+                self._count("miss")
+                return None
+
+        entry = self._load_from_disk(key, now)
+        with self._lock:
+            if entry is None:
+                self._count("miss")
+                return None
+            # Otro hilo pudo haber guardado una evaluación más nueva mientras tanto
+            current = self._entries.get(key)
+            if current is None or current[2] < entry[2]:
+                self._store_in_memory(key, entry)
+            self._count("disk_hit")
+            return entry[0], entry[1]
+
+    def _store_in_memory(self, key, entry):
+        """Guardar en el LRU desalojando la entrada más antigua si hace falta (con el lock tomado)."""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        telemetry.gauge("grading_cache_entries", len(self._entries))
+
+    def put(self, key, is_correct, feedback):
+        """
+        Memorizar una evaluación.
+
+        Args:
+            key (str): Clave (ver cache_key)
+            is_correct (bool): Veredicto
+            feedback (str): Mensaje mostrado al usuario
+        """
+        entry = (bool(is_correct), feedback, time.time())
+        with self._lock:
+            self._store_in_memory(key, entry)
+        if self.db_path is not None:
+            connection = self._connection()
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO grading_cache (key, is_correct, feedback, created_at)"
+                    " VALUES (?, ?, ?, ?)",
+                    (key, int(entry[0]), entry[1], entry[2])
+                )
+
+    def clear(self):
+        """Vaciar el caché (memoria y disco)."""
+        with self._lock:
+            self._entries.clear()
+            telemetry.gauge("grading_cache_entries", 0)
+        if self.db_path is not None:
+            connection = self._connection()
+            with connection:
+                connection.execute("DELETE FROM grading_cache")
+
+    def stats(self):
+        """
+        Contadores para ajustar el tamaño y el TTL del caché (también se
+        exportan por telemetría, ver telemetry.py).
+
+        Returns:
+            dict: hits, disk_hits, misses, hit_rate y entradas en memoria
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_grading_cache():
+    """
+    Caché compartido por todas las sesiones del proceso.
+
+    Returns:
+        GradingCache: Instancia configurada con las variables GRADING_CACHE_*
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = GradingCache(db_path=DEFAULT_DB_PATH or None)
+    return _cache
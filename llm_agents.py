@@ -1,62 +1,379 @@
 """
 Módulo para los agentes de IA y funciones relacionadas con LLM.
 """
+import json
+import os
+import random
+import re
+import threading
+
 import streamlit as st
-from openai import AzureOpenAI
+from answer_matcher import expected_answers, normalize, quick_grade
+from clue_catalog import DEFAULT_PERSONA
+from llm_gateway import get_gateway, supports_structured_output
+from llm_resilience import LLMRequestError, LLMUnavailableError
+from prompts import genie_messages, grader_messages
+from telemetry import llm_call
 from style import loading_animation_html
+from usage_ledger import record_usage
 
-def initialize_client(api_key, api_version, endpoint):
-    """Inicializar el cliente de OpenAI para Azure."""
-    return AzureOpenAI(
-        api_key=api_key,
-        api_version=api_version,
-        azure_endpoint=endpoint
-    )
+# Límites de tokens de salida de cada agente. El veredicto más un mensaje
+# amistoso entra holgado en GRADER_MAX_TOKENS; el Genio ajusta el suyo según
+# tenga que responder una consulta concreta o explicar las pistas reveladas.
+GRADER_MAX_TOKENS = int(os.getenv("GRADER_MAX_TOKENS", "80"))
+GENIE_QUERY_MAX_TOKENS = int(os.getenv("GENIE_QUERY_MAX_TOKENS", "250"))
+GENIE_MAX_TOKENS = int(os.getenv("GENIE_MAX_TOKENS", "500"))
+# Explicación sin pistas reveladas y tokens extra por cada pista a explicar
+GENIE_BASE_TOKENS = 200
+GENIE_TOKENS_PER_CLUE = 75
+# Respuesta corta del Genio cuando la sesión se acerca a su presupuesto de tokens
+GENIE_BRIEF_MAX_TOKENS = 150
+
+# Respuestas de respaldo cuando Azure OpenAI no está disponible
+FALLBACK_CORRECT_MESSAGE = "CORRECTO! ¡Eso es, {name}! Bien hecho. 🎉"
+FALLBACK_INCORRECT_MESSAGE = (
+    "INCORRECTO. El evaluador está tomando unos mates y no pudo revisar tu respuesta "
+    "con cuidado. Probá escribirla de otra forma o intentá de nuevo en un ratito. 🧉"
+)
+GENIE_FALLBACK_MESSAGES = (
+    "¡Uy, {name}! Se me trabó la lámpara y no puedo pensar con claridad ahora mismo. 🧞‍♂️ "
+    "Mientras tanto, fijate bien en las pistas encendidas: ahí hay más de lo que parece. "
+    "Probá consultarme de nuevo en un ratito. 😉",
+    "¡Perdón, {name}! El Genio está con la conexión mágica un poco floja. ✨ "
+    "Releé la pregunta con calma y prendé otro foco si hace falta. ¡Enseguida vuelvo! 💡",
+)
+# Respuesta del Genio cuando la sesión agotó su presupuesto de tokens
+GENIE_BUDGET_MESSAGE = (
+    "¡Ay, {name}! Hoy ya hablé tanto que me quedé sin voz. 🧞‍♂️🤐 "
+    "Las pistas encendidas siguen ahí y seguro que con ellas alcanza. ¡Vos podés! 💡"
+)
 
-def answer_grader(client, deployment_name, user_answer, correct_answer, question):
+def initialize_client(api_key, api_version, endpoint, backends=None, deployments=(), **options):
     """
-    Agente AnswerGrader para evaluar las respuestas.
+    Obtener la pasarela LLM compartida por el proceso para estas credenciales.
+    
+    Se crea una única pasarela (clientes AsyncAzureOpenAI con pool de conexiones
+    keep-alive, límites de concurrencia y cola acotada) por conjunto de
+    credenciales, de modo que los reruns y las sesiones la reutilizan.
+    
+    Args:
+        api_key: Clave de la API de Azure OpenAI
+        api_version: Versión de la API
+        endpoint: Endpoint de Azure OpenAI
+        backends: Lista opcional de endpoints/deployments con pesos entre los que
+            repartir el tráfico (si se indica, reemplaza al endpoint único)
+        deployments: Deployments que usarán los agentes (se valida que algún
+            backend atienda cada uno al crear la pasarela)
+        **options: Límites opcionales (ver llm_gateway.LLMGateway)
+        
+    Returns:
+        LLMGateway: Pasarela compartida
+        
+    Raises:
+        GatewayConfigurationError: Si algún deployment no tiene backend
+    """
+    if not backends:
+        backends = [{"endpoint": endpoint, "api_key": api_key, "api_version": api_version}]
+    return get_gateway(backends, deployments, **options)
+
+VERDICT_PREFIX = "CORRECTO"
+
+# "auto" (salida estructurada si la versión de la API la acepta), "structured" o "prefix"
+DEFAULT_GRADING_MODE = os.getenv("GRADING_MODE", "auto")
+GRADING_STRUCTURED = "structured"
+GRADING_PREFIX = "prefix"
+# Por debajo de esta confianza el veredicto no se memoriza y se pide una segunda opinión
+MIN_GRADING_CONFIDENCE = float(os.getenv("GRADING_MIN_CONFIDENCE", "0.6"))
+
+# Esquema de la evaluación estructurada: el veredicto va primero para poder
+# decidir con los primeros tokens, antes de que llegue el mensaje
+GRADING_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "evaluacion",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "verdict": {"type": "string", "enum": ["CORRECTO", "INCORRECTO"]},
+                "confidence": {"type": "number"},
+                "message": {"type": "string"},
+            },
+            "required": ["verdict", "confidence", "message"],
+            "additionalProperties": False,
+        },
+    },
+}
+VERDICT_FIELD_PATTERN = re.compile(r'"verdict"\s*:\s*"([A-Z])')
+# Solo cuenta cuando el número terminó (le sigue una coma o la llave de cierre)
+CONFIDENCE_FIELD_PATTERN = re.compile(r'"confidence"\s*:\s*(-?[0-9][0-9.eE+-]*)\s*[,}]')
+MESSAGE_FIELD_PATTERN = re.compile(r'"message"\s*:\s*"')
+# Comienzo del mensaje que se muestra, igual que en el formato de texto
+FEEDBACK_PREFIXES = {True: "CORRECTO! ", False: "INCORRECTO. "}
+
+# Deployments que rechazaron la salida estructurada (400): se evalúan con el formato de texto
+_structured_unsupported = set()
+_structured_lock = threading.Lock()
+
+class GradingFormatError(LLMUnavailableError):
+    """La evaluación del modelo no tiene el formato esperado."""
+
+class PartialGradingError(LLMUnavailableError):
+    """
+    El stream se cortó después de conocer el veredicto.
+    
+    El veredicto ya se publicó (on_verdict) y el mensaje parcial ya se mostró,
+    así que quien llama debe usarlos tal cual, sin memorizarlos.
+    """
+    
+    def __init__(self, is_correct, feedback):
+        super().__init__("Se cortó la evaluación después del veredicto")
+        self.is_correct = is_correct
+        self.feedback = feedback
+
+def grading_mode(api_version, mode=DEFAULT_GRADING_MODE):
+    """
+    Modo de evaluación a usar con una versión de la API.
+    
+    Args:
+        api_version: Versión de la API de Azure OpenAI
+        mode: "auto", "structured" o "prefix" (por defecto GRADING_MODE)
+        
+    Returns:
+        str: GRADING_STRUCTURED o GRADING_PREFIX
+    """
+    if mode == "auto":
+        return GRADING_STRUCTURED if supports_structured_output(api_version) else GRADING_PREFIX
+    if mode not in (GRADING_STRUCTURED, GRADING_PREFIX):
+        raise ValueError(f"GRADING_MODE desconocido: {mode}")
+    return mode
+
+def structured_grading_supported(deployment_name):
+    """Indicar si el deployment no rechazó antes la evaluación estructurada."""
+    with _structured_lock:
+        return deployment_name not in _structured_unsupported
+
+def disable_structured_grading(deployment_name):
+    """Evaluar con el formato de texto en adelante (el deployment no acepta json_schema)."""
+    with _structured_lock:
+        _structured_unsupported.add(deployment_name)
+
+def rejects_structured_output(error):
+    """
+    Indicar si un error del servicio es por la salida estructurada en sí.
+
+    Solo esos 400 desactivan json_schema para el deployment: otros 400 (un
+    filtro de contenido disparado por la respuesta del jugador, por ejemplo)
+    fallan solo ese pedido.
+
+    Args:
+        error (Exception): Error lanzado por la pasarela
+
+    Returns:
+        bool: True si el servicio rechazó response_format / json_schema
+    """
+    if not isinstance(error, LLMRequestError) or error.status_code != 400:
+        return False
+    if error.code == "content_filter":
+        return False
+    if error.param:
+        return "response_format" in error.param or "json_schema" in error.param
+    message = str(error)
+    return "response_format" in message or "json_schema" in message
+
+def fallback_grade(user_answer, question, persona=None):
+    """
+    Evaluación de respaldo (sin LLM) cuando el modelo no está disponible.
+    
+    Compara la respuesta normalizada contra `answer` y `aliases` de clues.yaml.
     
     Args:
-        client: Cliente de AzureOpenAI
-        deployment_name: Nombre del modelo desplegado
         user_answer: Respuesta del usuario
-        correct_answer: Respuesta correcta
-        question: Pregunta original
+        question: Pregunta del catálogo
+        persona: Persona de la búsqueda (ver ClueCatalog.persona)
+        
+    Returns:
+        tuple: (is_correct, feedback)
+    """
+    persona = persona or DEFAULT_PERSONA
+    is_correct = (
+        normalize(user_answer) in expected_answers(question)
+        or quick_grade(user_answer, question) is True
+    )
+    if is_correct:
+        return True, FALLBACK_CORRECT_MESSAGE.format(name=persona["name"])
+    return False, FALLBACK_INCORRECT_MESSAGE
+
+def genie_fallback_message(persona=None):
+    """Respuesta enlatada del Genio cuando el modelo no está disponible."""
+    persona = persona or DEFAULT_PERSONA
+    return random.choice(GENIE_FALLBACK_MESSAGES).format(name=persona["name"])
+
+def genie_budget_message(persona=None):
+    """Respuesta enlatada del Genio cuando la sesión agotó su presupuesto de tokens."""
+    persona = persona or DEFAULT_PERSONA
+    return GENIE_BUDGET_MESSAGE.format(name=persona["name"])
+
+def parse_verdict(text):
+    """
+    Determinar el veredicto a partir del comienzo (posiblemente parcial) de la respuesta.
+    
+    Equivale a `text.strip().startswith("CORRECTO")`, pero decide en cuanto el
+    prefijo deja de ser ambiguo (p. ej. con la primera "I" de "INCORRECTO").
+    
+    Args:
+        text: Texto recibido hasta el momento
+        
+    Returns:
+        bool: True/False si ya se conoce el veredicto, None si todavía es ambiguo
+    """
+    text = text.lstrip()
+    if len(text) >= len(VERDICT_PREFIX):
+        return text.startswith(VERDICT_PREFIX)
+    if VERDICT_PREFIX.startswith(text):
+        return None
+    return False
+
+def parse_structured_verdict(text):
+    """
+    Veredicto de una evaluación estructurada, posiblemente parcial.
+    
+    Decide con la primera letra del campo `verdict` ("C" o "I"), sin esperar
+    al resto del JSON.
+    
+    Args:
+        text: JSON recibido hasta el momento
         
     Returns:
-        tuple: (is_correct, full_result)
+        bool: True/False si ya se conoce el veredicto, None si todavía no llegó
+    """
+    match = VERDICT_FIELD_PATTERN.search(text)
+    if match is None:
+        return None
+    return match.group(1) == VERDICT_PREFIX[0]
+
+def parse_confidence(text):
+    """
+    Confianza de una evaluación estructurada, posiblemente parcial.
+    
+    Args:
+        text: JSON recibido hasta el momento
+        
+    Returns:
+        float: Confianza entre 0 y 1, o None si todavía no llegó completa
+    """
+    match = CONFIDENCE_FIELD_PATTERN.search(text)
+    if match is None:
+        return None
+    try:
+        return min(1.0, max(0.0, float(match.group(1))))
+    except ValueError:
+        return None
+
+def partial_message(text):
     """
-    # Preparar el prompt
-    prompt = f"""
-    Sistema: Sos un evaluador de respuestas para un juego de acertijos para una señora argentina de 70 años llamada Claude. 
-    Tu trabajo es determinar si la respuesta que dio es correcta o está muy cerca de la respuesta correcta.
-    Sé muy generoso en tu evaluación, aceptando respuestas que capturen la esencia correcta.
+    Texto del campo `message` de una evaluación estructurada, posiblemente parcial.
     
-    La pregunta era: "{question}"
-    La respuesta correcta es: "{correct_answer}"
-    La respuesta del usuario es: "{user_answer}"
+    Args:
+        text: JSON recibido hasta el momento
+        
+    Returns:
+        str: Mensaje decodificado hasta donde llegó ("" si todavía no empezó)
+    """
+    match = MESSAGE_FIELD_PATTERN.search(text)
+    if match is None:
+        return ""
+    raw = text[match.end():]
+    escaped = False
+    for index, char in enumerate(raw):
+        if escaped:
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == '"':
+            raw = raw[:index]
+            break
+    try:
+        return json.loads(f'"{raw}"', strict=False)
+    except ValueError:
+        # Escape incompleto al final (p. ej. un "\u00e" a medio llegar)
+        cut = raw.rfind("\\")
+        try:
+            return json.loads(f'"{raw[:cut]}"', strict=False) if cut >= 0 else ""
+        except ValueError:
+            return ""
+
+def parse_grading(text):
+    """
+    Veredicto, confianza y mensaje de una evaluación estructurada.
     
-    Responde SOLAMENTE con uno de estos dos formatos exactos:
-    1. "CORRECTO! [tu mensaje amistoso aquí]" si la respuesta es correcta o muy cercana
-    2. "INCORRECTO. [tu consejo aquí]" si la respuesta es incorrecta
+    Tolera un JSON cortado (p. ej. por max_tokens o un corte de red) leyendo los
+    campos que llegaron.
     
-    Si es CORRECTO, felicitala con calidez en un tono argentino, como si fueras su amigo/a.
-    Si es INCORRECTO, dale un pequeño consejo para ayudarla, sin revelar la respuesta.
+    Args:
+        text: JSON devuelto por el modelo
+        
+    Returns:
+        tuple: (is_correct, confidence, message); is_correct es None si no hay veredicto
+    """
+    try:
+        data = json.loads(text)
+        return (
+            data["verdict"] == VERDICT_PREFIX,
+            min(1.0, max(0.0, float(data["confidence"]))),
+            str(data["message"]),
+        )
+    except (ValueError, TypeError, KeyError):
+        return parse_structured_verdict(text), parse_confidence(text), partial_message(text)
+
+def grading_feedback(is_correct, message):
+    """Mensaje para mostrar, con el mismo comienzo que el formato de texto."""
+    return FEEDBACK_PREFIXES[is_correct] + message.strip()
+
+def answer_grader(client, deployment_name, user_answer, correct_answer, question, on_verdict=None, persona=None,
+                  usage_scope=None, structured=False, min_confidence=None):
+    """
+    Agente AnswerGrader para evaluar las respuestas.
     
-    NO menciones la palabra "CORRECTO" en una respuesta INCORRECTA, ni siquiera como parte de otra palabra.
-    NO menciones la palabra "INCORRECTO" en una respuesta CORRECTA, ni siquiera como parte de otra palabra.
+    Args:
+        client: Pasarela LLM (ver llm_gateway)
+        deployment_name: Nombre del modelo desplegado
+        user_answer: Respuesta del usuario
+        correct_answer: Respuesta correcta
+        question: Pregunta original
+        on_verdict: Función opcional que recibe el veredicto (bool) en cuanto se
+            conoce, mientras el resto del mensaje sigue llegando
+        persona: Persona de la búsqueda (ver ClueCatalog.persona)
+        usage_scope: hunt_id, question_id y session_id para el registro de uso
+        structured: Pedir la evaluación como JSON {verdict, confidence, message};
+            si el deployment lo rechaza con un 400, se pasa al formato de texto
+        min_confidence: Con `structured`, si la confianza queda por debajo se
+            corta el stream sin mostrar nada ni llamar a `on_verdict`, y se
+            devuelve un feedback vacío para que quien llama decida
+        
+    Returns:
+        tuple: (is_correct, feedback, confidence); confidence es None en el
+            formato de texto
+        
+    Raises:
+        PartialGradingError: Si el stream se cortó después de conocer el
+            veredicto (trae el veredicto y el mensaje parcial)
+        LLMUnavailableError: Si el modelo no está disponible antes de conocer el
+            veredicto (ver fallback_grade)
     """
+    structured = structured and structured_grading_supported(deployment_name)
+    # Prefijo de sistema fijo (cacheable) y datos de la respuesta al final
+    messages = grader_messages(question, correct_answer, user_answer, persona, structured)
+    params = {"response_format": GRADING_RESPONSE_FORMAT} if structured else {}
 
-    # Llamada al modelo con streaming
-    response = client.chat.completions.create(
-        model=deployment_name,
-        messages=[
-            {"role": "system", "content": prompt}
-        ],
+    # Llamada al modelo con streaming (la petición se hace al consumir el stream)
+    call = llm_call("grader", messages)
+    response = client.stream(
+        deployment_name,
+        messages,
         temperature=0.7,
-        max_tokens=150,
-        stream=True
+        max_tokens=GRADER_MAX_TOKENS,
+        **params
     )
     
     # Mostrar animación de carga
@@ -66,96 +383,254 @@ def answer_grader(client, deployment_name, user_answer, correct_answer, question
     # Procesar respuesta streaming
     result = []
     final_container = st.empty()  # Contenedor para el resultado final
+    is_correct = None
+    confidence = None
+    usage = None
+    interrupted = False
     
-    for chunk in response:
-        if chunk.choices:
-            content = chunk.choices[0].delta.content
-            if content:
-                result.append(content)
-                # Actualizar el contenedor con el texto actual
-                final_container.markdown("".join(result))
+    try:
+        for chunk in response:
+            # El último chunk trae el uso de tokens (sin choices)
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            if chunk.choices:
+                content = chunk.choices[0].delta.content
+                if content:
+                    call.first_token()
+                    result.append(content)
+                    text = "".join(result)
+                    
+                    if not structured:
+                        # Actualizar el contenedor con el texto actual
+                        final_container.markdown(text)
+                        
+                        # Resolver el veredicto apenas el prefijo deja de ser ambiguo
+                        if is_correct is None:
+                            is_correct = parse_verdict(text)
+                            if is_correct is not None and on_verdict is not None:
+                                on_verdict(is_correct)
+                        continue
+                    
+                    # Salida estructurada: el veredicto (y la confianza) llegan primero
+                    if is_correct is None:
+                        verdict = parse_structured_verdict(text)
+                        confidence = parse_confidence(text)
+                        if verdict is None or (min_confidence is not None and confidence is None):
+                            continue
+                        if min_confidence is not None and confidence < min_confidence:
+                            # Veredicto dudoso: no mostrar nada y cortar el stream
+                            response.close()
+                            result_placeholder.empty()
+                            call.finish(text)
+                            record_usage("grader", deployment_name, messages, text, usage_scope=usage_scope)
+                            return verdict, "", confidence
+                        is_correct = verdict
+                        if on_verdict is not None:
+                            on_verdict(is_correct)
+                    final_container.markdown(grading_feedback(is_correct, partial_message(text)))
+    except LLMUnavailableError as error:
+        call.fail()
+        if structured and not result and rejects_structured_output(error):
+            # El modelo o la versión de la API no aceptan json_schema: pasar al formato de texto
+            result_placeholder.empty()
+            disable_structured_grading(deployment_name)
+            return answer_grader(
+                client, deployment_name, user_answer, correct_answer, question, on_verdict, persona, usage_scope
+            )
+        # Si el veredicto ya se conocía, alcanza con el mensaje parcial
+        if is_correct is None:
+            result_placeholder.empty()
+            record_usage("grader", deployment_name, messages, "".join(result), usage_scope=usage_scope)
+            raise
+        interrupted = True
     
     # Limpiar el placeholder de carga
     result_placeholder.empty()
     
-    # Determinar si la respuesta es correcta
     full_result = "".join(result).strip()
+    call.finish(full_result, usage)
+    record_usage("grader", deployment_name, messages, full_result, usage, usage_scope)
     
-    # Verificar si la respuesta comienza con "CORRECTO" (al inicio de la respuesta)
-    is_correct = full_result.startswith("CORRECTO")
+    if structured:
+        verdict, confidence, message = parse_grading(full_result)
+        if is_correct is None:
+            if verdict is None:
+                final_container.empty()
+                raise GradingFormatError("La evaluación del modelo no trae un veredicto")
+            is_correct = verdict
+            if on_verdict is not None:
+                on_verdict(is_correct)
+        feedback = grading_feedback(is_correct, message)
+        final_container.markdown(feedback)
+        if interrupted:
+            raise PartialGradingError(is_correct, feedback)
+        return is_correct, feedback, confidence
     
-    return is_correct, full_result
+    # Respuesta vacía o truncada dentro del prefijo: verificar con el texto completo
+    if is_correct is None:
+        is_correct = full_result.startswith(VERDICT_PREFIX)
+        if on_verdict is not None:
+            on_verdict(is_correct)
+    
+    if interrupted:
+        raise PartialGradingError(is_correct, full_result)
+    return is_correct, full_result, None
 
-def clue_assistant(client, deployment_name, clues, question_text, clue_index=None, user_query=None):
+def genie_max_tokens(clue_index=-1, user_query=None, brief=False):
     """
-    Agente ClueAssistant para dar pistas y ayuda.
+    Límite de tokens de una respuesta del Genio.
+    
+    Args:
+        clue_index: Índice de la última pista revelada (-1 o None si ninguna)
+        user_query: Consulta específica del usuario (opcional)
+        brief: Respuesta corta (presupuesto de tokens casi agotado)
+        
+    Returns:
+        int: max_tokens para la llamada
+    """
+    if brief:
+        return GENIE_BRIEF_MAX_TOKENS
+    if user_query and user_query.strip():
+        return GENIE_QUERY_MAX_TOKENS
+    revealed = 0 if clue_index is None else clue_index + 1
+    return min(GENIE_MAX_TOKENS, GENIE_BASE_TOKENS + GENIE_TOKENS_PER_CLUE * revealed)
+
+def build_clue_prompt(clues, question_text, clue_index=None, user_query=None, persona=None, brief=False):
+    """
+    Construir los mensajes del ClueAssistant (ver prompts.genie_messages).
     
     Args:
-        client: Cliente de AzureOpenAI
-        deployment_name: Nombre del modelo desplegado
         clues: Lista de pistas disponibles
         question_text: Texto de la pregunta actual
         clue_index: Índice de la última pista revelada
         user_query: Consulta específica del usuario (opcional)
+        persona: Persona de la búsqueda (ver ClueCatalog.persona)
+        brief: Pedir una respuesta corta (presupuesto de tokens casi agotado)
         
     Returns:
-        str: Respuesta del asistente
+        list: Mensajes de chat (prefijo de sistema fijo y datos de la pregunta al final)
     """
-    # Texto de pistas disponibles
-    clues_text = "\n".join([f"Pista {i+1}: {clue}" for i, clue in enumerate(clues[:clue_index+1])]) if clue_index is not None else ""
-    
-    # Base del prompt
-    prompt = f"""
-    Sistema: Sos un asistente amigable para un juego de acertijos para una señora argentina de 70 años llamada Claude.
-    Tu nombre es "El Genio" y tu labor es ayudarla a descubrir las respuestas a través de pistas.
-    Habla con calidez y paciencia, usando modismos argentinos ocasionalmente.
-    Adaptá tu lenguaje para que sea fácil de entender para una persona mayor.
-    Las preguntas y las pistas estan escritas por sus hijos Jean-François Y Charlotte, por lo cual al hablarle a Claude debes tomar eso en cuenta que formlar correctamente las pistas.
-    Tu personalidad es una persona con un gran sentido del humor y sarcasmo.
-
-    Ademas tienes un readme de que hace la aplicacion y como usarla basicamente es una app de preguntas y respuestas
-    donde puedes preguntarle al genio por pistas y respuestas a las preguntas que te haga.
-    En la UI hay focos con pistas que se pueden activar para ayudar a responder. 
+    return genie_messages(clues, question_text, clue_index, user_query, persona, brief)
 
-    La pregunta actual es: "{question_text}"
+def generate_clue_response(client, deployment_name, prompt, max_tokens=GENIE_MAX_TOKENS, usage_scope=None):
+    """
+    Llamar al modelo con un prompt del ClueAssistant (sin elementos de UI).
+    
+    Puede usarse desde hilos en segundo plano (p. ej. para precalcular respuestas).
+    
+    Args:
+        client: Pasarela LLM (ver llm_gateway)
+        deployment_name: Nombre del modelo desplegado
+        prompt: Mensajes construidos con build_clue_prompt
+        max_tokens: Límite de tokens de la respuesta
+        usage_scope: hunt_id, question_id y session_id para el registro de uso
+        
+    Returns:
+        str: Respuesta del asistente
+        
+    Raises:
+        LLMUnavailableError: Si el modelo no está disponible
+    """
+    call = llm_call("genie", prompt)
+    try:
+        response = client.complete(
+            deployment_name,
+            prompt,
+            temperature=0.9,
+            max_tokens=max_tokens
+        )
+    except LLMUnavailableError:
+        call.fail()
+        raise
+    content = response.choices[0].message.content
+    call.finish(content or "", response.usage)
+    record_usage("genie", deployment_name, prompt, content, response.usage, usage_scope)
+    return content
 
+def stream_clue_response(client, deployment_name, prompt, fallback=True, persona=None, max_tokens=GENIE_MAX_TOKENS,
+                         usage_scope=None):
+    """
+    Llamar al modelo con streaming y devolver el texto a medida que llega.
+    
+    Args:
+        client: Pasarela LLM (ver llm_gateway)
+        deployment_name: Nombre del modelo desplegado
+        prompt: Mensajes construidos con build_clue_prompt
+        fallback: Si es True, ante un modelo no disponible se devuelve una
+            respuesta enlatada en lugar de lanzar LLMUnavailableError
+        persona: Persona de la búsqueda (para la respuesta enlatada)
+        max_tokens: Límite de tokens de la respuesta
+        usage_scope: hunt_id, question_id y session_id para el registro de uso
+        
+    Yields:
+        str: Fragmentos de la respuesta del asistente
+    """
+    call = llm_call("genie", prompt)
+    response = client.stream(
+        deployment_name,
+        prompt,
+        temperature=0.9,
+        max_tokens=max_tokens
+    )
+    parts = []
+    usage = None
+    try:
+        for chunk in response:
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            if chunk.choices:
+                content = chunk.choices[0].delta.content
+                if content:
+                    call.first_token()
+                    parts.append(content)
+                    yield content
+        call.finish("".join(parts), usage)
+        record_usage("genie", deployment_name, prompt, "".join(parts), usage, usage_scope)
+    except LLMUnavailableError:
+        call.fail()
+        if parts:
+            record_usage("genie", deployment_name, prompt, "".join(parts), usage_scope=usage_scope)
+        if not fallback:
+            raise
+        # Si la respuesta ya había empezado, se deja como está
+        if not parts:
+            yield genie_fallback_message(persona)
 
+def clue_assistant(client, deployment_name, clues, question_text, clue_index=None, user_query=None, stream=False,
+                   persona=None, brief=False, usage_scope=None):
+    """
+    Agente ClueAssistant para dar pistas y ayuda.
     
-    Las pistas disponibles son:
-    {clues_text}
+    Args:
+        client: Pasarela LLM (ver llm_gateway)
+        deployment_name: Nombre del modelo desplegado
+        clues: Lista de pistas disponibles
+        question_text: Texto de la pregunta actual
+        clue_index: Índice de la última pista revelada
+        user_query: Consulta específica del usuario (opcional)
+        stream: Si es True, devuelve un generador con los fragmentos de texto
+        persona: Persona de la búsqueda (ver ClueCatalog.persona)
+        brief: Respuesta corta (menos tokens) porque la sesión se acerca a su presupuesto
+        usage_scope: hunt_id, question_id y session_id para el registro de uso
+        
+    Returns:
+        str: Respuesta del asistente (o generador de fragmentos si stream=True)
     """
+    prompt = build_clue_prompt(clues, question_text, clue_index, user_query, persona, brief)
+    max_tokens = genie_max_tokens(clue_index, user_query, brief)
     
-    # Adaptar el prompt según si hay una consulta específica
-    if user_query and user_query.strip():
-        prompt += f"""
-        Claude te ha preguntado: "{user_query}"
-        
-        Responde directamente a su pregunta, dándole ayuda relacionada con el acertijo sin revelarle
-        la respuesta directamente. Sé amable y paciente, explicando las cosas de manera clara.
-        Si su pregunta no está relacionada con el acertijo actual, puedes responder brevemente
-        pero recuérdale amablemente que tu función es ayudarla a resolver el acertijo actual.
-        """
-    else:
-        prompt += """
-        Proporcioná una explicación amable de las pistas disponibles, dándole un poco más de contexto
-        sin revelar directamente la respuesta. Animate a contar alguna anécdota relacionada
-        para hacer la experiencia más personal y entretenida. Ten cuidado de nunca nombrar directamente a la respuesta
-        Puedes hacer un chiste al final con sarcasmo y emojis.
-        """
+    if stream:
+        # La petición se hace recién al consumir el generador (dentro del diálogo)
+        return stream_clue_response(
+            client, deployment_name, prompt, persona=persona, max_tokens=max_tokens, usage_scope=usage_scope
+        )
 
     # Mostrar un spinner durante la carga (sin streaming visible)
     with st.spinner("El Genio está pensando..."):
         # Llamada al modelo SIN streaming visible
-        response = client.chat.completions.create(
-            model=deployment_name,
-            messages=[
-                {"role": "system", "content": prompt}
-            ],
-            temperature=0.9,
-            max_tokens=500
-        )
-        
-        # Obtener la respuesta completa
-        result = response.choices[0].message.content
+        try:
+            result = generate_clue_response(client, deployment_name, prompt, max_tokens, usage_scope)
+        except LLMUnavailableError:
+            result = genie_fallback_message(persona)
     
-    return result
\ No newline at end of file
+    return result
@@ -0,0 +1,476 @@
+"""
+Módulo con la pasarela (gateway) compartida para las llamadas a Azure OpenAI.
+
+Todas las llamadas del AnswerGrader y del ClueAssistant pasan por aquí. La
+pasarela usa un cliente AsyncAzureOpenAI que corre en un event loop dedicado
+(un único hilo por proceso), de modo que los hilos de Streamlit solo esperan el
+resultado en lugar de ocupar una conexión cada uno. Además:
+
+- Agrupa (coalesce) peticiones idénticas en curso: si dos jugadores disparan el
+  mismo prompt a la vez, se hace una sola llamada al modelo.
+- Reparte las peticiones entre varios endpoints/deployments (con pesos) según
+  la menor cantidad de peticiones en curso o la latencia observada, y deja de
+  usar temporalmente los que fallan (cada uno tiene su propio circuito).
+- Limita la concurrencia por deployment para no superar los límites de tasa.
+- Acota la cola de peticiones pendientes y rechaza el exceso con
+  GatewayOverloadedError en lugar de acumular esperas sin fin.
+- Reintenta los errores transitorios y corta el tráfico con un circuito cuando
+  el servicio falla de forma sostenida (ver llm_resilience).
+"""
+import asyncio
+import concurrent.futures
+import json
+import os
+import queue
+import threading
+import time
+
+import httpx
+from openai import AsyncAzureOpenAI
+
+from llm_resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    LLMUnavailableError,
+    RetryPolicy,
+    call_with_retries,
+    is_retryable,
+)
+
+# Límites del pool HTTP compartido (configurables por variables de entorno)
+DEFAULT_MAX_CONNECTIONS = int(os.getenv("AZURE_OPENAI_MAX_CONNECTIONS", "20"))
+DEFAULT_MAX_KEEPALIVE = int(os.getenv("AZURE_OPENAI_MAX_KEEPALIVE", "10"))
+DEFAULT_KEEPALIVE_EXPIRY = float(os.getenv("AZURE_OPENAI_KEEPALIVE_EXPIRY", "60"))
+DEFAULT_TIMEOUT = float(os.getenv("AZURE_OPENAI_TIMEOUT", "30"))
+DEFAULT_CONNECT_TIMEOUT = float(os.getenv("AZURE_OPENAI_CONNECT_TIMEOUT", "5"))
+
+# Concurrencia por deployment y tamaño máximo de la cola de espera
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+DEFAULT_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "64"))
+
+# Estrategia de reparto entre backends: "least_outstanding" o "latency"
+DEFAULT_ROUTING = os.getenv("LLM_ROUTING", "least_outstanding")
+LATENCY_SMOOTHING = 0.2
+
+# Primera versión de la API de Azure OpenAI que acepta stream_options
+# (el uso de tokens llega en un último chunk sin choices)
+STREAM_USAGE_API_VERSION = "2024-09-01"
+# Primera versión que acepta response_format con json_schema (salida estructurada)
+STRUCTURED_OUTPUT_API_VERSION = "2024-08-01"
+
+_STREAM_END = object()
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+class GatewayOverloadedError(LLMUnavailableError):
+    """La cola de peticiones al modelo está llena."""
+
+
+class GatewayConfigurationError(ValueError):
+    """Ningún backend configurado atiende el deployment pedido."""
+
+
+class GatewayTimeoutError(LLMUnavailableError):
+    """El modelo no respondió (o dejó de enviar datos) a tiempo."""
+
+
+def get_event_loop():
+    """
+    Event loop dedicado a las llamadas al modelo (se crea una vez por proceso).
+
+    Returns:
+        asyncio.AbstractEventLoop: Loop corriendo en un hilo daemon
+    """
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="llm-gateway", daemon=True)
+                thread.start()
+                _loop = loop
+    return _loop
+
+
+def _coalesce_key(deployment_name, messages, params):
+    """Clave que identifica peticiones idénticas."""
+    return json.dumps([deployment_name, messages, params], sort_keys=True, ensure_ascii=False)
+
+
+def supports_stream_usage(api_version):
+    """Indicar si la versión de la API informa el uso de tokens al hacer streaming."""
+    return bool(api_version) and api_version[:10] >= STREAM_USAGE_API_VERSION
+
+
+def supports_structured_output(api_version):
+    """Indicar si la versión de la API acepta salidas con esquema JSON."""
+    return bool(api_version) and api_version[:10] >= STRUCTURED_OUTPUT_API_VERSION
+
+
+class Backend:
+    """Un endpoint de Azure OpenAI (y opcionalmente un deployment) con su propio circuito."""
+
+    def __init__(self, endpoint, api_key, api_version, deployment=None, weight=1.0,
+                 max_connections=DEFAULT_MAX_CONNECTIONS, max_keepalive=DEFAULT_MAX_KEEPALIVE,
+                 timeout=DEFAULT_TIMEOUT, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        """
+        Args:
+            endpoint: Endpoint de Azure OpenAI
+            api_key: Clave de la API
+            api_version: Versión de la API
+            deployment: Deployment que sirve este backend (None = el que pida la petición)
+            weight: Peso relativo en el reparto de tráfico
+            max_connections: Máximo de conexiones simultáneas del pool HTTP
+            max_keepalive: Máximo de conexiones ociosas que se mantienen abiertas
+            timeout: Timeout total (en segundos) de cada petición
+            max_concurrency: Peticiones simultáneas hacia este deployment
+        """
+        self.endpoint = endpoint
+        self.deployment = deployment
+        self.stream_usage = supports_stream_usage(api_version)
+        self.weight = float(weight) if weight else 1.0
+        self.breaker = CircuitBreaker()
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        # Solo se modifican desde el hilo del event loop
+        self.outstanding = 0
+        self.latency = None
+        self.client = AsyncAzureOpenAI(
+            api_key=api_key,
+            api_version=api_version,
+            azure_endpoint=endpoint,
+            # Los reintentos los maneja llm_resilience (con circuito y presupuesto de tiempo)
+            max_retries=0,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_keepalive,
+                    keepalive_expiry=DEFAULT_KEEPALIVE_EXPIRY
+                ),
+                timeout=httpx.Timeout(timeout, connect=DEFAULT_CONNECT_TIMEOUT)
+            )
+        )
+
+    def serves(self, deployment_name):
+        """Indicar si el backend atiende peticiones para ese deployment."""
+        return self.deployment is None or self.deployment == deployment_name
+
+    def model_for(self, deployment_name):
+        """Deployment a usar en la petición."""
+        return self.deployment or deployment_name
+
+    async def acquire(self):
+        """Ocupar un lugar de concurrencia del backend."""
+        self.outstanding += 1
+        try:
+            await self.semaphore.acquire()
+        except BaseException:
+            self.outstanding -= 1
+            raise
+
+    def release(self):
+        """Liberar el lugar de concurrencia del backend."""
+        self.semaphore.release()
+        self.outstanding -= 1
+
+    def observe_latency(self, seconds):
+        """Actualizar la latencia media (exponencial) observada."""
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += LATENCY_SMOOTHING * (seconds - self.latency)
+
+    def stats(self):
+        """Estado del backend para monitoreo."""
+        return {
+            "endpoint": self.endpoint,
+            "deployment": self.deployment,
+            "weight": self.weight,
+            "outstanding": self.outstanding,
+            "latency": self.latency,
+            "circuit": self.breaker.state,
+        }
+
+
+class LLMGateway:
+    """Pasarela asíncrona hacia uno o varios endpoints de Azure OpenAI."""
+
+    def __init__(self, backends, deployments=(), timeout=DEFAULT_TIMEOUT, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 max_queue=DEFAULT_MAX_QUEUE, routing=DEFAULT_ROUTING, retry_policy=None, **pool_options):
+        """
+        Args:
+            backends: Lista de dicts con endpoint, api_key, api_version y
+                opcionalmente deployment y weight
+            deployments: Deployments que se van a pedir (se valida que algún
+                backend atienda cada uno)
+            timeout: Timeout total (en segundos) de cada petición
+            max_concurrency: Peticiones simultáneas por backend
+            max_queue: Peticiones que pueden esperar turno antes de rechazar nuevas
+            routing: "least_outstanding" o "latency"
+            retry_policy (RetryPolicy): Política de reintentos (por defecto la de entorno)
+            **pool_options: max_connections / max_keepalive del pool HTTP
+
+        Raises:
+            GatewayConfigurationError: Si algún deployment no tiene backend
+        """
+        if not backends:
+            raise ValueError("Se necesita al menos un endpoint de Azure OpenAI")
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.routing = routing
+        self.retry_policy = retry_policy or RetryPolicy()
+        self._loop = get_event_loop()
+        self.backends = [
+            Backend(timeout=timeout, max_concurrency=max_concurrency, **pool_options, **backend)
+            for backend in backends
+        ]
+        # Solo se acceden con self._lock tomado
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._pending = 0
+        # Fallar al arrancar y no a mitad de una partida
+        for deployment_name in deployments:
+            self._candidates(deployment_name)
+
+    def _candidates(self, deployment_name):
+        """
+        Backends que atienden el deployment.
+
+        Los backends sin deployment fijo atienden cualquiera. Si todos fijan otro
+        deployment se rechaza la petición en lugar de mandarla a un modelo
+        distinto (p. ej. la evaluación al modelo del Genio).
+
+        Raises:
+            GatewayConfigurationError: Si ningún backend atiende el deployment
+        """
+        candidates = [backend for backend in self.backends if backend.serves(deployment_name)]
+        if not candidates:
+            raise GatewayConfigurationError(
+                f"Ningún backend de AZURE_OPENAI_BACKENDS atiende el deployment {deployment_name!r}"
+            )
+        return candidates
+
+    def _score(self, backend):
+        """Costo estimado de enviar una petición más al backend (menor es mejor)."""
+        load = (backend.outstanding + 1) / backend.weight
+        if self.routing == "latency":
+            return load * (backend.latency or 0.0), 0
+        return load, backend.latency or 0.0
+
+    def _picker(self, deployment_name):
+        """
+        Función de elección de backend para call_with_retries (se usa dentro del loop).
+        """
+        def pick(failed):
+            candidates = sorted(
+                (backend for backend in self._candidates(deployment_name)
+                 if backend.breaker.state != CircuitBreaker.OPEN),
+                key=self._score
+            )
+            # Preferir un backend distinto al que acaba de fallar
+            candidates.sort(key=lambda backend: backend is failed)
+            for backend in candidates:
+                if backend.breaker.allow():
+                    return backend
+            return None
+        return pick
+
+    def _reserve(self, deployment_name):
+        """Reservar un lugar en la cola o rechazar si está llena (con self._lock tomado)."""
+        if all(backend.breaker.state == CircuitBreaker.OPEN for backend in self._candidates(deployment_name)):
+            # Fallar rápido sin ocupar la cola mientras todos los circuitos están abiertos
+            raise CircuitOpenError("El circuito hacia Azure OpenAI está abierto")
+        if self._pending >= self.max_concurrency * len(self.backends) + self.max_queue:
+            raise GatewayOverloadedError("Demasiadas peticiones al modelo en espera")
+        self._pending += 1
+
+    def _release(self, *_):
+        with self._lock:
+            self._pending -= 1
+
+    async def _create(self, deployment_name, messages, params):
+        async def attempt(backend):
+            await backend.acquire()
+            started = time.monotonic()
+            try:
+                response = await backend.client.chat.completions.create(
+                    model=backend.model_for(deployment_name),
+                    messages=messages,
+                    **params
+                )
+            finally:
+                backend.release()
+            backend.observe_latency(time.monotonic() - started)
+            return response
+
+        return await call_with_retries(attempt, self.retry_policy, self._picker(deployment_name))
+
+    async def _stream_into(self, deployment_name, messages, params, chunks):
+        """Consumir el stream del modelo y pasar los chunks al hilo que los espera."""
+        async def open_stream(backend):
+            await backend.acquire()
+            started = time.monotonic()
+            options = {"stream_options": {"include_usage": True}} if backend.stream_usage else {}
+            try:
+                response = await backend.client.chat.completions.create(
+                    model=backend.model_for(deployment_name),
+                    messages=messages,
+                    stream=True,
+                    **options,
+                    **params
+                )
+            except BaseException:
+                backend.release()
+                raise
+            backend.observe_latency(time.monotonic() - started)
+            return backend, response
+
+        try:
+            # Solo se reintenta la apertura del stream: una vez que llegan
+            # chunks al jugador no se puede volver a empezar
+            backend, response = await call_with_retries(
+                open_stream, self.retry_policy, self._picker(deployment_name)
+            )
+            try:
+                async for chunk in response:
+                    chunks.put(chunk)
+            except Exception as error:
+                if not is_retryable(error):
+                    raise
+                backend.breaker.record_failure()
+                raise LLMUnavailableError("Se cortó la respuesta de Azure OpenAI") from error
+            finally:
+                backend.release()
+            chunks.put(_STREAM_END)
+        except BaseException as error:
+            chunks.put(error)
+            raise
+
+    def complete(self, deployment_name, messages, **params):
+        """
+        Completar un chat sin streaming, agrupando peticiones idénticas en curso.
+
+        Args:
+            deployment_name: Nombre del modelo desplegado
+            messages: Mensajes del chat
+            **params: Parámetros adicionales (temperature, max_tokens, ...)
+
+        Returns:
+            ChatCompletion: Respuesta del modelo
+
+        Raises:
+            LLMUnavailableError: Si el modelo no está disponible o no responde a tiempo
+        """
+        key = _coalesce_key(deployment_name, messages, params)
+        is_new = False
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                self._reserve(deployment_name)
+                future = asyncio.run_coroutine_threadsafe(
+                    self._create(deployment_name, messages, params), self._loop
+                )
+                self._inflight[key] = future
+                is_new = True
+        if is_new:
+            future.add_done_callback(self._release)
+            future.add_done_callback(lambda done: self._forget(key, done))
+        try:
+            return future.result(timeout=self.timeout * 2)
+        except (concurrent.futures.TimeoutError, concurrent.futures.CancelledError):
+            # El futuro puede ser compartido con otras sesiones: no se cancela desde
+            # acá; la petición termina sola por el presupuesto de tiempo de los reintentos
+            raise GatewayTimeoutError("El modelo no respondió a tiempo") from None
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def stream(self, deployment_name, messages, **params):
+        """
+        Completar un chat con streaming.
+
+        Args:
+            deployment_name: Nombre del modelo desplegado
+            messages: Mensajes del chat
+            **params: Parámetros adicionales (temperature, max_tokens, ...)
+
+        Yields:
+            ChatCompletionChunk: Chunks a medida que llegan (si la versión de la
+                API lo permite, el último trae `usage` y ningún choice)
+        """
+        with self._lock:
+            self._reserve(deployment_name)
+        chunks = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(
+            self._stream_into(deployment_name, messages, params, chunks), self._loop
+        )
+        future.add_done_callback(self._release)
+        try:
+            while True:
+                try:
+                    item = chunks.get(timeout=self.timeout * 2)
+                except queue.Empty:
+                    raise GatewayTimeoutError("El modelo dejó de enviar datos") from None
+                if item is _STREAM_END:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            # Si el consumidor abandona el stream, cancelar la petición en el loop
+            if not future.done():
+                future.cancel()
+
+    def stats(self):
+        """
+        Estado de la pasarela para monitoreo.
+
+        Returns:
+            dict: Peticiones pendientes y estado de cada backend
+        """
+        return {
+            "pending": self._pending,
+            "backends": [backend.stats() for backend in self.backends],
+        }
+
+
+_gateways = {}
+_gateways_lock = threading.Lock()
+
+
+def get_gateway(backends, deployments=(), **options):
+    """
+    Obtener la pasarela compartida por el proceso para un conjunto de endpoints.
+
+    Args:
+        backends: Lista de dicts con endpoint, api_key, api_version y
+            opcionalmente deployment y weight
+        deployments: Deployments que se van a pedir (ver LLMGateway)
+        **options: Límites opcionales (ver LLMGateway)
+
+    Returns:
+        LLMGateway: Pasarela compartida
+
+    Raises:
+        GatewayConfigurationError: Si algún deployment no tiene backend
+    """
+    deployments = tuple(sorted(set(deployments)))
+    key = (
+        tuple(tuple(sorted(backend.items())) for backend in backends),
+        deployments,
+        tuple(sorted(options.items()))
+    )
+    gateway = _gateways.get(key)
+    if gateway is not None:
+        return gateway
+
+    with _gateways_lock:
+        gateway = _gateways.get(key)
+        if gateway is None:
+            gateway = LLMGateway(backends, deployments, **options)
+            _gateways[key] = gateway
+    return gateway
@@ -0,0 +1,285 @@
+"""
+Módulo de resiliencia para las llamadas a Azure OpenAI.
+
+Ante errores transitorios (429, timeouts, errores de conexión y 5xx) reintenta
+con backoff exponencial con jitter, respetando el encabezado Retry-After y un
+presupuesto total de tiempo. Si las fallas persisten abre un circuito que
+rechaza las llamadas de inmediato durante un tiempo, para que los agentes usen
+sus respuestas de respaldo en lugar de mostrar errores a los jugadores.
+"""
+import asyncio
+import email.utils
+import os
+import random
+import threading
+import time
+
+import openai
+
+DEFAULT_MAX_ATTEMPTS = int(os.getenv("LLM_RETRY_ATTEMPTS", "4"))
+DEFAULT_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+DEFAULT_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))
+DEFAULT_DEADLINE = float(os.getenv("LLM_RETRY_DEADLINE", "20"))
+DEFAULT_FAILURE_THRESHOLD = int(os.getenv("LLM_CIRCUIT_FAILURES", "5"))
+DEFAULT_RESET_TIMEOUT = float(os.getenv("LLM_CIRCUIT_RESET", "30"))
+
+
+class LLMUnavailableError(RuntimeError):
+    """El modelo no está disponible (reintentos agotados, circuito abierto o cola llena)."""
+
+
+class CircuitOpenError(LLMUnavailableError):
+    """El circuito está abierto: no se llama al modelo hasta que pase el tiempo de espera."""
+
+
+class LLMRequestError(LLMUnavailableError):
+    """El servicio rechazó el pedido (400, 401, 404, ...): reintentarlo no sirve."""
+
+    def __init__(self, message, status_code=None, code=None, param=None):
+        """
+        Args:
+            message (str): Descripción del error
+            status_code (int): Código HTTP de la respuesta (None si no hubo respuesta)
+            code (str): Código de error del servicio ("content_filter", ...)
+            param (str): Parámetro del pedido que causó el error ("response_format", ...)
+        """
+        super().__init__(message)
+        self.status_code = status_code
+        self.code = code
+        self.param = param
+
+
+def is_retryable(error):
+    """
+    Determinar si un error es transitorio y vale la pena reintentar.
+
+    Args:
+        error (Exception): Error lanzado por el cliente de OpenAI
+
+    Returns:
+        bool: True para 429, 408, 409, 5xx, timeouts y errores de conexión
+    """
+    if isinstance(error, (openai.RateLimitError, openai.APITimeoutError,
+                          openai.APIConnectionError, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409) or error.status_code >= 500
+    return False
+
+
+def retry_after(error):
+    """
+    Segundos de espera sugeridos por el servidor (Retry-After / retry-after-ms).
+
+    Args:
+        error (Exception): Error lanzado por el cliente de OpenAI
+
+    Returns:
+        float: Segundos a esperar o None si el servidor no indicó nada
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    retry_ms = headers.get("retry-after-ms")
+    if retry_ms:
+        try:
+            return float(retry_ms) / 1000
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        # Formato de fecha HTTP
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, parsed.timestamp() - time.time())
+
+
+class RetryPolicy:
+    """Backoff exponencial con jitter y presupuesto total de tiempo."""
+
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY,
+                 max_delay=DEFAULT_MAX_DELAY, deadline=DEFAULT_DEADLINE):
+        """
+        Args:
+            max_attempts (int): Intentos totales (incluido el primero)
+            base_delay (float): Espera base en segundos
+            max_delay (float): Espera máxima entre intentos
+            deadline (float): Segundos totales disponibles para todos los intentos
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    def delay(self, attempt, error):
+        """
+        Espera antes del siguiente intento ("full jitter", o Retry-After si es mayor).
+
+        Args:
+            attempt (int): Número de intento que acaba de fallar (empezando en 1)
+            error (Exception): Error del intento
+
+        Returns:
+            float: Segundos a esperar
+        """
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        suggested = retry_after(error)
+        if suggested is not None:
+            return max(backoff, suggested)
+        return backoff
+
+
+class CircuitBreaker:
+    """
+    Circuito que se abre tras fallas consecutivas y deja pasar una petición de
+    prueba (semiabierto) una vez transcurrido el tiempo de espera.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT):
+        """
+        Args:
+            failure_threshold (int): Fallas consecutivas para abrir el circuito
+            reset_timeout (float): Segundos que el circuito permanece abierto
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self):
+        """Estado actual del circuito."""
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self):
+        """
+        Indicar si se puede llamar al modelo ahora.
+
+        Returns:
+            bool: False mientras el circuito está abierto (o ya hay una prueba en curso)
+        """
+        with self._lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        """Registrar una llamada exitosa (cierra el circuito)."""
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def release(self):
+        """Liberar la petición de prueba sin cambiar el estado (p. ej. si se canceló)."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        """Registrar una falla transitoria (puede abrir el circuito)."""
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+async def call_with_retries(operation, policy, pick):
+    """
+    Ejecutar una operación asíncrona con reintentos y circuito.
+
+    Antes de cada intento se elige el destino (p. ej. uno de varios endpoints);
+    si tras una falla hay otro destino sano se reintenta ahí sin esperar, y solo
+    se aplica el backoff cuando hay que volver al mismo destino.
+
+    Args:
+        operation: Función que recibe el destino elegido y devuelve una corrutina
+        policy (RetryPolicy): Política de reintentos
+        pick: Función que recibe el destino que acaba de fallar (o None) y
+            devuelve un destino con atributo `breaker` ya autorizado por
+            `breaker.allow()`, o None si no hay ninguno disponible
+
+    Returns:
+        Resultado de la operación
+
+    Raises:
+        CircuitOpenError: Si todos los circuitos están abiertos
+        LLMRequestError: Si el servicio rechazó el pedido (error no transitorio)
+        LLMUnavailableError: Si se agotaron los intentos o el presupuesto de tiempo
+    """
+    started = time.monotonic()
+    attempt = 0
+    failed = None
+    last_error = None
+    delay = 0.0
+    while True:
+        target = pick(failed)
+        if target is None:
+            if last_error is None:
+                raise CircuitOpenError("El circuito hacia Azure OpenAI está abierto")
+            raise LLMUnavailableError(f"Azure OpenAI no respondió tras {attempt} intentos") from last_error
+
+        breaker = target.breaker
+        try:
+            if failed is not None:
+                # El presupuesto de tiempo vale también al pasar a otro destino (sin espera)
+                wait = delay if target is failed else 0.0
+                remaining = policy.deadline - (time.monotonic() - started)
+                if wait >= remaining:
+                    breaker.release()
+                    raise LLMUnavailableError(f"Azure OpenAI no respondió tras {attempt} intentos") from last_error
+                if wait:
+                    await asyncio.sleep(wait)
+            attempt += 1
+            result = await operation(target)
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except LLMUnavailableError:
+            raise
+        except Exception as error:
+            if not is_retryable(error):
+                # Errores del pedido (400, 401, ...): el servicio respondió, así que está sano
+                breaker.record_success()
+                if isinstance(error, openai.APIError):
+                    raise LLMRequestError(
+                        f"Azure OpenAI rechazó el pedido: {error}", getattr(error, "status_code", None),
+                        getattr(error, "code", None), getattr(error, "param", None)
+                    ) from error
+                raise
+            breaker.record_failure()
+            if attempt >= policy.max_attempts:
+                raise LLMUnavailableError(f"Azure OpenAI no respondió tras {attempt} intentos") from error
+            failed, last_error = target, error
+            delay = policy.delay(attempt, error)
+        else:
+            breaker.record_success()
+            return result
@@ -0,0 +1,250 @@
+"""
+Servidor local que imita la API de chat completions de Azure OpenAI.
+
+Sirve para medir la aplicación sin gastar cuota real: responde con texto
+sintético, con streaming (SSE) o sin él, simulando el tiempo hasta el primer
+token, la velocidad de generación, errores 429 con Retry-After y el uso de
+tokens (también en el último chunk si se pide con stream_options).
+
+Uso:
+    python mock_openai_server.py [--port 8765] [--ttft 0.3] [--tokens-per-second 50] [--rate-limit 0.05]
+
+y luego apuntar la aplicación a él:
+    AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8765 AZURE_OPENAI_API_KEY=mock streamlit run streamlit_app.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PORT = 8765
+
+GRADER_CORRECT_REPLY = "CORRECTO! ¡Muy bien, eso es exactamente! Seguí así que vas volando. 🎉"
+GRADER_INCORRECT_REPLY = "INCORRECTO. Estás cerca, pero fijate bien en la última pista encendida. 💡"
+GENIE_REPLY = (
+    "¡Ah, qué lindo acertijo! Las pistas hablan de algo que seguramente recordás con cariño. "
+    "Pensá en los momentos de la infancia, en las canciones y en los chistes de sobremesa. "
+    "No te voy a decir la respuesta, pero te aseguro que está más cerca de lo que pensás. "
+    "¡Y si no sale, siempre podés prender otro foquito, que para eso están! 😉✨"
+)
+
+
+class MockSettings:
+    """Comportamiento simulado del servidor (se puede cambiar en caliente)."""
+
+    def __init__(self, ttft=0.3, tokens_per_second=50.0, rate_limit=0.0, retry_after=1.0, correct_ratio=0.0,
+                 confidence=0.9, structured_output=True):
+        """
+        Args:
+            ttft (float): Segundos hasta el primer token
+            tokens_per_second (float): Velocidad de generación (0 = instantánea)
+            rate_limit (float): Proporción de peticiones que responden 429
+            retry_after (float): Valor del encabezado Retry-After de los 429
+            correct_ratio (float): Proporción de evaluaciones que responden CORRECTO
+            confidence (float): Confianza de las evaluaciones estructuradas (JSON)
+            structured_output (bool): Aceptar response_format (si no, responde 400
+                como un modelo sin salidas estructuradas)
+        """
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.correct_ratio = correct_ratio
+        self.confidence = confidence
+        self.structured_output = structured_output
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.rate_limited = 0
+
+    def count(self, rate_limited):
+        with self._lock:
+            self.requests += 1
+            if rate_limited:
+                self.rate_limited += 1
+
+
+def _reply_for(messages, settings, structured=False):
+    """Texto de la respuesta según el agente (evaluador o Genio) y el formato pedido."""
+    system = next((message.get("content", "") for message in messages if message.get("role") == "system"), "")
+    if "evaluador" not in system:
+        return GENIE_REPLY
+    reply = GRADER_CORRECT_REPLY if random.random() < settings.correct_ratio else GRADER_INCORRECT_REPLY
+    if not structured:
+        return reply
+    verdict, message = reply.split(" ", 1)
+    return json.dumps({
+        "verdict": verdict.rstrip("!."),
+        "confidence": settings.confidence,
+        "message": message,
+    }, ensure_ascii=False)
+
+
+def _usage(messages, tokens):
+    """Uso de tokens informado (entrada estimada con ~4 caracteres por token)."""
+    prompt_tokens = sum(len(message.get("content") or "") // 4 + 4 for message in messages)
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens), "total_tokens": prompt_tokens + len(tokens)}
+
+
+def _tokens(text):
+    """Partir el texto en "tokens" aproximados (palabras con su espacio)."""
+    words = text.split(" ")
+    return [word + (" " if index < len(words) - 1 else "") for index, word in enumerate(words)]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """Atiende POST .../chat/completions como lo haría Azure OpenAI."""
+
+    settings = MockSettings()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if "/chat/completions" not in self.path:
+            self._send_json(404, {"error": {"code": "NotFound", "message": "Ruta no soportada"}})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        settings = self.settings
+
+        rate_limited = random.random() < settings.rate_limit
+        settings.count(rate_limited)
+        if rate_limited:
+            self._send_json(
+                429,
+                {"error": {"code": "429", "message": "Rate limit simulado"}},
+                {"Retry-After": str(settings.retry_after)}
+            )
+            return
+
+        if request.get("response_format") and not settings.structured_output:
+            self._send_json(400, {"error": {
+                "code": "BadRequest",
+                "param": "response_format",
+                "message": "response_format json_schema no está soportado por este modelo",
+            }})
+            return
+
+        messages = request.get("messages") or []
+        text = _reply_for(messages, settings, bool(request.get("response_format")))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        model = request.get("model") or "mock"
+        time.sleep(settings.ttft)
+
+        if not request.get("stream"):
+            tokens = _tokens(text)
+            if settings.tokens_per_second > 0:
+                time.sleep(len(tokens) / settings.tokens_per_second)
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": text},
+                    "finish_reason": "stop",
+                }],
+                "usage": _usage(messages, tokens),
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        delay = 1 / settings.tokens_per_second if settings.tokens_per_second > 0 else 0
+        tokens = _tokens(text)
+        try:
+            for index, token in enumerate(tokens):
+                if index and delay:
+                    time.sleep(delay)
+                self._send_event({
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+                })
+            self._send_event({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            })
+            if (request.get("stream_options") or {}).get("include_usage"):
+                self._send_event({
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [],
+                    "usage": _usage(messages, tokens),
+                })
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # El cliente canceló el stream (p. ej. veredicto anticipado)
+            pass
+        self.close_connection = True
+
+    def _send_event(self, payload):
+        self.wfile.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+
+def start_server(port=0, settings=None):
+    """
+    Levantar el servidor simulado en un hilo en segundo plano.
+
+    Args:
+        port (int): Puerto (0 para elegir uno libre)
+        settings (MockSettings): Comportamiento simulado
+
+    Returns:
+        tuple: (servidor, URL base para AZURE_OPENAI_ENDPOINT)
+    """
+    handler = type("ConfiguredMockHandler", (MockHandler,), {"settings": settings or MockSettings()})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-openai", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor simulado de Azure OpenAI")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--ttft", type=float, default=0.3, help="segundos hasta el primer token")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="proporción de respuestas 429")
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--correct-ratio", type=float, default=0.0, help="proporción de evaluaciones CORRECTO")
+    parser.add_argument("--confidence", type=float, default=0.9, help="confianza de las evaluaciones en JSON")
+    parser.add_argument("--no-structured-output", action="store_true", help="rechazar response_format con 400")
+    args = parser.parse_args()
+
+    mock_settings = MockSettings(
+        args.ttft, args.tokens_per_second, args.rate_limit, args.retry_after, args.correct_ratio, args.confidence,
+        not args.no_structured_output
+    )
+    mock_server, url = start_server(args.port, mock_settings)
+    print(f"Servidor simulado escuchando en {url} (Ctrl+C para salir)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        mock_server.shutdown()
@@ -0,0 +1,178 @@
+"""
+Módulo con los almacenes de progreso de los jugadores.
+
+Reemplaza la reescritura completa de progress.yaml por un almacén con una fila
+por jugador/sesión y actualizaciones atómicas, para que muchos jugadores puedan
+guardar su progreso a la vez sin pisarse ni corromper un archivo compartido.
+
+- SQLiteProgressStore: por defecto, SQLite en modo WAL (lectores concurrentes).
+- MemoryProgressStore: en memoria, para pruebas y entornos efímeros.
+"""
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# "sqlite" o "memory"
+DEFAULT_BACKEND = os.getenv("PROGRESS_STORE", "sqlite")
+DEFAULT_DB_PATH = os.getenv("PROGRESS_DB_PATH", "progress.db")
+
+
+class ProgressStore:
+    """Interfaz común de los almacenes de progreso."""
+
+    def load(self, player_id):
+        """
+        Obtener el progreso de un jugador.
+
+        Args:
+            player_id (str): Identificador del jugador/sesión
+
+        Returns:
+            dict: Datos del progreso o None si no hay nada guardado
+        """
+        raise NotImplementedError
+
+    def save(self, player_id, progress_data):
+        """
+        Guardar (reemplazar) el progreso de un jugador de forma atómica.
+
+        Args:
+            player_id (str): Identificador del jugador/sesión
+            progress_data (dict): Datos del progreso
+        """
+        self.save_many({player_id: progress_data})
+
+    def save_many(self, updates):
+        """
+        Guardar el progreso de varios jugadores en una sola operación.
+
+        Args:
+            updates (dict): player_id -> datos del progreso
+        """
+        raise NotImplementedError
+
+    def delete(self, player_id):
+        """Borrar el progreso de un jugador."""
+        raise NotImplementedError
+
+
+class MemoryProgressStore(ProgressStore):
+    """Almacén en memoria (se pierde al reiniciar el proceso)."""
+
+    def __init__(self):
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def load(self, player_id):
+        with self._lock:
+            data = self._rows.get(player_id)
+            return copy.deepcopy(data) if data is not None else None
+
+    def save_many(self, updates):
+        with self._lock:
+            for player_id, progress_data in updates.items():
+                self._rows[player_id] = copy.deepcopy(progress_data)
+
+    def delete(self, player_id):
+        with self._lock:
+            self._rows.pop(player_id, None)
+
+
+class SQLiteProgressStore(ProgressStore):
+    """Almacén en SQLite (modo WAL) con una fila por jugador."""
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        """
+        Args:
+            path (str): Archivo de la base de datos
+        """
+        self.path = path
+        self._local = threading.local()
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS progress ("
+            " player_id TEXT PRIMARY KEY,"
+            " data TEXT NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        connection.commit()
+
+    def _connection(self):
+        """Conexión propia de cada hilo (SQLite no comparte conexiones entre hilos)."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def load(self, player_id):
+        row = self._connection().execute(
+            "SELECT data FROM progress WHERE player_id = ?", (player_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_many(self, updates):
+        if not updates:
+            return
+        now = time.time()
+        connection = self._connection()
+        with connection:
+            connection.executemany(
+                "INSERT INTO progress (player_id, data, updated_at) VALUES (?, ?, ?)"
+                " ON CONFLICT(player_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                [(player_id, json.dumps(data), now) for player_id, data in updates.items()]
+            )
+
+    def delete(self, player_id):
+        connection = self._connection()
+        with connection:
+            connection.execute("DELETE FROM progress WHERE player_id = ?", (player_id,))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def create_progress_store(backend=DEFAULT_BACKEND, path=DEFAULT_DB_PATH):
+    """
+    Crear un almacén de progreso.
+
+    Args:
+        backend (str): "sqlite" o "memory"
+        path (str): Archivo de la base de datos (solo para sqlite)
+
+    Returns:
+        ProgressStore: Almacén configurado
+    """
+    if backend == "memory":
+        return MemoryProgressStore()
+    if backend == "sqlite":
+        return SQLiteProgressStore(path)
+    raise ValueError(f"Almacén de progreso desconocido: {backend}")
+
+
+def get_progress_store():
+    """
+    Almacén compartido por todas las sesiones del proceso.
+
+    Returns:
+        ProgressStore: Instancia configurada con PROGRESS_STORE / PROGRESS_DB_PATH
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = create_progress_store()
+    return _store
+
+
+def set_progress_store(store):
+    """Reemplazar el almacén compartido (p. ej. por uno en memoria en pruebas)."""
+    global _store
+    with _store_lock:
+        _store = store
@@ -0,0 +1,314 @@
+"""
+Módulo con las plantillas de los prompts de los agentes.
+
+Las instrucciones largas (persona, tono, reglas de formato) forman el mensaje de
+sistema, idéntico byte a byte en todas las llamadas de una misma persona, y se
+construyen una sola vez. Los datos que cambian (pregunta, pistas, respuesta del
+usuario) van al final, en el mensaje del usuario. Así el proveedor puede
+reutilizar el prefijo cacheado (prompt caching) y los tokens de cada parte se
+cuentan una sola vez por pregunta.
+"""
+import functools
+import math
+import weakref
+
+from clue_catalog import DEFAULT_PERSONA
+
+try:
+    import tiktoken
+except ImportError:  # Dependencia opcional: sin ella se estima por caracteres
+    tiktoken = None
+
+# Codificación de los modelos gpt-4o / gpt-4o-mini
+TOKEN_ENCODING = "o200k_base"
+# Tokens extra que agrega el formato de chat por cada mensaje
+MESSAGE_OVERHEAD_TOKENS = 4
+
+GRADER_ROLE_TEMPLATE = """\
+Sistema: Sos un evaluador de respuestas para un juego de acertijos para {description} llamada {name}.
+Tu trabajo es determinar si la respuesta que dio es correcta o está muy cerca de la respuesta correcta.
+Sé muy generoso en tu evaluación, aceptando respuestas que capturen la esencia correcta.
+Vas a recibir la pregunta, la respuesta correcta y la respuesta del usuario.
+
+"""
+
+# Formato de texto: el veredicto se lee del comienzo del mensaje
+GRADER_SYSTEM_TEMPLATE = GRADER_ROLE_TEMPLATE + """\
+Responde SOLAMENTE con uno de estos dos formatos exactos:
+1. "CORRECTO! [tu mensaje amistoso aquí]" si la respuesta es correcta o muy cercana
+2. "INCORRECTO. [tu consejo aquí]" si la respuesta es incorrecta
+
+Si es CORRECTO, felicitala con calidez en un tono argentino, como si fueras su amigo/a.
+Si es INCORRECTO, dale un pequeño consejo para ayudarla, sin revelar la respuesta.
+
+NO menciones la palabra "CORRECTO" en una respuesta INCORRECTA, ni siquiera como parte de otra palabra.
+NO menciones la palabra "INCORRECTO" en una respuesta CORRECTA, ni siquiera como parte de otra palabra."""
+
+# Formato estructurado: JSON con el veredicto primero (ver llm_agents.GRADING_RESPONSE_FORMAT)
+GRADER_STRUCTURED_SYSTEM_TEMPLATE = GRADER_ROLE_TEMPLATE + """\
+Responde SOLAMENTE con un objeto JSON con estos campos, en este orden:
+- "verdict": "CORRECTO" si la respuesta es correcta o muy cercana, "INCORRECTO" si no lo es
+- "confidence": qué tan seguro estás del veredicto, de 0 a 1
+- "message": tu mensaje para ella, sin repetir el veredicto
+
+Si es CORRECTO, felicitala con calidez en un tono argentino, como si fueras su amigo/a.
+Si es INCORRECTO, dale un pequeño consejo para ayudarla, sin revelar la respuesta."""
+
+GRADER_QUESTION_TEMPLATE = """\
+La pregunta era: "{question}"
+La respuesta correcta es: "{correct_answer}"
+"""
+
+GRADER_ANSWER_TEMPLATE = 'La respuesta del usuario es: "{user_answer}"'
+
+GENIE_SYSTEM_TEMPLATE = """\
+Sistema: Sos un asistente amigable para un juego de acertijos para {description} llamada {name}.
+Tu nombre es "El Genio" y tu labor es ayudarla a descubrir las respuestas a través de pistas.
+Habla con calidez y paciencia, usando modismos argentinos ocasionalmente.
+Adaptá tu lenguaje para que sea fácil de entender para una persona mayor.
+Las preguntas y las pistas estan escritas por {authors}, por lo cual al hablarle a {name} debes tomar eso en cuenta que formlar correctamente las pistas.
+Tu personalidad es una persona con un gran sentido del humor y sarcasmo.
+
+Ademas tienes un readme de que hace la aplicacion y como usarla basicamente es una app de preguntas y respuestas
+donde puedes preguntarle al genio por pistas y respuestas a las preguntas que te haga.
+En la UI hay focos con pistas que se pueden activar para ayudar a responder.
+
+Vas a recibir la pregunta actual y las pistas disponibles.
+
+Si {name} te hace una pregunta, responde directamente a su pregunta, dándole ayuda relacionada con el acertijo sin revelarle
+la respuesta directamente. Sé amable y paciente, explicando las cosas de manera clara.
+Si su pregunta no está relacionada con el acertijo actual, puedes responder brevemente
+pero recuérdale amablemente que tu función es ayudarla a resolver el acertijo actual.
+
+Si no te pregunta nada, proporcioná una explicación amable de las pistas disponibles, dándole un poco más de contexto
+sin revelar directamente la respuesta. Animate a contar alguna anécdota relacionada
+para hacer la experiencia más personal y entretenida. Ten cuidado de nunca nombrar directamente a la respuesta
+Puedes hacer un chiste al final con sarcasmo y emojis."""
+
+GENIE_CONTEXT_TEMPLATE = """\
+La pregunta actual es: "{question}"
+
+Las pistas disponibles son:
+{clues}
+"""
+
+GENIE_QUERY_TEMPLATE = '\n{name} te ha preguntado: "{user_query}"'
+
+GENIE_EXPLAIN_REQUEST = "\nExplicá las pistas disponibles."
+
+# Se agrega al final cuando la sesión se acerca a su presupuesto de tokens
+GENIE_BRIEF_REQUEST = "\nRespondé en dos o tres oraciones como máximo."
+
+
+def _persona_key(persona):
+    """Versión hashable de una persona (para memorizar por persona)."""
+    return tuple(sorted((persona or DEFAULT_PERSONA).items()))
+
+
+@functools.lru_cache(maxsize=1024)
+def _grader_system(persona_key, structured=False):
+    template = GRADER_STRUCTURED_SYSTEM_TEMPLATE if structured else GRADER_SYSTEM_TEMPLATE
+    return template.format(**dict(persona_key))
+
+
+@functools.lru_cache(maxsize=1024)
+def _genie_system(persona_key):
+    return GENIE_SYSTEM_TEMPLATE.format(**dict(persona_key))
+
+
+def grader_system_prompt(persona=None, structured=False):
+    """
+    Mensaje de sistema del AnswerGrader (el mismo para todas las preguntas).
+
+    Args:
+        persona (Mapping): Persona de la búsqueda (ver ClueCatalog.persona)
+        structured (bool): Pedir la evaluación como JSON en lugar de texto
+
+    Returns:
+        str: Prompt de sistema
+    """
+    return _grader_system(_persona_key(persona), structured)
+
+
+def genie_system_prompt(persona=None):
+    """
+    Mensaje de sistema del ClueAssistant (el mismo para todas las preguntas).
+
+    Args:
+        persona (Mapping): Persona de la búsqueda (ver ClueCatalog.persona)
+
+    Returns:
+        str: Prompt de sistema
+    """
+    return _genie_system(_persona_key(persona))
+
+
+def grader_messages(question, correct_answer, user_answer, persona=None, structured=False):
+    """
+    Mensajes para el AnswerGrader: prefijo fijo y datos de la respuesta al final.
+
+    Args:
+        question (str): Texto de la pregunta
+        correct_answer (str): Respuesta correcta
+        user_answer (str): Respuesta del usuario
+        persona (Mapping): Persona de la búsqueda
+        structured (bool): Pedir la evaluación como JSON en lugar de texto
+
+    Returns:
+        list: Mensajes de chat
+    """
+    content = (
+        GRADER_QUESTION_TEMPLATE.format(question=question, correct_answer=correct_answer)
+        + GRADER_ANSWER_TEMPLATE.format(user_answer=user_answer)
+    )
+    return [
+        {"role": "system", "content": grader_system_prompt(persona, structured)},
+        {"role": "user", "content": content},
+    ]
+
+
+def _clues_text(clues, clue_index):
+    """Pistas reveladas hasta `clue_index` (inclusive), una por línea."""
+    if clue_index is None:
+        return ""
+    return "\n".join(f"Pista {i+1}: {clue}" for i, clue in enumerate(clues[:clue_index+1]))
+
+
+def genie_messages(clues, question_text, clue_index=None, user_query=None, persona=None, brief=False):
+    """
+    Mensajes para el ClueAssistant: prefijo fijo, luego la pregunta y las pistas,
+    y al final la consulta del usuario (si la hay).
+
+    Args:
+        clues: Lista de pistas disponibles
+        question_text: Texto de la pregunta actual
+        clue_index: Índice de la última pista revelada
+        user_query: Consulta específica del usuario (opcional)
+        persona (Mapping): Persona de la búsqueda
+        brief (bool): Pedir una respuesta corta (sin tocar el prefijo cacheable)
+
+    Returns:
+        list: Mensajes de chat
+    """
+    persona = persona or DEFAULT_PERSONA
+    content = GENIE_CONTEXT_TEMPLATE.format(question=question_text, clues=_clues_text(clues, clue_index))
+    if user_query and user_query.strip():
+        content += GENIE_QUERY_TEMPLATE.format(name=persona["name"], user_query=user_query)
+    else:
+        content += GENIE_EXPLAIN_REQUEST
+    if brief:
+        content += GENIE_BRIEF_REQUEST
+    return [
+        {"role": "system", "content": genie_system_prompt(persona)},
+        {"role": "user", "content": content},
+    ]
+
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    return tiktoken.get_encoding(TOKEN_ENCODING)
+
+
+@functools.lru_cache(maxsize=8192)
+def count_tokens(text):
+    """
+    Cantidad de tokens de un texto.
+
+    Con tiktoken instalado el conteo es exacto; sin él se estima con ~4
+    caracteres por token.
+
+    Args:
+        text (str): Texto a contar
+
+    Returns:
+        int: Tokens
+    """
+    if tiktoken is not None:
+        return len(_encoding().encode(text))
+    return math.ceil(len(text) / 4)
+
+
+def messages_tokens(messages):
+    """
+    Tokens de entrada de una lista de mensajes de chat.
+
+    Args:
+        messages (list): Mensajes de chat
+
+    Returns:
+        int: Tokens (incluido el formato de cada mensaje)
+    """
+    return sum(count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+def question_token_counts(question, persona=None):
+    """
+    Tokens de entrada de los prompts de una pregunta.
+
+    Args:
+        question (Mapping): Pregunta del catálogo
+        persona (Mapping): Persona de la búsqueda
+
+    Returns:
+        dict: `grader` (sin contar la respuesta del usuario) y `genie` (lista
+            por cantidad de pistas reveladas, de ninguna a todas, sin consulta)
+    """
+    grader = grader_messages(question["question"], question["answer"], "", persona)
+    clues = list(question["clues"])
+    return {
+        "grader": messages_tokens(grader),
+        "genie": [
+            messages_tokens(genie_messages(clues, question["question"], clue_index, persona=persona))
+            for clue_index in range(-1, len(clues))
+        ],
+    }
+
+
+_catalog_counts = weakref.WeakKeyDictionary()
+
+
+def catalog_token_counts(catalog):
+    """
+    Tokens de los prompts de todas las preguntas de un catálogo (calculados una vez).
+
+    Si el catálogo viene de una instantánea compilada, los conteos ya vienen
+    hechos (ver clue_catalog.compile_catalog).
+
+    Args:
+        catalog (ClueCatalog): Catálogo de la búsqueda
+
+    Returns:
+        dict: id de pregunta -> resultado de question_token_counts
+    """
+    if catalog.token_counts is not None:
+        return catalog.token_counts
+    counts = _catalog_counts.get(catalog)
+    if counts is None:
+        counts = {
+            question_id: question_token_counts(catalog.get(question_id), catalog.persona)
+            for question_id in catalog.ids
+        }
+        _catalog_counts[catalog] = counts
+    return counts
+
+
+def genie_prompt_tokens(catalog, question_id, clue_index=-1, user_query=None):
+    """
+    Tokens de entrada de una llamada al Genio, a partir de los conteos precalculados.
+
+    Args:
+        catalog (ClueCatalog): Catálogo de la búsqueda
+        question_id: Id de la pregunta
+        clue_index (int): Índice de la última pista revelada (-1 si ninguna)
+        user_query (str): Consulta del usuario (opcional)
+
+    Returns:
+        int: Tokens de entrada estimados
+    """
+    counts = catalog_token_counts(catalog)[question_id]["genie"]
+    tokens = counts[min(max(clue_index, -1) + 1, len(counts) - 1)]
+    if user_query and user_query.strip():
+        # El conteo precalculado trae el pedido de explicación en lugar de la consulta
+        tokens += count_tokens(user_query) - count_tokens(GENIE_EXPLAIN_REQUEST)
+        tokens += count_tokens(GENIE_QUERY_TEMPLATE.format(name=catalog.persona["name"], user_query=""))
+    return tokens
@@ -1,16 +1,45 @@
 """
-Regalo Misterioso - Versión 2 - Estado completamente en memoria
+Regalo Misterioso - Versión 2 - Estado en memoria con progreso persistente
 Una aplicación de acertijos con IA para una experiencia de regalo de cumpleaños.
+
+El progreso de cada jugador se guarda con game_manager bajo un token que viaja
+en la URL (?player=...), así que recargar la página o reiniciar el servidor no
+obliga a repetir (ni a volver a evaluar) los acertijos ya resueltos. La
+búsqueda se elige con ?hunt=<id> (por defecto, clues.yaml).
 """
+import json
 import os
-import time
-import yaml
+import re
+import uuid
 from dotenv import load_dotenv
 import streamlit as st
 
 # Importar módulos refactorizados
-from style import load_css, reset_button_js, loading_animation_html
-from llm_agents import initialize_client, answer_grader, clue_assistant
+from style import load_css, reset_button_js, loading_animation_html, clue_bulb_html
+from llm_agents import (
+    GRADING_PREFIX,
+    GRADING_STRUCTURED,
+    MIN_GRADING_CONFIDENCE,
+    PartialGradingError,
+    answer_grader,
+    clue_assistant,
+    fallback_grade,
+    genie_budget_message,
+    genie_max_tokens,
+    grading_mode,
+    initialize_client,
+    structured_grading_supported,
+)
+from llm_gateway import GatewayConfigurationError
+from llm_resilience import LLMUnavailableError
+from answer_matcher import quick_grade, quick_feedback
+from grading_cache import get_grading_cache, cache_key
+from genie_pool import get_genie_pool
+from prompts import genie_prompt_tokens
+import clue_catalog
+import game_manager
+from telemetry import span
+from usage_ledger import BUDGET_EXHAUSTED, BUDGET_SHORT, budget_state
 
 # Cargar variables de entorno
 load_dotenv()
@@ -27,38 +56,138 @@ KEY_GENIUS_RESPONSE = "genius_response"
 KEY_SHOW_GENIUS = "show_genius"
 KEY_GAME_COMPLETED = "game_completed"
 KEY_PENDING_GENIUS_QUERY = "pending_genius_query"
+KEY_PENDING_TRANSITION = "pending_transition"
+KEY_PLAYER_ID = "player_id"
+KEY_HUNT_ID = "hunt_id"
+
+# Parámetros de la URL con el token del jugador y la búsqueda
+PLAYER_PARAM = "player"
+HUNT_PARAM = "hunt"
+PLAYER_TOKEN_PATTERN = re.compile(r"[A-Za-z0-9_-]{8,64}")
+
+# Mensaje final para búsquedas que no definen `finale`
+DEFAULT_FINALE_HTML = """
+    <h2>¡Felicitaciones! 🎉</h2>
+    <p>¡Has completado todos los acertijos exitosamente! 🌟</p>
+"""
+
+# Segundos de celebración antes de mostrar el siguiente acertijo
+CELEBRATION_SECONDS = 1.5
+
+@st.fragment(run_every=CELEBRATION_SECONDS)
+def celebration_transition():
+    """
+    Pasar al siguiente acertijo cuando termina la celebración, sin bloquear el servidor.
+    
+    La primera ejecución ocurre junto con la página y solo arma la transición;
+    el temporizador del navegador vuelve a ejecutar el fragmento pasados
+    CELEBRATION_SECONDS y recién ahí se recarga la app completa.
+    """
+    if st.session_state.get(KEY_PENDING_TRANSITION):
+        st.session_state[KEY_PENDING_TRANSITION] = False
+        return
+    st.rerun()
+
+def genius_message_html(message):
+    """HTML del recuadro con el mensaje del Genio."""
+    return f"""
+        <div style='background: rgba(147, 112, 219, 0.2); padding: 20px; border-radius: 10px; margin: 1rem 0;'>
+            {message}
+        </div>
+    """
 
 @st.dialog("Mensaje del Genio 🧞‍♂️", width="large")
-def genius_dialog(message):
-    """Diálogo modal para mostrar mensajes del Genio."""
+def genius_dialog(message=None, stream=None):
+    """
+    Diálogo modal para mostrar mensajes del Genio.
+    
+    Si se pasa `stream` (generador de fragmentos), el texto se va mostrando a
+    medida que llega y al terminar se guarda en KEY_GENIUS_RESPONSE.
+    """
     st.markdown("""
         <div style='text-align: center; margin-bottom: 1rem;'>
             <span style='font-size: 4rem;'>🧞‍♂️</span>
         </div>
     """, unsafe_allow_html=True)
     
-    st.markdown(f"""
-        <div style='background: rgba(147, 112, 219, 0.2); padding: 20px; border-radius: 10px; margin: 1rem 0;'>
-            {message}
-        </div>
-    """, unsafe_allow_html=True)
+    message_placeholder = st.empty()
+    if stream is not None:
+        message_placeholder.markdown(loading_animation_html(), unsafe_allow_html=True)
+        parts = []
+        for piece in stream:
+            parts.append(piece)
+            message_placeholder.markdown(genius_message_html("".join(parts)), unsafe_allow_html=True)
+        # Al re-ejecutarse el diálogo el generador ya está consumido: usar el texto guardado
+        if parts:
+            st.session_state[KEY_GENIUS_RESPONSE] = "".join(parts)
+        message = st.session_state[KEY_GENIUS_RESPONSE]
+    
+    message_placeholder.markdown(genius_message_html(message), unsafe_allow_html=True)
     
     if st.button("✨ Entendido", type="primary", use_container_width=True):
         st.session_state[KEY_SHOW_GENIUS] = False
         st.rerun()
 
-def load_clues():
-    """Cargar las preguntas y respuestas desde el archivo YAML."""
-    with open("clues.yaml", 'r', encoding='utf-8') as file:
-        return yaml.safe_load(file)
+def get_hunt_id():
+    """Id de la búsqueda pedida en la URL (None para la búsqueda por defecto)."""
+    return st.query_params.get(HUNT_PARAM) or None
+
+def load_catalog(hunt_id=None):
+    """Cargar el catálogo indexado de preguntas (compartido entre sesiones y reruns)."""
+    return clue_catalog.load_hunt(hunt_id)
+
+def get_player_id():
+    """
+    Obtener el token del jugador desde la URL o crear uno nuevo.
+    
+    El token se deja en la URL para que una recarga (o un enlace guardado)
+    recupere el mismo progreso.
+    
+    Returns:
+        str: Identificador del jugador
+    """
+    player_id = st.query_params.get(PLAYER_PARAM)
+    if not player_id or not PLAYER_TOKEN_PATTERN.fullmatch(player_id):
+        player_id = uuid.uuid4().hex
+        st.query_params[PLAYER_PARAM] = player_id
+    return player_id
+
+def restore_progress(catalog, player_id):
+    """
+    Recuperar el progreso guardado de un jugador en el estado de la sesión.
+    
+    Si la pregunta guardada ya no existe en el catálogo, se retoma en la
+    primera que el jugador todavía no resolvió.
+    """
+    progress = game_manager.load_progress(player_id, catalog)
+    completed = [question_id for question_id in progress.get("completed_questions") or [] if question_id in catalog]
+    current_id = progress.get("current_question")
+    revealed = int(progress.get("clues_revealed") or 0)
+    if current_id not in catalog:
+        current_id = next((question_id for question_id in catalog.ids if question_id not in completed), None)
+        revealed = 0
+    
+    st.session_state[KEY_CURRENT_QUESTION_ID] = current_id
+    st.session_state[KEY_COMPLETED_QUESTIONS] = completed
+    st.session_state[KEY_REVEALED_CLUES] = list(range(revealed))
+
+def checkpoint_progress():
+    """Guardar el progreso de la sesión (preguntas resueltas y pistas reveladas)."""
+    game_manager.save_progress({
+        "completed_questions": list(st.session_state[KEY_COMPLETED_QUESTIONS]),
+        "current_question": st.session_state[KEY_CURRENT_QUESTION_ID],
+        "clues_revealed": len(st.session_state[KEY_REVEALED_CLUES]),
+    }, st.session_state[KEY_PLAYER_ID])
 
-def initialize_session():
-    """Inicializar el estado de la sesión si es necesario."""
+def initialize_session(catalog, hunt_id=None):
+    """Inicializar el estado de la sesión si es necesario, retomando el progreso guardado."""
     if KEY_INITIALIZED not in st.session_state:
         st.session_state[KEY_INITIALIZED] = True
-        st.session_state[KEY_CURRENT_QUESTION_ID] = 1
-        st.session_state[KEY_COMPLETED_QUESTIONS] = []
-        st.session_state[KEY_REVEALED_CLUES] = []
+        st.session_state[KEY_HUNT_ID] = hunt_id
+        # El progreso se guarda por búsqueda: el mismo token puede jugar varias
+        player_id = get_player_id()
+        st.session_state[KEY_PLAYER_ID] = f"{hunt_id}:{player_id}" if hunt_id else player_id
+        restore_progress(catalog, st.session_state[KEY_PLAYER_ID])
         st.session_state[KEY_FEEDBACK] = ""
         st.session_state[KEY_IS_CORRECT] = False
         st.session_state[KEY_SUBMITTED] = False
@@ -70,9 +199,10 @@ def initialize_session():
         if "user_input" in st.session_state:
             del st.session_state["user_input"]
 
-def reset_game():
+def reset_game(catalog):
     """Reiniciar todo el juego."""
-    st.session_state[KEY_CURRENT_QUESTION_ID] = 1
+    game_manager.reset_progress(st.session_state[KEY_PLAYER_ID], catalog)
+    st.session_state[KEY_CURRENT_QUESTION_ID] = catalog.first_id
     st.session_state[KEY_COMPLETED_QUESTIONS] = []
     st.session_state[KEY_REVEALED_CLUES] = []
     st.session_state[KEY_FEEDBACK] = ""
@@ -86,25 +216,231 @@ def reset_game():
         del st.session_state["user_input"]
     st.rerun()
 
-def get_current_question(clues_data):
-    """Obtener la pregunta actual basada en el ID almacenado en la sesión."""
-    current_id = st.session_state[KEY_CURRENT_QUESTION_ID]
+def reveal_clue(index):
+    """Encender la pista `index` y guardar el progreso (callback del foco)."""
+    if index not in st.session_state[KEY_REVEALED_CLUES]:
+        st.session_state[KEY_REVEALED_CLUES].append(index)
+        checkpoint_progress()
+
+@st.fragment
+def clue_panel(question):
+    """
+    Focos de pistas y pistas reveladas.
     
-    for question in clues_data["questions"]:
-        if question["id"] == current_id:
-            return question
-            
-    return None
+    Es un fragmento: al encender un foco solo se re-ejecuta esta sección, no
+    toda la página (credenciales, catálogo, formulario, etc.).
+    """
+    st.markdown("### Pistas disponibles:")
+    
+    # Mostrar indicadores de pistas disponibles
+    max_clues = len(question.get('clues', []))
+    revealed = st.session_state[KEY_REVEALED_CLUES]
+    
+    # Crear un contenedor flexible para los indicadores
+    st.markdown('<div class="clue-indicators">', unsafe_allow_html=True)
+    
+    # Crear columnas en una sola fila para los indicadores
+    cols = st.columns(max_clues)
+    for i, col in enumerate(cols):
+        with col:
+            # Solo habilitar clic para la siguiente pista disponible
+            if i == len(revealed):
+                st.button("💡", key=f"clue_{i}", on_click=reveal_clue, args=(i,))
+            else:
+                st.markdown(clue_bulb_html(i in revealed), unsafe_allow_html=True)
+    
+    st.markdown('</div>', unsafe_allow_html=True)
+    
+    # Mostrar pistas ya reveladas
+    for i in revealed:
+        if i < max_clues:
+            st.markdown(f"""
+            <div class="clue-box">
+                <p>🔍 {question['clues'][i]}</p>
+            </div>
+            """, unsafe_allow_html=True)
+
+def get_current_question(catalog):
+    """Obtener la pregunta actual basada en el ID almacenado en la sesión."""
+    return catalog.get(st.session_state[KEY_CURRENT_QUESTION_ID])
 
-def advance_to_next_question():
+def advance_to_next_question(catalog):
     """Avanzar a la siguiente pregunta."""
-    st.session_state[KEY_CURRENT_QUESTION_ID] += 1
+    st.session_state[KEY_CURRENT_QUESTION_ID] = catalog.next_id(st.session_state[KEY_CURRENT_QUESTION_ID])
     st.session_state[KEY_REVEALED_CLUES] = []
     st.session_state[KEY_SUBMITTED] = False
     st.session_state[KEY_FEEDBACK] = ""
     if "user_input" in st.session_state:
         del st.session_state["user_input"]
 
+def complete_question(catalog, question):
+    """Marcar la pregunta como resuelta, celebrar y avanzar el estado a la siguiente."""
+    if question['id'] not in st.session_state[KEY_COMPLETED_QUESTIONS]:
+        st.session_state[KEY_COMPLETED_QUESTIONS].append(question['id'])
+    st.session_state[KEY_IS_CORRECT] = True
+    
+    # Efecto de celebración
+    st.balloons()
+    
+    advance_to_next_question(catalog)
+    checkpoint_progress()
+
+def usage_scope(question):
+    """Búsqueda, pregunta y sesión a las que se atribuyen los tokens de una llamada."""
+    return {
+        "hunt_id": st.session_state.get(KEY_HUNT_ID),
+        "question_id": question['id'],
+        "session_id": st.session_state.get(KEY_PLAYER_ID),
+    }
+
+def is_doubtful(confidence):
+    """Indicar si un veredicto estructurado no alcanza la confianza mínima (o no la informó)."""
+    return confidence is None or confidence < MIN_GRADING_CONFIDENCE
+
+def grade_answer(client, deployments, question, user_answer, on_verdict=None, persona=None, mode=GRADING_PREFIX):
+    """
+    Evaluar la respuesta del usuario, resolviendo localmente los casos obvios.
+    
+    Solo las respuestas ambiguas que no se evaluaron antes se envían al
+    AnswerGrader (LLM); su resultado queda memorizado para todas las sesiones.
+    `on_verdict` se llama con el veredicto en cuanto se conoce, antes de que
+    termine de mostrarse el mensaje del modelo.
+    
+    Con la evaluación estructurada, un veredicto con poca confianza del
+    deployment del evaluador se vuelve a pedir al deployment del Genio (si es
+    otro), y los veredictos dudosos no se memorizan.
+    
+    Returns:
+        tuple: (is_correct, feedback)
+    """
+    def resolved(is_correct, feedback):
+        if on_verdict is not None:
+            on_verdict(is_correct)
+        st.markdown(feedback)
+        return is_correct, feedback
+    
+    verdict = quick_grade(user_answer, question)
+    if verdict is not None:
+        return resolved(verdict, quick_feedback(verdict, persona))
+    
+    cache = get_grading_cache()
+    key = cache_key(question, user_answer, persona)
+    cached = cache.get(key)
+    if cached is not None:
+        return resolved(*cached)
+    
+    structured = mode == GRADING_STRUCTURED and structured_grading_supported(deployments["grader"])
+    escalate = structured and deployments["genie"] != deployments["grader"]
+    published = []
+    
+    def publish(verdict):
+        published.append(verdict)
+        if on_verdict is not None:
+            on_verdict(verdict)
+    
+    grading = dict(
+        on_verdict=publish,
+        persona=persona,
+        usage_scope=usage_scope(question),
+        structured=structured
+    )
+    try:
+        is_correct, feedback, confidence = answer_grader(
+            client,
+            deployments["grader"],
+            user_answer,
+            question['answer'],
+            question['question'],
+            min_confidence=MIN_GRADING_CONFIDENCE if escalate else None,
+            **grading
+        )
+        if escalate and is_doubtful(confidence) and not published:
+            # Veredicto dudoso del modelo chico: decide el modelo del Genio
+            # (solo si todavía no se publicó, para no avanzar dos veces)
+            is_correct, feedback, confidence = answer_grader(
+                client,
+                deployments["genie"],
+                user_answer,
+                question['answer'],
+                question['question'],
+                **grading
+            )
+    except PartialGradingError as error:
+        # Veredicto ya publicado pero mensaje cortado: se usa sin memorizarlo
+        return error.is_correct, error.feedback
+    except LLMUnavailableError:
+        # Modelo no disponible: comparación local de respaldo (no se memoriza)
+        return resolved(*fallback_grade(user_answer, question, persona))
+    if not (structured and is_doubtful(confidence)):
+        cache.put(key, is_correct, feedback)
+    return is_correct, feedback
+
+def ask_genie(client, deployment_name, question, user_query=None, persona=None, catalog=None):
+    """
+    Obtener la respuesta del Genio para la pregunta actual.
+    
+    Sin una consulta concreta, la explicación de las pistas se sirve desde el
+    pool de respuestas precalculadas; con consulta (o si el pool no tiene
+    ninguna variante), se genera en vivo con streaming. Si la sesión se acerca
+    a su presupuesto de tokens (contando lo que costaría esta llamada, según
+    los tokens precalculados del catálogo), las respuestas en vivo son cortas;
+    si lo agotó, el Genio solo usa respuestas precalculadas o enlatadas.
+    
+    Returns:
+        str o generador: Respuesta precalculada o fragmentos de la respuesta en vivo
+    """
+    # Índice de la última pista revelada (-1 si no hay ninguna)
+    revealed = [i for i in st.session_state[KEY_REVEALED_CLUES] if i < len(question['clues'])]
+    clue_index = len(revealed) - 1 if revealed else -1
+    scope = usage_scope(question)
+    upcoming = 0
+    if catalog is not None:
+        upcoming = (
+            genie_prompt_tokens(catalog, question['id'], clue_index, user_query)
+            + genie_max_tokens(clue_index, user_query)
+        )
+    budget = budget_state(scope["session_id"], upcoming)
+    
+    if user_query and user_query.strip():
+        if budget == BUDGET_EXHAUSTED:
+            return genie_budget_message(persona)
+        return clue_assistant(
+            client,
+            deployment_name,
+            question['clues'],
+            question['question'],
+            clue_index,
+            user_query,
+            stream=True,
+            persona=persona,
+            brief=budget == BUDGET_SHORT,
+            usage_scope=scope
+        )
+    
+    pool = get_genie_pool()
+    response = pool.lookup(client, deployment_name, question, clue_index, persona, scope)
+    if response is not None:
+        return response
+    if budget == BUDGET_EXHAUSTED:
+        return genie_budget_message(persona)
+    if budget == BUDGET_SHORT:
+        # La versión corta no se guarda en el pool (es otro prompt)
+        return clue_assistant(
+            client, deployment_name, question['clues'], question['question'], clue_index,
+            stream=True, persona=persona, brief=True, usage_scope=scope
+        )
+    return pool.stream_response(client, deployment_name, question, clue_index, persona, scope)
+
+def show_genie(response):
+    """
+    Abrir el diálogo del Genio con una respuesta ya lista o en streaming.
+    """
+    if isinstance(response, str):
+        st.session_state[KEY_GENIUS_RESPONSE] = response
+        genius_dialog(response)
+    else:
+        genius_dialog(stream=response)
+
 def get_credentials():
     """Obtener credenciales para la API de Azure OpenAI."""
     try:
@@ -122,79 +458,73 @@ def get_credentials():
     
     return api_key, endpoint, api_version, deployment_name
 
-def main():
-    # Configurar la página
-    st.set_page_config(
-        page_title="Regalo Misterioso 🎁",
-        page_icon="🎁",
-        layout="centered",
-        initial_sidebar_state="collapsed"
-    )
+def get_deployments(deployment_name):
+    """
+    Deployment de cada agente: uno chico y rápido para evaluar respuestas y uno
+    más rico para el Genio.
     
-    # Usar el tema oscuro
-    st.markdown("""
-        <style>
-            [data-testid="stAppViewContainer"] {
-                background: linear-gradient(135deg, #2a0845, #6441A5);
-            }
-        </style>
-    """, unsafe_allow_html=True)
+    Se configuran con AZURE_OPENAI_GRADER_DEPLOYMENT y AZURE_OPENAI_GENIE_DEPLOYMENT
+    (en los secrets de Streamlit o en variables de entorno); los que falten usan
+    `deployment_name`.
     
-    # Cargar estilos CSS
-    load_css()
-    
-    # Botón de reinicio (arriba a la derecha)
-    reset_button_js()
-    
-    # Inicializar el estado de la sesión
-    initialize_session()
-    
-    # Verificar si se solicitó un reinicio
-    if 'reset' in st.query_params and st.query_params['reset'] == 'true':
-        reset_game()
-        st.query_params.clear()
+    Returns:
+        dict: Deployment por agente ("grader" y "genie")
+    """
+    deployments = {}
+    for agent, setting in (("grader", "AZURE_OPENAI_GRADER_DEPLOYMENT"), ("genie", "AZURE_OPENAI_GENIE_DEPLOYMENT")):
+        try:
+            deployments[agent] = st.secrets["azure_openai"][setting]
+        except Exception:
+            deployments[agent] = os.getenv(setting)
+        deployments[agent] = deployments[agent] or deployment_name
+    return deployments
+
+def get_backends(api_key, endpoint, api_version):
+    """
+    Obtener la lista de endpoints/deployments de Azure OpenAI entre los que repartir el tráfico.
     
-    # Obtener credenciales
-    api_key, endpoint, api_version, deployment_name = get_credentials()
+    Se configura con `[[azure_openai.backends]]` en los secrets de Streamlit o
+    con la variable AZURE_OPENAI_BACKENDS (lista JSON). Cada entrada tiene
+    `endpoint` y opcionalmente `deployment`, `weight`, `api_key` y
+    `api_version` (por defecto, los valores generales). Sin configuración se usa
+    el endpoint único.
     
-    # Inicializar el cliente de OpenAI para Azure
-    client = initialize_client(api_key, api_version, endpoint)
+    Returns:
+        list: Backends normalizados (dicts)
+    """
+    try:
+        entries = st.secrets["azure_openai"]["backends"]
+    except Exception:
+        entries = json.loads(os.getenv("AZURE_OPENAI_BACKENDS") or "[]")
     
-    # Cargar datos
-    clues_data = load_clues()
+    backends = []
+    for entry in entries:
+        backends.append({
+            "endpoint": entry["endpoint"],
+            "api_key": entry.get("api_key", api_key),
+            "api_version": entry.get("api_version", api_version),
+            "deployment": entry.get("deployment"),
+            "weight": float(entry.get("weight", 1)),
+        })
     
+    if not backends:
+        backends.append({"endpoint": endpoint, "api_key": api_key, "api_version": api_version})
+    return backends
+
+def render_page(client, deployments, catalog, persona, mode=GRADING_PREFIX):
+    """Dibujar la página del juego y procesar las acciones del jugador."""
     # PRIMERO: Verificar si hay una consulta pendiente al genio
     if st.session_state.get(KEY_PENDING_GENIUS_QUERY) is not None:
-        # Mostrar SOLO un spinner a pantalla completa y nada más
-        with st.spinner("El Genio está pensando..."):
-            current_question = get_current_question(clues_data)
-            
-            # Obtener pistas reveladas para el asistente
-            revealed_clues_content = []
-            for i in st.session_state[KEY_REVEALED_CLUES]:
-                if i < len(current_question['clues']):
-                    revealed_clues_content.append(current_question['clues'][i])
-            
-            # Obtener respuesta del Genio
-            user_query = st.session_state[KEY_PENDING_GENIUS_QUERY]
-            genius_response = clue_assistant(
-                client,
-                deployment_name,
-                current_question['clues'],
-                current_question['question'],
-                len(revealed_clues_content) - 1 if revealed_clues_content else -1,
-                user_query
-            )
-            
-            # Guardar la respuesta y limpiar la consulta pendiente
-            st.session_state[KEY_GENIUS_RESPONSE] = genius_response
-            st.session_state[KEY_SHOW_GENIUS] = True
-            st.session_state[KEY_PENDING_GENIUS_QUERY] = None
-
-        # Mostrar el diálogo inmediatamente después de obtener la respuesta
-        if st.session_state[KEY_SHOW_GENIUS] and st.session_state[KEY_GENIUS_RESPONSE]:
-            genius_dialog(st.session_state[KEY_GENIUS_RESPONSE])
-            # No hacer rerun aquí para evitar bucles
+        current_question = get_current_question(catalog)
+        
+        # Obtener respuesta del Genio y limpiar la consulta pendiente
+        user_query = st.session_state[KEY_PENDING_GENIUS_QUERY]
+        st.session_state[KEY_PENDING_GENIUS_QUERY] = None
+        st.session_state[KEY_GENIUS_RESPONSE] = ""
+        
+        # Mostrar el diálogo inmediatamente; el texto llega en streaming
+        # No hacer rerun aquí para evitar bucles
+        show_genie(ask_genie(client, deployments["genie"], current_question, user_query, persona, catalog))
         
         # Detener la ejecución aquí para no mostrar el resto de la interfaz
         st.stop()
@@ -206,9 +536,9 @@ def main():
     
     # Mensaje de bienvenida si no hay preguntas completadas
     if not st.session_state[KEY_COMPLETED_QUESTIONS]:
-        st.markdown("""
+        st.markdown(f"""
         <div class="welcome-box">
-            <h3>¡Bienvenida, Claude! 👋</h3>
+            <h3>¡Bienvenida, {persona['name']}! 👋</h3>
             <h5>¿Estás lista para el desafío? 🔍🕵️‍♀️ </h5>
             <p>Te espera una aventura llena de misterios y acertijos. Cada respuesta correcta te acercará más a descubrir tu regalo de cumpleaños.</p>
             <p>¿Estás lista para comenzar este viaje de recuerdos? El Genio estará aquí para ayudarte si necesitás una mano.</p>
@@ -216,43 +546,27 @@ def main():
         """, unsafe_allow_html=True)
     
     # Verificar si el juego se ha completado
-    if len(st.session_state[KEY_COMPLETED_QUESTIONS]) >= clues_data["total_questions"]:
+    if len(st.session_state[KEY_COMPLETED_QUESTIONS]) >= catalog.total_questions:
         if not st.session_state[KEY_GAME_COMPLETED]:
             st.session_state[KEY_GAME_COMPLETED] = True
             
-        st.markdown("""
-        <div class="success-box">
-            <h2>¡Felicitaciones! 🎉</h2>
-            <p>¡Has completado todos los acertijos exitosamente! 🌟</p>
-            <h3>Información importante sobre tu regalo 🎁</h3>
-            <p>Por favor prepara:</p>
-            <ul>
-            <li>🧳 Una maleta pequeña con ropa para 3 días</li>
-            <li>👗 Ropa elegante y cómoda (no de gala)</li>
-            <li>🏊‍♀️ Tu bañador/traje de baño</li>
-            <li>⛳ Tu kit completo de golf y ropa de golf</li>
-            </ul>
-            <h3>Punto de encuentro 📍</h3>
-            <p>🚗 Debes estar en tu coche en la estación de Sens</p>
-            <p>📅 El día de tu cumpleaños</p>
-            <p>⏰ A las 14:30 horas</p>
-            <p>¡Prepárate para una sorpresa inolvidable! ✨</p>
-        </div>
-        """, unsafe_allow_html=True)
+        finale_html = (catalog.finale or DEFAULT_FINALE_HTML).strip()
+        st.markdown(f'<div class="success-box">{finale_html}</div>', unsafe_allow_html=True)
         
         st.balloons()
         return
     
     # Obtener pregunta actual
-    current_question = get_current_question(clues_data)
+    current_question = get_current_question(catalog)
     
     if not current_question:
         st.error("¡Ups! No se pudo encontrar la pregunta actual. Por favor, reinicia la aplicación.")
         return
     
     # Mostrar información sobre el progreso
-    progress_text = f"Acertijo {current_question['id']} de {clues_data['total_questions']}"
-    st.progress(float(current_question['id']) / float(clues_data['total_questions']))
+    question_position = catalog.position(current_question['id'])
+    progress_text = f"Acertijo {question_position} de {catalog.total_questions}"
+    st.progress(min(1.0, float(question_position) / float(catalog.total_questions)))
     st.markdown(f"<p style='text-align: center;'>{progress_text}</p>", unsafe_allow_html=True)
     
     # Si hay un mensaje del Genio para mostrar
@@ -269,45 +583,8 @@ def main():
     </div>
     """, unsafe_allow_html=True)
     
-    # Sección para pistas
-    # Sección para pistas
-    st.markdown("### Pistas disponibles:")
-    
-    # Mostrar indicadores de pistas disponibles
-    max_clues = len(current_question.get('clues', []))
-    
-    # Crear un contenedor flexible para los indicadores
-    st.markdown('<div class="clue-indicators">', unsafe_allow_html=True)
-    
-    # Crear columnas en una sola fila para los indicadores
-    cols = st.columns(max_clues)
-    for i, col in enumerate(cols):
-        with col:
-            # Determinar si esta pista está encendida o apagada
-            is_revealed = i in st.session_state[KEY_REVEALED_CLUES]
-            is_next = i == len(st.session_state[KEY_REVEALED_CLUES])
-            
-            css_class = "clue-on" if is_revealed else "clue-off"
-            
-            # Solo habilitar clic para la siguiente pista disponible
-            if is_next:
-                if st.button("💡", key=f"clue_{i}"):
-                    st.session_state[KEY_REVEALED_CLUES].append(i)
-                    st.rerun()
-            else:
-                st.markdown(f'<div class="clue-container"><span class="clue-bulb {css_class}">💡</span></div>', unsafe_allow_html=True)
-    
-    st.markdown('</div>', unsafe_allow_html=True)
-    
-    # Mostrar pistas ya reveladas
-    if st.session_state[KEY_REVEALED_CLUES]:
-        for i in st.session_state[KEY_REVEALED_CLUES]:
-            if i < max_clues:
-                st.markdown(f"""
-                <div class="clue-box">
-                    <p>🔍 {current_question['clues'][i]}</p>
-                </div>
-                """, unsafe_allow_html=True)
+    # Sección para pistas (se re-ejecuta sola al encender un foco)
+    clue_panel(current_question)
     
     # Área para ingresar respuesta
     st.markdown("### Tu respuesta:")
@@ -338,71 +615,106 @@ def main():
         st.session_state[KEY_SHOW_GENIUS] = False
         st.session_state[KEY_GENIUS_RESPONSE] = ""
         
-        # Evaluar la respuesta
-        is_correct, feedback = answer_grader(
-            client, 
-            deployment_name, 
-            user_answer, 
-            current_question['answer'], 
-            current_question['question']
-        )
+        def on_verdict(verdict):
+            # SOLO si es correcta, avanzar a la siguiente pregunta apenas se conoce
+            # el veredicto, sin esperar el resto del mensaje del modelo
+            if verdict:
+                complete_question(catalog, current_question)
         
-        # Verificación adicional para asegurarse de que la respuesta está correctamente clasificada
-        feedback_text = feedback.strip()
-        is_correct = feedback_text.startswith("CORRECTO")
+        # Evaluar la respuesta (localmente si es obvia, si no con el LLM)
+        is_correct, feedback = grade_answer(
+            client,
+            deployments,
+            current_question,
+            user_answer,
+            on_verdict=on_verdict,
+            persona=persona,
+            mode=mode
+        )
         
-        # Guardar el resultado y feedback
-        st.session_state[KEY_IS_CORRECT] = is_correct
-        st.session_state[KEY_FEEDBACK] = feedback
-        st.session_state[KEY_SUBMITTED] = True
+        # Guardar el resultado y feedback (si es correcta el estado ya avanzó)
+        if not is_correct:
+            st.session_state[KEY_IS_CORRECT] = False
+            st.session_state[KEY_FEEDBACK] = feedback
+            st.session_state[KEY_SUBMITTED] = True
         st.snow()
         
-        # SOLO si es correcta, avanzar a la siguiente pregunta
         if is_correct:
-            # Agregar a preguntas completadas y avanzar
-            if current_question['id'] not in st.session_state[KEY_COMPLETED_QUESTIONS]:
-                st.session_state[KEY_COMPLETED_QUESTIONS].append(current_question['id'])
-            
-            # Efecto de celebración con mensaje y pequeña pausa
-            st.balloons()
-            
             # Agregar un mensaje de éxito para confirmar visualmente
             st.success("¡Respuesta correcta! Avanzando al siguiente acertijo...")
             
-            # Pequeña pausa para dar tiempo a que se muestren los globos
-            import time
-            time.sleep(1.5)
-            
-            # Avanzar a la siguiente pregunta
-            advance_to_next_question()
-            st.rerun()
+            # Mostrar la siguiente pregunta (el estado ya avanzó) después de
+            # dar tiempo a que se vean los globos, sin dormir el hilo del script
+            st.session_state[KEY_PENDING_TRANSITION] = True
+            celebration_transition()
 
-    # Procesar solicitud de ayuda al Genio
-    if help_button and user_answer:
+    # Procesar solicitud de ayuda al Genio (sin texto, explica las pistas reveladas)
+    if help_button:
         # Limpiar cualquier estado previo del genio
         st.session_state[KEY_SHOW_GENIUS] = False
         st.session_state[KEY_GENIUS_RESPONSE] = ""
         
-        # Obtener pistas reveladas para el asistente
-        revealed_clues_content = []
-        for i in st.session_state[KEY_REVEALED_CLUES]:
-            if i < len(current_question['clues']):
-                revealed_clues_content.append(current_question['clues'][i])
-        
-        # Obtener respuesta del Genio (ahora sin streaming visible)
-        genius_response = clue_assistant(
-            client,
-            deployment_name,
-            current_question['clues'],
-            current_question['question'],
-            len(revealed_clues_content) - 1 if revealed_clues_content else -1,
-            user_answer
+        # Abrir el diálogo del Genio y mostrar su respuesta a medida que llega
+        # (queda guardada en KEY_GENIUS_RESPONSE al terminar)
+        show_genie(ask_genie(client, deployments["genie"], current_question, user_answer, persona, catalog))
+
+def main():
+    with span("rerun.setup"):
+        # Configurar la página
+        st.set_page_config(
+            page_title="Regalo Misterioso 🎁",
+            page_icon="🎁",
+            layout="centered",
+            initial_sidebar_state="collapsed"
         )
         
-        # Guardar la respuesta del Genio y activar su visualización
-        st.session_state[KEY_GENIUS_RESPONSE] = genius_response
-        st.session_state[KEY_SHOW_GENIUS] = True
-        st.rerun()
+        # Cargar estilos CSS (incluye el fondo del tema oscuro)
+        load_css()
+        
+        # Botón de reinicio (arriba a la derecha)
+        reset_button_js()
+    
+    with span("rerun.catalog"):
+        # Cargar la búsqueda pedida en la URL (se carga recién al primer acceso)
+        hunt_id = get_hunt_id()
+        try:
+            catalog = load_catalog(hunt_id)
+        except clue_catalog.UnknownHuntError:
+            st.error("¡Ups! No encontramos esa búsqueda. Revisá el enlace que te compartieron.")
+            st.stop()
+        persona = catalog.persona
+    
+    with span("rerun.session"):
+        # Inicializar el estado de la sesión
+        initialize_session(catalog, hunt_id)
+        
+        # Verificar si se solicitó un reinicio
+        if 'reset' in st.query_params and st.query_params['reset'] == 'true':
+            # Conservar el token del jugador en la URL
+            del st.query_params['reset']
+            reset_game(catalog)
+    
+    with span("rerun.client"):
+        # Obtener credenciales
+        api_key, endpoint, api_version, deployment_name = get_credentials()
+        deployments = get_deployments(deployment_name)
+        # Evaluación estructurada (JSON) si la versión de la API la acepta
+        mode = grading_mode(api_version)
+        
+        # Inicializar el cliente de OpenAI para Azure
+        try:
+            client = initialize_client(
+                api_key, api_version, endpoint,
+                backends=get_backends(api_key, endpoint, api_version),
+                deployments=deployments.values()
+            )
+        except GatewayConfigurationError as error:
+            st.error(f"La configuración de Azure OpenAI no es válida: {error}")
+            st.stop()
+    
+    with span("rerun.render"):
+        render_page(client, deployments, catalog, persona, mode)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with span("rerun"):
+        main()
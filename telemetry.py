@@ -0,0 +1,390 @@
+"""
+Módulo de instrumentación: tiempos de cada fase de un rerun y de cada llamada LLM.
+
+Se activa con METRICS_EXPORT:
+- "" (por defecto): apagado; `span()` y `llm_call()` devuelven objetos vacíos
+  compartidos, así que el costo es una comparación por llamada.
+- "jsonl": cada medición se agrega como una línea JSON en METRICS_PATH.
+- "prometheus": se exponen histogramas y contadores en formato de texto de
+  Prometheus en http://<host>:METRICS_PORT/metrics.
+
+Métricas:
+- regalo_span_seconds{span}: duración de cada fase de main()
+- regalo_llm_ttft_seconds{agent}: tiempo hasta el primer token
+- regalo_llm_latency_seconds{agent}: duración total de la llamada
+- regalo_llm_tokens_total{agent,kind}: tokens de entrada (prompt) y salida (completion)
+- regalo_llm_errors_total{agent}: llamadas que terminaron con error
+- regalo_progress_flush_errors_total: volcados del progreso que fallaron
+- regalo_grading_cache_lookups_total{result}: búsquedas en el caché de
+  evaluaciones ("hit", "disk_hit" o "miss")
+- regalo_grading_cache_entries: evaluaciones en la memoria del caché
+"""
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from prompts import count_tokens, messages_tokens
+from usage_ledger import usage_counts
+
+# "", "jsonl" o "prometheus"
+DEFAULT_EXPORT = os.getenv("METRICS_EXPORT", "").strip().lower()
+DEFAULT_METRICS_PATH = os.getenv("METRICS_PATH", "metrics.jsonl")
+DEFAULT_METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+METRIC_PREFIX = "regalo_"
+# Límites (segundos) de los histogramas de latencia
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _Histogram:
+    """Histograma acumulativo de una serie (métrica + etiquetas)."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+
+
+def _format_labels(labels, extra=None):
+    """Etiquetas en formato Prometheus ({a="x",b="y"})."""
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{str(value)}"' for key, value in items) + "}"
+
+
+class MetricsRegistry:
+    """Contadores e histogramas en memoria, con exportación opcional a JSONL."""
+
+    def __init__(self, jsonl_path=None):
+        """
+        Args:
+            jsonl_path (str): Archivo donde agregar cada medición (None para no escribir)
+        """
+        self.jsonl_path = jsonl_path
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+
+    def _write_event(self, event):
+        """Agregar una medición al archivo JSONL (se llama con el lock tomado)."""
+        if not self.jsonl_path:
+            return
+        with open(self.jsonl_path, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+    def observe(self, name, value, **labels):
+        """
+        Registrar un valor en un histograma.
+
+        Args:
+            name (str): Nombre de la métrica (sin prefijo)
+            value (float): Valor observado
+            **labels: Etiquetas de la serie
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(LATENCY_BUCKETS)
+            histogram.observe(value)
+            self._write_event({"ts": time.time(), "metric": name, "value": value, **labels})
+
+    def increment(self, name, value=1, **labels):
+        """
+        Sumar a un contador.
+
+        Args:
+            name (str): Nombre de la métrica (sin prefijo)
+            value (float): Incremento
+            **labels: Etiquetas de la serie
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+            self._write_event({"ts": time.time(), "metric": name, "value": value, **labels})
+
+    def set(self, name, value, **labels):
+        """
+        Fijar el valor actual de un indicador (gauge).
+
+        Args:
+            name (str): Nombre de la métrica (sin prefijo)
+            value (float): Valor actual
+            **labels: Etiquetas de la serie
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if self._gauges.get(key) == value:
+                return
+            self._gauges[key] = value
+            self._write_event({"ts": time.time(), "metric": name, "value": value, **labels})
+
+    def render_prometheus(self):
+        """
+        Todas las series en formato de texto de Prometheus.
+
+        Returns:
+            str: Cuerpo de la respuesta de /metrics
+        """
+        lines = []
+        with self._lock:
+            for name in sorted({key[0] for key in self._histograms}):
+                metric = METRIC_PREFIX + name
+                lines.append(f"# TYPE {metric} histogram")
+                for (series, labels), histogram in sorted(self._histograms.items()):
+                    if series != name:
+                        continue
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f"{metric}_bucket{_format_labels(labels, ('le', bound))} {count}")
+                    lines.append(f"{metric}_bucket{_format_labels(labels, ('le', '+Inf'))} {histogram.count}")
+                    lines.append(f"{metric}_sum{_format_labels(labels)} {histogram.total}")
+                    lines.append(f"{metric}_count{_format_labels(labels)} {histogram.count}")
+            for name in sorted({key[0] for key in self._counters}):
+                metric = METRIC_PREFIX + name
+                lines.append(f"# TYPE {metric} counter")
+                for (series, labels), value in sorted(self._counters.items()):
+                    if series == name:
+                        lines.append(f"{metric}{_format_labels(labels)} {value}")
+            for name in sorted({key[0] for key in self._gauges}):
+                metric = METRIC_PREFIX + name
+                lines.append(f"# TYPE {metric} gauge")
+                for (series, labels), value in sorted(self._gauges.items()):
+                    if series == name:
+                        lines.append(f"{metric}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """
+        Resumen de los histogramas (para scripts y benchmarks).
+
+        Returns:
+            dict: "métrica{etiquetas}" -> {"count", "sum"}
+        """
+        with self._lock:
+            return {
+                f"{name}{_format_labels(labels)}": {"count": histogram.count, "sum": histogram.total}
+                for (name, labels), histogram in self._histograms.items()
+            }
+
+
+class _Span:
+    """Mide la duración de un bloque y la registra en regalo_span_seconds."""
+
+    __slots__ = ("registry", "name", "started")
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        # También se mide si el bloque termina con st.stop() / st.rerun() (excepciones)
+        self.registry.observe("span_seconds", time.perf_counter() - self.started, span=self.name)
+        return False
+
+
+class LLMCall:
+    """Seguimiento de una llamada al modelo: TTFT, duración total y tokens."""
+
+    def __init__(self, registry, agent, messages=()):
+        """
+        Args:
+            registry (MetricsRegistry): Registro de métricas
+            agent (str): Agente que hace la llamada ("grader", "genie", ...)
+            messages (list): Mensajes enviados al modelo
+        """
+        self.registry = registry
+        self.agent = agent
+        self.messages = messages
+        self.started = time.perf_counter()
+        self._first_token = False
+
+    def first_token(self):
+        """Marcar la llegada del primer fragmento de texto (solo cuenta la primera vez)."""
+        if not self._first_token:
+            self._first_token = True
+            self.registry.observe("llm_ttft_seconds", time.perf_counter() - self.started, agent=self.agent)
+
+    def finish(self, completion="", usage=None):
+        """
+        Registrar el final de la llamada.
+
+        Args:
+            completion (str): Texto generado por el modelo
+            usage: Uso informado por el modelo (si falta, se estiman los tokens)
+        """
+        self.registry.observe("llm_latency_seconds", time.perf_counter() - self.started, agent=self.agent)
+        counts = usage_counts(usage) or (messages_tokens(self.messages), count_tokens(completion), 0)
+        self.registry.increment("llm_tokens_total", counts[0], agent=self.agent, kind="prompt")
+        self.registry.increment("llm_tokens_total", counts[1], agent=self.agent, kind="completion")
+
+    def fail(self):
+        """Registrar una llamada que terminó con error."""
+        self.registry.increment("llm_errors_total", agent=self.agent)
+
+
+class _NoopSpan:
+    """Span vacío que se usa cuando la instrumentación está apagada."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class _NoopLLMCall:
+    """Seguimiento vacío que se usa cuando la instrumentación está apagada."""
+
+    __slots__ = ()
+
+    def first_token(self):
+        pass
+
+    def finish(self, completion="", usage=None):
+        pass
+
+    def fail(self):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+_NOOP_LLM_CALL = _NoopLLMCall()
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """Sirve /metrics en formato de texto de Prometheus."""
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = get_registry().render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # No ensuciar la salida de Streamlit con cada scrape
+        pass
+
+
+def _start_prometheus_server(port):
+    """Levantar el endpoint /metrics en un hilo en segundo plano."""
+    server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-exporter", daemon=True).start()
+    return server
+
+
+def get_registry():
+    """
+    Registro de métricas compartido por el proceso (None si está apagado).
+
+    Returns:
+        MetricsRegistry: Registro configurado con METRICS_EXPORT / METRICS_PATH / METRICS_PORT
+    """
+    global _registry
+    if not DEFAULT_EXPORT:
+        return None
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                if DEFAULT_EXPORT == "jsonl":
+                    registry = MetricsRegistry(jsonl_path=DEFAULT_METRICS_PATH)
+                elif DEFAULT_EXPORT == "prometheus":
+                    registry = MetricsRegistry()
+                    _start_prometheus_server(DEFAULT_METRICS_PORT)
+                else:
+                    raise ValueError(f"METRICS_EXPORT desconocido: {DEFAULT_EXPORT}")
+                _registry = registry
+    return _registry
+
+
+def span(name):
+    """
+    Medir la duración de un bloque (`with span("rerun.catalog"): ...`).
+
+    Args:
+        name (str): Nombre de la fase
+
+    Returns:
+        Context manager que registra la duración (vacío si está apagado)
+    """
+    registry = get_registry()
+    if registry is None:
+        return _NOOP_SPAN
+    return _Span(registry, name)
+
+
+def llm_call(agent, messages=()):
+    """
+    Empezar el seguimiento de una llamada al modelo.
+
+    Los tokens se cuentan recién al terminar y solo si la instrumentación está activa.
+
+    Args:
+        agent (str): Agente que hace la llamada ("grader", "genie", ...)
+        messages (list): Mensajes enviados al modelo
+
+    Returns:
+        LLMCall: Seguimiento de la llamada (vacío si está apagado)
+    """
+    registry = get_registry()
+    if registry is None:
+        return _NOOP_LLM_CALL
+    return LLMCall(registry, agent, messages)
+
+
+def count(name, value=1, **labels):
+    """
+    Sumar a un contador de eventos operativos (no hace nada si está apagado).
+
+    Args:
+        name (str): Nombre de la métrica (sin prefijo)
+        value (float): Incremento
+        **labels: Etiquetas de la serie
+    """
+    registry = get_registry()
+    if registry is not None:
+        registry.increment(name, value, **labels)
+
+
+def gauge(name, value, **labels):
+    """
+    Fijar el valor actual de un indicador (no hace nada si está apagado).
+
+    Args:
+        name (str): Nombre de la métrica (sin prefijo)
+        value (float): Valor actual
+        **labels: Etiquetas de la serie
+    """
+    registry = get_registry()
+    if registry is not None:
+        registry.set(name, value, **labels)
+
+
+def enabled():
+    """Indicar si la instrumentación está activa."""
+    return bool(DEFAULT_EXPORT)
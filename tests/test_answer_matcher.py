@@ -0,0 +1,61 @@
+"""Pruebas de la evaluación local de respuestas."""
+import pytest
+
+from answer_matcher import quick_feedback, quick_grade
+
+
+def question(answer, *aliases):
+    return {"id": "1", "question": "¿?", "answer": answer, "aliases": list(aliases)}
+
+
+@pytest.mark.parametrize("answer, user", [
+    ("REU 82", "reu82"),
+    ("REU 82", "82"),
+    ("6 veces", "seis"),
+    ("Bariloche", "bariloche"),
+    ("Bariloche", "Bariloce"),
+    ("Mar del Plata", "mar de plata"),
+    ("Mar del Plata", "Mar del Plato"),
+    ("Córdoba (la docta)", "la docta"),
+])
+def test_obvious_answers_are_correct(answer, user):
+    assert quick_grade(user, question(answer)) is True
+
+
+def test_aliases_are_accepted():
+    assert quick_grade("Bari", question("San Carlos de Bariloche", "Bari")) is True
+
+
+def test_another_number_is_incorrect():
+    assert quick_grade("REU 81", question("REU 82")) is False
+    assert quick_grade("7", question("6 veces")) is False
+
+
+@pytest.mark.parametrize("answer, user", [
+    ("6 veces", "entre 5 y 7"),
+    ("6 veces", "5 o 6"),
+    ("REU 82", "REU 082"),
+])
+def test_ranges_and_ambiguous_numbers_go_to_the_llm(answer, user):
+    assert quick_grade(user, question(answer)) is None
+
+
+@pytest.mark.parametrize("answer, user", [
+    ("Iglesia de Santa Rosa de Lima", "Iglesia de Santa Rita de Lima"),
+    ("Hospital Italiano de Buenos Aires", "Hospital Aleman de Buenos Aires"),
+    ("Juan Carlos Perez", "Juan Carlos Gomez"),
+])
+def test_replacing_a_word_is_not_a_typo(answer, user):
+    assert quick_grade(user, question(answer)) is not True
+
+
+def test_empty_answer_goes_to_the_llm():
+    assert quick_grade("  ¿? ", question("Bariloche")) is None
+
+
+def test_feedback_uses_the_persona_name():
+    persona = {"name": "Marta", "description": "una tía de Rosario", "authors": "sus sobrinos"}
+    message = quick_feedback(True, persona)
+    assert message.startswith("CORRECTO!")
+    assert "{name}" not in message
+    assert quick_feedback(False, persona).startswith("INCORRECTO.")
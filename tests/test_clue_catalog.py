@@ -0,0 +1,79 @@
+"""Pruebas del catálogo de pistas y de la elección de búsquedas."""
+import os
+
+import pytest
+
+import clue_catalog
+from clue_catalog import (
+    DEFAULT_CLUES_PATH,
+    CatalogValidationError,
+    UnknownHuntError,
+    hunt_path,
+    load_catalog,
+    validate_catalog,
+)
+
+CLUES = """\
+total_questions: 1
+questions:
+  - id: 1
+    question: "¿Dónde nos conocimos?"
+    answer: "REU 82"
+    clues:
+      - "Fue en una reunión"
+"""
+
+
+@pytest.fixture
+def hunts_dir(tmp_path):
+    hunt = tmp_path / "cumple-marta"
+    hunt.mkdir()
+    (hunt / "clues.yaml").write_text(CLUES, encoding="utf-8")
+    return tmp_path
+
+
+def test_hunt_path_of_an_existing_hunt(hunts_dir):
+    assert hunt_path("cumple-marta", str(hunts_dir)) == str(hunts_dir / "cumple-marta" / "clues.yaml")
+
+
+@pytest.mark.parametrize("hunt_id", [None, ""])
+def test_without_hunt_the_default_clues_are_used(hunt_id, hunts_dir):
+    assert hunt_path(hunt_id, str(hunts_dir)) == DEFAULT_CLUES_PATH
+
+
+@pytest.mark.parametrize("hunt_id", ["../cumple-marta", "cumple-marta/../..", "/etc", "a b", "x" * 65, "..", "otra"])
+def test_invalid_or_unknown_hunts_are_rejected(hunt_id, hunts_dir):
+    with pytest.raises(UnknownHuntError):
+        hunt_path(hunt_id, str(hunts_dir))
+
+
+def test_validation_reports_every_problem():
+    data = {
+        "total_questions": 3,
+        "questions": [
+            {"id": 1, "question": "¿?", "answer": "", "clues": ["pista"]},
+            {"id": 1, "question": "¿?", "answer": "sí", "clues": []},
+        ],
+    }
+    with pytest.raises(CatalogValidationError) as excinfo:
+        validate_catalog(data)
+    assert len(excinfo.value.errors) == 4
+
+
+def test_catalog_is_reused_until_the_file_changes(tmp_path):
+    path = tmp_path / "clues.yaml"
+    path.write_text(CLUES, encoding="utf-8")
+    clue_catalog.clear_cache()
+    try:
+        first = load_catalog(str(path))
+        assert load_catalog(str(path)) is first
+
+        path.write_text(CLUES.replace("REU 82", "REU 83"), encoding="utf-8")
+        # Mismo tamaño: el cambio se detecta por el mtime
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+        second = load_catalog(str(path))
+        assert second is not first
+        assert second.get(1)["answer"] == "REU 83"
+    finally:
+        clue_catalog.clear_cache()
@@ -0,0 +1,134 @@
+"""Pruebas del búfer de escritura del progreso y de la migración del YAML."""
+import threading
+
+import pytest
+
+import game_manager
+from game_manager import ProgressWriteBuffer
+from progress_store import MemoryProgressStore, set_progress_store
+
+
+class FlakyStore(MemoryProgressStore):
+    """Almacén en memoria que puede fallar o bloquearse durante save_many."""
+
+    def __init__(self):
+        super().__init__()
+        self.fail = False
+        self.during_save = None
+
+    def save_many(self, updates):
+        if self.during_save is not None:
+            self.during_save()
+        if self.fail:
+            raise OSError("disco lleno")
+        super().save_many(updates)
+
+
+@pytest.fixture
+def store():
+    return FlakyStore()
+
+
+@pytest.fixture
+def buffer(store):
+    # Sin volcado periódico: cada prueba llama a flush() a mano
+    write_buffer = ProgressWriteBuffer(store=store, max_staleness=3600)
+    yield write_buffer
+    write_buffer._closed = True
+    write_buffer._wakeup.set()
+
+
+def progress(completed, current=1):
+    return {"completed_questions": list(completed), "current_question": current, "clues_revealed": 0}
+
+
+def test_put_keeps_completed_questions_of_the_pending_change(buffer):
+    buffer.put("ana", progress([1], current=2))
+    buffer.put("ana", progress([2], current=3))
+    assert buffer.get("ana")["completed_questions"] == [2, 1]
+
+
+def test_reset_replaces_the_pending_change(buffer):
+    buffer.put("ana", progress([1, 2], current=3))
+    buffer.put("ana", progress([], current=1), merge=False)
+    assert buffer.get("ana")["completed_questions"] == []
+
+
+def test_failed_flush_requeues_the_batch(buffer, store):
+    buffer.put("ana", progress([1], current=2))
+    store.fail = True
+    with pytest.raises(OSError):
+        buffer.flush()
+    assert buffer.get("ana")["completed_questions"] == [1]
+
+    store.fail = False
+    assert buffer.flush() == 1
+    assert store.load("ana")["completed_questions"] == [1]
+
+
+def test_failed_flush_merges_under_a_newer_change(buffer, store):
+    buffer.put("ana", progress([1], current=2))
+    store.fail = True
+    store.during_save = lambda: buffer.put("ana", progress([2], current=3))
+    with pytest.raises(OSError):
+        buffer.flush()
+    assert sorted(buffer.get("ana")["completed_questions"]) == [1, 2]
+
+
+def test_reset_queued_during_a_failed_flush_wins(buffer, store):
+    buffer.put("ana", progress([1, 2], current=3))
+    store.fail = True
+    store.during_save = lambda: buffer.put("ana", progress([], current=1), merge=False)
+    with pytest.raises(OSError):
+        buffer.flush()
+    assert buffer.get("ana")["completed_questions"] == []
+
+
+def test_batch_stays_visible_while_it_is_being_written(buffer, store):
+    seen = []
+    store.during_save = lambda: seen.append(buffer.get("ana"))
+    buffer.put("ana", progress([1], current=2))
+    buffer.flush()
+    assert seen[0]["completed_questions"] == [1]
+    # Ya confirmado: se lee del almacén
+    assert buffer.get("ana") is None
+
+
+def test_background_flush_failures_are_counted(store):
+    store.fail = True
+    flushed = threading.Event()
+    store.during_save = flushed.set
+    write_buffer = ProgressWriteBuffer(store=store, max_staleness=0.01)
+    try:
+        write_buffer.put("ana", progress([1], current=2))
+        assert flushed.wait(2)
+        for _ in range(200):
+            if write_buffer.errors:
+                break
+            flushed.wait(0.01)
+        assert write_buffer.errors >= 1
+        assert write_buffer.get("ana")["completed_questions"] == [1]
+    finally:
+        write_buffer._closed = True
+        write_buffer._wakeup.set()
+
+
+
+
+def test_legacy_progress_is_migrated_once(tmp_path, monkeypatch):
+    legacy = tmp_path / "progress.yaml"
+    legacy.write_text("completed_questions: [1]\ncurrent_question: 2\nclues_revealed: 0\n", encoding="utf-8")
+    monkeypatch.setattr(game_manager, "LEGACY_PROGRESS_PATH", str(legacy))
+    monkeypatch.setattr(game_manager, "_legacy_migrated", False)
+    store = MemoryProgressStore()
+    set_progress_store(store)
+    monkeypatch.setattr(game_manager, "_write_buffer", ProgressWriteBuffer(store=store, max_staleness=0))
+    try:
+        assert game_manager.load_progress()["completed_questions"] == [1]
+        assert store.load(game_manager.DEFAULT_PLAYER_ID)["completed_questions"] == [1]
+
+        # Después de migrar, el YAML ya no se lee
+        legacy.write_text("completed_questions: [9]\ncurrent_question: 9\nclues_revealed: 0\n", encoding="utf-8")
+        assert game_manager.load_progress()["completed_questions"] == [1]
+    finally:
+        set_progress_store(None)
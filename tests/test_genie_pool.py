@@ -0,0 +1,81 @@
+"""Pruebas del pool de respuestas precalculadas del Genio (sin llamar al modelo)."""
+import json
+import os
+
+import pytest
+
+from genie_pool import GeniePool, pool_key
+
+QUESTION = {"id": 1, "question": "¿Qué había en el ascensor?", "clues": ["Era verde", "Era chiquita"]}
+
+
+class FakeCatalog:
+    """Catálogo mínimo con las preguntas indicadas."""
+
+    persona = None
+
+    def __init__(self, *questions):
+        self._questions = {question["id"]: question for question in questions}
+        self.ids = tuple(self._questions)
+
+    def get(self, question_id):
+        return self._questions.get(question_id)
+
+
+@pytest.fixture
+def pool(tmp_path):
+    genie_pool = GeniePool(variants=2, path=str(tmp_path / "genie_pool.json"), workers=1, save_delay=3600)
+    yield genie_pool
+    genie_pool._executor.shutdown(wait=False)
+
+
+def test_editing_a_question_discards_its_old_variants(pool):
+    pool._add(pool_key(QUESTION, 0), "Pensá en algo verde")
+    edited = dict(QUESTION, clues=["Era verde", "Se comía"])
+    pool._add(pool_key(edited, 0), "Pensá en algo que se come")
+    assert list(pool._responses) == [pool_key(edited, 0)]
+
+
+def test_same_question_in_another_hunt_is_kept(pool):
+    pool._add(pool_key(QUESTION, 0), "Pensá en algo verde")
+    other = dict(QUESTION, question="¿Qué había en el auto?")
+    pool._add(pool_key(other, 0, hunt_id="cumple-ana"), "Mirá el asiento")
+    assert len(pool._responses) == 2
+
+
+def test_retain_drops_questions_no_longer_in_the_hunt(pool):
+    removed = {"id": 2, "question": "¿Y el perro?", "clues": []}
+    pool._add(pool_key(QUESTION, -1), "Explicación")
+    pool._add(pool_key(removed, -1), "Otra explicación")
+    pool._add(pool_key(removed, -1, hunt_id="cumple-ana"), "De otra búsqueda")
+    assert pool.retain(FakeCatalog(QUESTION)) == 1
+    assert pool_key(removed, -1, hunt_id="cumple-ana") in pool._responses
+
+
+def test_saves_are_batched(pool):
+    pool._add(pool_key(QUESTION, -1), "Una")
+    pool._add(pool_key(QUESTION, -1), "Otra")
+    # Nada se escribe hasta que vence la espera (o se llama a flush)
+    assert not os.path.exists(pool.path)
+    pool.flush()
+    with open(pool.path, encoding="utf-8") as file:
+        assert json.load(file) == {pool_key(QUESTION, -1): ["Una", "Otra"]}
+
+
+
+def test_corrupt_pool_file_starts_empty(tmp_path, caplog):
+    path = tmp_path / "genie_pool.json"
+    path.write_text('{"/1:abc:0": ["cortado', encoding="utf-8")
+    genie_pool = GeniePool(path=str(path), workers=1)
+    genie_pool._executor.shutdown(wait=False)
+    assert genie_pool._responses == {}
+    assert "no se pudo leer" in caplog.text
+
+
+def test_pool_file_with_another_shape_starts_empty(tmp_path, caplog):
+    path = tmp_path / "genie_pool.json"
+    path.write_text('["no", "es", "un", "objeto"]', encoding="utf-8")
+    genie_pool = GeniePool(path=str(path), workers=1)
+    genie_pool._executor.shutdown(wait=False)
+    assert genie_pool._responses == {}
+    assert "formato esperado" in caplog.text
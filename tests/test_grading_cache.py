@@ -0,0 +1,71 @@
+"""Pruebas del caché de evaluaciones."""
+import grading_cache
+from grading_cache import GradingCache, cache_key
+
+QUESTION = {"id": "1", "question": "¿Dónde nos conocimos?", "answer": "REU 82", "aliases": []}
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(grading_cache.time, "time", lambda: now[0])
+    cache = GradingCache(ttl=60)
+    cache.put("k", True, "¡Correcto!")
+    assert cache.get("k") == (True, "¡Correcto!")
+    now[0] += 61
+    assert cache.get("k") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = GradingCache(max_entries=2)
+    cache.put("a", True, "a")
+    cache.put("b", True, "b")
+    cache.get("a")
+    cache.put("c", True, "c")
+    assert cache.get("b") is None
+    assert cache.get("a") == (True, "a")
+    assert cache.stats()["entries"] == 2
+
+
+def test_disk_entry_survives_a_new_process(tmp_path):
+    path = str(tmp_path / "grading.db")
+    GradingCache(db_path=path).put("k", False, "Casi")
+    cache = GradingCache(db_path=path)
+    assert cache.get("k") == (False, "Casi")
+    assert cache.get("k") == (False, "Casi")
+    stats = cache.stats()
+    assert (stats["hits"], stats["disk_hits"], stats["misses"]) == (2, 1, 0)
+
+
+def test_disk_lookup_does_not_hold_the_cache_lock(tmp_path, monkeypatch):
+    cache = GradingCache(db_path=str(tmp_path / "grading.db"))
+    held = []
+    original = cache._load_from_disk
+
+    def load(key, now):
+        held.append(cache._lock.locked())
+        return original(key, now)
+
+    monkeypatch.setattr(cache, "_load_from_disk", load)
+    assert cache.get("k") is None
+    assert held == [False]
+
+
+def test_lookups_are_exported(monkeypatch):
+    counted = []
+    gauges = []
+    monkeypatch.setattr(grading_cache.telemetry, "count", lambda name, value=1, **labels: counted.append(labels["result"]))
+    monkeypatch.setattr(grading_cache.telemetry, "gauge", lambda name, value, **labels: gauges.append(value))
+    cache = GradingCache()
+    cache.get("k")
+    cache.put("k", True, "ok")
+    cache.get("k")
+    assert counted == ["miss", "hit"]
+    assert gauges == [1]
+
+
+def test_persona_changes_the_key():
+    plain = cache_key(QUESTION, "reu 82")
+    with_persona = cache_key(QUESTION, "reu 82", {"name": "Marta", "description": "una tía de Rosario", "authors": "sus sobrinos"})
+    assert plain != with_persona
+    assert plain == cache_key(QUESTION, "  REU 82 ")
@@ -0,0 +1,56 @@
+"""Pruebas de la pasarela LLM (sin red: se reemplaza la petición al modelo)."""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from llm_gateway import GatewayConfigurationError, GatewayTimeoutError, LLMGateway
+
+MESSAGES = [{"role": "user", "content": "¿Cuál es la respuesta?"}]
+
+
+@pytest.fixture
+def gateway():
+    backend = {"endpoint": "http://127.0.0.1:9", "api_key": "test", "api_version": "2024-10-21"}
+    return LLMGateway([backend], timeout=1.0)
+
+
+def test_timeout_of_one_waiter_does_not_cancel_the_shared_request(gateway):
+    async def slow_create(deployment_name, messages, params):
+        await asyncio.sleep(0.5)
+        return "respuesta"
+
+    gateway._create = slow_create
+    results = []
+    patient = threading.Thread(target=lambda: results.append(gateway.complete("gpt", MESSAGES)))
+    patient.start()
+    time.sleep(0.05)
+
+    # Otra sesión pide lo mismo pero se cansa de esperar antes
+    gateway.timeout = 0.05
+    with pytest.raises(GatewayTimeoutError):
+        gateway.complete("gpt", MESSAGES)
+
+    patient.join(timeout=3)
+    assert results == ["respuesta"]
+
+
+def test_cancelled_request_surfaces_as_gateway_timeout(gateway):
+    async def cancelled_create(deployment_name, messages, params):
+        raise asyncio.CancelledError()
+
+    gateway._create = cancelled_create
+    with pytest.raises(GatewayTimeoutError):
+        gateway.complete("gpt", MESSAGES)
+
+
+def test_deployment_without_backend_fails_at_startup():
+    pinned = {
+        "endpoint": "http://127.0.0.1:9", "api_key": "test", "api_version": "2024-10-21",
+        "deployment": "gpt-4o-mini",
+    }
+    with pytest.raises(GatewayConfigurationError):
+        LLMGateway([pinned], deployments=["gpt-4o-mini", "gpt-4o"])
+    # Un backend sin deployment fijo atiende cualquiera
+    LLMGateway([pinned, dict(pinned, deployment=None)], deployments=["gpt-4o-mini", "gpt-4o"])
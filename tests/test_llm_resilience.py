@@ -0,0 +1,147 @@
+"""Pruebas de los reintentos y del circuito hacia Azure OpenAI."""
+import asyncio
+import email.utils
+import time
+
+import httpx
+import openai
+import pytest
+
+import llm_resilience
+from llm_resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    LLMRequestError,
+    LLMUnavailableError,
+    RetryPolicy,
+    call_with_retries,
+    retry_after,
+)
+
+REQUEST = httpx.Request("POST", "https://example.openai.azure.com/openai/deployments/gpt/chat/completions")
+
+
+def status_error(cls, status_code, headers=None, body=None):
+    response = httpx.Response(status_code, headers=headers or {}, request=REQUEST)
+    return cls(f"error {status_code}", response=response, body=body)
+
+
+def test_retry_after_reads_milliseconds_seconds_and_dates():
+    assert retry_after(status_error(openai.RateLimitError, 429, {"retry-after-ms": "1500"})) == 1.5
+    assert retry_after(status_error(openai.RateLimitError, 429, {"retry-after": "3"})) == 3.0
+    date = email.utils.formatdate(time.time() + 60, usegmt=True)
+    assert 55 <= retry_after(status_error(openai.RateLimitError, 429, {"retry-after": date})) <= 60
+    assert retry_after(status_error(openai.RateLimitError, 429, {"retry-after": "pronto"})) is None
+    assert retry_after(status_error(openai.RateLimitError, 429)) is None
+    assert retry_after(ValueError("sin respuesta")) is None
+
+
+def test_backoff_is_capped_and_respects_retry_after(monkeypatch):
+    monkeypatch.setattr(llm_resilience.random, "uniform", lambda low, high: high)
+    policy = RetryPolicy(base_delay=0.5, max_delay=2)
+    error = status_error(openai.InternalServerError, 500)
+    assert [policy.delay(attempt, error) for attempt in (1, 2, 3, 4)] == [0.5, 1.0, 2, 2]
+    assert policy.delay(1, status_error(openai.RateLimitError, 429, {"retry-after": "5"})) == 5.0
+
+
+def test_circuit_opens_and_lets_one_trial_through(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(llm_resilience.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    now[0] += 30
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    # Si la prueba falla, el circuito vuelve a abrirse por completo
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    now[0] += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+class Target:
+    def __init__(self, name, breaker=None):
+        self.name = name
+        self.breaker = breaker or CircuitBreaker(failure_threshold=10)
+
+
+def single_target_picker(target):
+    return lambda failed: target if target.breaker.allow() else None
+
+
+def test_transient_errors_are_retried(monkeypatch):
+    monkeypatch.setattr(llm_resilience.random, "uniform", lambda low, high: 0.0)
+    target = Target("a")
+    calls = []
+
+    async def operation(chosen):
+        calls.append(chosen.name)
+        if len(calls) < 3:
+            raise status_error(openai.InternalServerError, 503)
+        return "ok"
+
+    result = asyncio.run(call_with_retries(operation, RetryPolicy(max_attempts=4), single_target_picker(target)))
+    assert result == "ok"
+    assert calls == ["a", "a", "a"]
+    assert target.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_attempts_are_limited(monkeypatch):
+    monkeypatch.setattr(llm_resilience.random, "uniform", lambda low, high: 0.0)
+
+    async def operation(chosen):
+        raise status_error(openai.RateLimitError, 429)
+
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(call_with_retries(operation, RetryPolicy(max_attempts=2), single_target_picker(Target("a"))))
+
+
+def test_a_failed_target_is_skipped_without_waiting():
+    first, second = Target("a"), Target("b")
+    calls = []
+
+    def pick(failed):
+        return second if failed is first else first
+
+    async def operation(chosen):
+        calls.append(chosen.name)
+        if chosen is first:
+            raise status_error(openai.RateLimitError, 429, {"retry-after": "60"})
+        return "ok"
+
+    started = time.monotonic()
+    assert asyncio.run(call_with_retries(operation, RetryPolicy(deadline=5), pick)) == "ok"
+    assert calls == ["a", "b"]
+    assert time.monotonic() - started < 1
+
+
+def test_rejected_requests_are_not_retried():
+    target = Target("a")
+    calls = []
+
+    async def operation(chosen):
+        calls.append(chosen.name)
+        raise status_error(openai.BadRequestError, 400, body={"code": "content_filter"})
+
+    with pytest.raises(LLMRequestError) as excinfo:
+        asyncio.run(call_with_retries(operation, RetryPolicy(), single_target_picker(target)))
+    assert calls == ["a"]
+    assert excinfo.value.status_code == 400
+    assert excinfo.value.code == "content_filter"
+
+
+def test_open_circuit_fails_fast():
+    async def operation(chosen):
+        raise AssertionError("no debería llamarse")
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(call_with_retries(operation, RetryPolicy(), lambda failed: None))
@@ -0,0 +1,55 @@
+"""Pruebas de los conteos de tokens precalculados de los prompts."""
+import shutil
+
+import pytest
+
+import clue_catalog
+from prompts import catalog_token_counts, genie_messages, genie_prompt_tokens, messages_tokens
+from usage_ledger import BUDGET_EXHAUSTED, BUDGET_OK, BUDGET_SHORT, MemoryUsageLedger
+
+
+@pytest.fixture
+def clues_path(tmp_path):
+    path = tmp_path / "clues.yaml"
+    shutil.copy("clues.yaml", path)
+    yield str(path)
+    clue_catalog.clear_cache()
+
+
+def test_compiled_catalog_carries_token_counts(clues_path):
+    clue_catalog.compile_catalog(clues_path)
+    catalog = clue_catalog.load_catalog(clues_path)
+    assert catalog.token_counts is not None
+    assert catalog_token_counts(catalog) is catalog.token_counts
+
+    question = catalog.get(catalog.first_id)
+    counts = catalog.token_counts[question["id"]]
+    assert len(counts["genie"]) == len(question["clues"]) + 1
+    expected = messages_tokens(genie_messages(list(question["clues"]), question["question"], 0, persona=catalog.persona))
+    assert counts["genie"][1] == expected
+
+
+def test_catalog_without_snapshot_counts_on_first_use(clues_path):
+    catalog = clue_catalog.load_catalog(clues_path)
+    assert catalog.token_counts is None
+    assert set(catalog_token_counts(catalog)) == set(catalog.ids)
+
+
+def test_genie_prompt_tokens_estimates_a_query(clues_path):
+    catalog = clue_catalog.load_catalog(clues_path)
+    question = catalog.get(catalog.first_id)
+    query = "¿Tiene que ver con la cocina?"
+    messages = genie_messages(list(question["clues"]), question["question"], -1, query, catalog.persona)
+    assert abs(genie_prompt_tokens(catalog, question["id"], -1, query) - messages_tokens(messages)) <= 3
+
+
+def test_upcoming_call_counts_toward_the_budget():
+    ledger = MemoryUsageLedger(session_budget=1000, soft_ratio=0.8, window=0)
+    ledger.record({
+        "ts": 0, "hunt_id": None, "question_id": "1", "session_id": "ana", "agent": "genie",
+        "deployment": "gpt-4o-mini", "prompt_tokens": 500, "completion_tokens": 0, "cached_tokens": 0,
+        "estimated": 0,
+    })
+    assert ledger.budget_state("ana") == BUDGET_OK
+    assert ledger.budget_state("ana", upcoming=350) == BUDGET_SHORT
+    assert ledger.budget_state("ana", upcoming=600) == BUDGET_EXHAUSTED
@@ -0,0 +1,23 @@
+"""Pruebas de la degradación de la evaluación estructurada ante errores 400."""
+from llm_agents import rejects_structured_output
+from llm_resilience import LLMRequestError, LLMUnavailableError
+
+
+def test_response_format_rejection_disables_structured_output():
+    error = LLMRequestError("Azure OpenAI rechazó el pedido", 400, "BadRequest", "response_format")
+    assert rejects_structured_output(error)
+
+
+def test_json_schema_message_without_param_counts_as_rejection():
+    error = LLMRequestError("response_format json_schema no está soportado", 400)
+    assert rejects_structured_output(error)
+
+
+def test_content_filter_does_not_disable_structured_output():
+    error = LLMRequestError("The response was filtered", 400, "content_filter", "prompt")
+    assert not rejects_structured_output(error)
+
+
+def test_other_errors_do_not_disable_structured_output():
+    assert not rejects_structured_output(LLMRequestError("response_format", 401, param="response_format"))
+    assert not rejects_structured_output(LLMUnavailableError("response_format"))
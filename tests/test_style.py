@@ -0,0 +1,37 @@
+"""Pruebas de la elección entre hoja de estilos enlazada o en línea."""
+import sys
+import types
+
+import pytest
+
+import style
+
+
+@pytest.fixture
+def static_handler(monkeypatch):
+    """Simular el módulo app_static_file_handler de las versiones con Tornado."""
+    def install(extensions):
+        module = types.ModuleType("streamlit.web.server.app_static_file_handler")
+        module.SAFE_APP_STATIC_FILE_EXTENSIONS = extensions
+        monkeypatch.setitem(sys.modules, module.__name__, module)
+        monkeypatch.setattr(sys.modules["streamlit.web.server"], "app_static_file_handler", module, raising=False)
+        style.stylesheet_html.cache_clear()
+    yield install
+    style.stylesheet_html.cache_clear()
+
+
+def test_css_inline_when_static_handler_serves_it_as_plain_text(static_handler):
+    static_handler((".jpg", ".png", ".pdf"))
+    assert not style.static_css_supported()
+    assert style.stylesheet_html("auto").startswith("<style>")
+
+
+def test_css_linked_when_static_handler_serves_css(static_handler):
+    static_handler((".css", ".png"))
+    assert style.static_css_supported()
+    assert style.stylesheet_html("auto").startswith('<link rel="stylesheet"')
+
+
+def test_forced_mode_ignores_detection(static_handler):
+    static_handler((".png",))
+    assert style.stylesheet_html("static").startswith("<link")
@@ -0,0 +1,89 @@
+"""Pruebas del registro de uso y del presupuesto de tokens por sesión."""
+import sqlite3
+import time
+
+import pytest
+
+from usage_ledger import (
+    BUDGET_EXHAUSTED,
+    BUDGET_OK,
+    BUDGET_SHORT,
+    MemoryUsageLedger,
+    SQLiteUsageLedger,
+)
+
+
+def entry(session_id, tokens, ts=None):
+    return {
+        "ts": time.time() if ts is None else ts, "hunt_id": "regalo", "question_id": "1",
+        "session_id": session_id, "agent": "genie", "deployment": "gpt-4o-mini",
+        "prompt_tokens": tokens, "completion_tokens": 0, "cached_tokens": 0, "estimated": 0,
+    }
+
+
+def test_budget_states():
+    ledger = MemoryUsageLedger(session_budget=100, soft_ratio=0.8)
+    assert ledger.budget_state("ana") == BUDGET_OK
+    ledger.record(entry("ana", 85))
+    assert ledger.budget_state("ana") == BUDGET_SHORT
+    ledger.record(entry("ana", 15))
+    assert ledger.budget_state("ana") == BUDGET_EXHAUSTED
+    assert ledger.budget_state("beto") == BUDGET_OK
+
+
+def test_usage_outside_the_window_does_not_count():
+    ledger = MemoryUsageLedger(session_budget=100, window=3600)
+    ledger.record(entry("ana", 100, ts=time.time() - 7200))
+    ledger.record(entry("ana", 10))
+    assert ledger.session_tokens("ana") == 10
+
+
+def test_session_totals_are_bounded():
+    ledger = MemoryUsageLedger(session_budget=100, totals_size=2)
+    for session_id in ("ana", "beto", "carla"):
+        ledger.record(entry(session_id, 1))
+        ledger.session_tokens(session_id)
+    assert list(ledger._session_totals) == ["beto", "carla"]
+    # Una sesión desalojada se recalcula desde el registro
+    assert ledger.session_tokens("ana") == 1
+
+
+@pytest.fixture
+def sqlite_ledger(tmp_path):
+    # Sin hilo de escritura: las pruebas vuelcan a mano
+    ledger = SQLiteUsageLedger(str(tmp_path / "usage.db"), flush_interval=3600, session_budget=100)
+    yield ledger
+    ledger.close()
+
+
+def stored_rows(ledger):
+    with sqlite3.connect(ledger.path) as connection:
+        return connection.execute("SELECT COUNT(*) FROM usage").fetchone()[0]
+
+
+def test_sqlite_ledger_writes_in_batches(sqlite_ledger):
+    sqlite_ledger.record(entry("ana", 30))
+    sqlite_ledger.record(entry("ana", 20))
+    assert stored_rows(sqlite_ledger) == 0
+    # Lo pendiente ya cuenta para el presupuesto
+    assert sqlite_ledger.session_tokens("ana") == 50
+
+    assert sqlite_ledger.flush() == 2
+    assert stored_rows(sqlite_ledger) == 2
+    sqlite_ledger._session_totals.clear()
+    assert sqlite_ledger.session_tokens("ana") == 50
+
+
+def test_sqlite_ledger_keeps_rows_when_the_write_fails(sqlite_ledger, monkeypatch):
+    sqlite_ledger.record(entry("ana", 30))
+
+    def broken_connection():
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(sqlite_ledger, "_connection", broken_connection)
+    with pytest.raises(sqlite3.OperationalError):
+        sqlite_ledger.flush()
+    monkeypatch.undo()
+
+    assert sqlite_ledger.flush() == 1
+    assert stored_rows(sqlite_ledger) == 1
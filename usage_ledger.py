@@ -0,0 +1,537 @@
+"""
+Módulo de contabilidad de tokens: uso y costo por búsqueda, pregunta y sesión.
+
+Cada llamada al modelo deja una fila con los tokens que informó Azure OpenAI
+(`usage` de la respuesta o del último chunk del stream); si la respuesta no lo
+trae, se estima con prompts.count_tokens y la fila queda marcada como estimada.
+
+Las filas se escriben en lotes desde un hilo en segundo plano (como el búfer
+de progreso de game_manager), así que registrar una llamada no hace E/S en el
+hilo del script.
+
+Con SESSION_TOKEN_BUDGET se acota el gasto de cada sesión de juego dentro de
+una ventana de SESSION_BUDGET_WINDOW segundos:
+- Por debajo de SESSION_BUDGET_SOFT_RATIO del presupuesto, todo sigue igual.
+- Al superarlo, el Genio responde en versión corta (menos max_tokens).
+- Con el presupuesto agotado, el Genio usa respuestas precalculadas o
+  enlatadas. El evaluador nunca se corta: sin él no se puede avanzar.
+
+Uso para ver el informe:
+    python usage_ledger.py report [hunt|question|session|agent|deployment]
+"""
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from prompts import count_tokens, messages_tokens
+
+logger = logging.getLogger(__name__)
+
+# "sqlite", "memory" u "off"
+DEFAULT_BACKEND = os.getenv("USAGE_STORE", "sqlite")
+DEFAULT_DB_PATH = os.getenv("USAGE_DB_PATH", "usage.db")
+# Tokens (entrada + salida) por sesión; 0 = sin límite
+DEFAULT_SESSION_BUDGET = int(os.getenv("SESSION_TOKEN_BUDGET", "0"))
+DEFAULT_SOFT_RATIO = float(os.getenv("SESSION_BUDGET_SOFT_RATIO", "0.8"))
+# Ventana (segundos) en la que se cuentan los tokens de una sesión; 0 = desde siempre
+DEFAULT_BUDGET_WINDOW = float(os.getenv("SESSION_BUDGET_WINDOW", "86400"))
+# Sesiones con el total en memoria y segundos hasta recalcularlo desde el registro
+DEFAULT_TOTALS_SIZE = int(os.getenv("USAGE_TOTALS_SIZE", "10000"))
+DEFAULT_TOTALS_TTL = float(os.getenv("USAGE_TOTALS_TTL", "60"))
+# Antigüedad máxima (segundos) de una fila sin escribir; 0 para escribir al instante
+DEFAULT_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", "1.0"))
+# Filas pendientes que fuerzan una escritura anticipada
+DEFAULT_FLUSH_BATCH = int(os.getenv("USAGE_FLUSH_BATCH", "256"))
+# Precios por millón de tokens: {"deployment": {"prompt": 0.15, "completion": 0.6}}
+DEFAULT_PRICES = json.loads(os.getenv("USAGE_PRICES") or "{}")
+
+# Estados del presupuesto de una sesión
+BUDGET_OK = "ok"
+BUDGET_SHORT = "short"
+BUDGET_EXHAUSTED = "exhausted"
+
+# Columnas por las que se puede agrupar el informe
+GROUP_COLUMNS = {
+    "hunt": "hunt_id",
+    "question": "question_id",
+    "session": "session_id",
+    "agent": "agent",
+    "deployment": "deployment",
+}
+
+
+def usage_counts(usage):
+    """
+    Tokens de un objeto `usage` de la API (CompletionUsage o dict).
+
+    Args:
+        usage: Uso informado por el modelo (o None)
+
+    Returns:
+        tuple: (prompt_tokens, completion_tokens, cached_tokens) o None si no hay datos
+    """
+    if usage is None:
+        return None
+    if not isinstance(usage, dict):
+        usage = usage.model_dump() if hasattr(usage, "model_dump") else vars(usage)
+    details = usage.get("prompt_tokens_details") or {}
+    return (
+        int(usage.get("prompt_tokens") or 0),
+        int(usage.get("completion_tokens") or 0),
+        int(details.get("cached_tokens") or 0),
+    )
+
+
+def entry_cost(entry, prices=None):
+    """
+    Costo (en la moneda de USAGE_PRICES) de una fila del ledger.
+
+    Args:
+        entry (dict): Fila con deployment, prompt_tokens y completion_tokens
+        prices (dict): Precios por millón de tokens por deployment
+
+    Returns:
+        float: Costo o None si el deployment no tiene precio configurado
+    """
+    price = (DEFAULT_PRICES if prices is None else prices).get(entry["deployment"])
+    if not price:
+        return None
+    return (
+        entry["prompt_tokens"] * float(price.get("prompt", 0))
+        + entry["completion_tokens"] * float(price.get("completion", 0))
+    ) / 1_000_000
+
+
+class UsageLedger:
+    """
+    Interfaz común de los registros de uso.
+
+    Los totales por sesión se guardan en memoria en un LRU acotado
+    (USAGE_TOTALS_SIZE) y se recalculan desde el registro cada
+    USAGE_TOTALS_TTL segundos, para que la ventana del presupuesto avance.
+    """
+
+    def __init__(self, session_budget=DEFAULT_SESSION_BUDGET, soft_ratio=DEFAULT_SOFT_RATIO,
+                 window=DEFAULT_BUDGET_WINDOW, totals_size=DEFAULT_TOTALS_SIZE, totals_ttl=DEFAULT_TOTALS_TTL):
+        """
+        Args:
+            session_budget (int): Tokens por sesión (0 = sin límite)
+            soft_ratio (float): Fracción del presupuesto desde la que se acortan las respuestas
+            window (float): Segundos en los que se cuentan los tokens (0 = desde siempre)
+            totals_size (int): Sesiones con el total en memoria
+            totals_ttl (float): Segundos hasta recalcular el total de una sesión
+        """
+        self.session_budget = session_budget
+        self.soft_ratio = soft_ratio
+        self.window = window
+        self.totals_size = totals_size
+        self.totals_ttl = totals_ttl
+        # session_id -> (tokens, momento en que se calculó)
+        self._session_totals = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _insert(self, entry):
+        """Guardar una fila (se llama con el lock tomado: no debe hacer E/S)."""
+        raise NotImplementedError
+
+    def _load_session_total(self, session_id, since):
+        """Tokens registrados para una sesión desde `since` (se llama sin el lock)."""
+        raise NotImplementedError
+
+    def rows(self):
+        """
+        Todas las filas registradas.
+
+        Returns:
+            list: Filas (dicts)
+        """
+        raise NotImplementedError
+
+    def record(self, entry):
+        """
+        Registrar el uso de una llamada.
+
+        Args:
+            entry (dict): Fila con ts, hunt_id, question_id, session_id, agent,
+                deployment, prompt_tokens, completion_tokens, cached_tokens y estimated
+        """
+        with self._lock:
+            self._insert(entry)
+            session_id = entry.get("session_id")
+            cached = self._session_totals.get(session_id) if session_id else None
+            if cached is not None:
+                total, computed_at = cached
+                self._session_totals[session_id] = (
+                    total + entry["prompt_tokens"] + entry["completion_tokens"], computed_at
+                )
+
+    def session_tokens(self, session_id):
+        """
+        Tokens usados por una sesión dentro de la ventana del presupuesto.
+
+        Args:
+            session_id (str): Identificador de la sesión/jugador
+
+        Returns:
+            int: Tokens de entrada y salida acumulados
+        """
+        now = time.time()
+        with self._lock:
+            cached = self._session_totals.get(session_id)
+            if cached is not None and now - cached[1] < self.totals_ttl:
+                self._session_totals.move_to_end(session_id)
+                return cached[0]
+        since = now - self.window if self.window else 0.0
+        total = self._load_session_total(session_id, since)
+        with self._lock:
+            self._session_totals[session_id] = (total, now)
+            self._session_totals.move_to_end(session_id)
+            while len(self._session_totals) > self.totals_size:
+                self._session_totals.popitem(last=False)
+        return total
+
+    def budget_state(self, session_id, upcoming=0):
+        """
+        Estado del presupuesto de tokens de una sesión.
+
+        Args:
+            session_id (str): Identificador de la sesión/jugador
+            upcoming (int): Tokens estimados de la llamada que se va a hacer
+                (cuentan como ya usados, para no pasarse del presupuesto)
+
+        Returns:
+            str: BUDGET_OK, BUDGET_SHORT o BUDGET_EXHAUSTED
+        """
+        if not self.session_budget or not session_id:
+            return BUDGET_OK
+        used = self.session_tokens(session_id) + upcoming
+        if used >= self.session_budget:
+            return BUDGET_EXHAUSTED
+        if used >= self.session_budget * self.soft_ratio:
+            return BUDGET_SHORT
+        return BUDGET_OK
+
+    def report(self, group_by="question", prices=None):
+        """
+        Uso agregado por una dimensión.
+
+        Args:
+            group_by (str): "hunt", "question", "session", "agent" o "deployment"
+            prices (dict): Precios por millón de tokens por deployment
+
+        Returns:
+            list: Un dict por grupo (calls, prompt/completion/cached tokens,
+                estimated y cost), ordenados por tokens totales
+        """
+        column = GROUP_COLUMNS[group_by]
+        groups = {}
+        for entry in self.rows():
+            key = entry[column] or "-"
+            group = groups.setdefault(key, {
+                group_by: key, "calls": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                "cached_tokens": 0, "estimated": 0, "cost": None,
+            })
+            group["calls"] += 1
+            group["prompt_tokens"] += entry["prompt_tokens"]
+            group["completion_tokens"] += entry["completion_tokens"]
+            group["cached_tokens"] += entry["cached_tokens"]
+            group["estimated"] += int(bool(entry["estimated"]))
+            cost = entry_cost(entry, prices)
+            if cost is not None:
+                group["cost"] = (group["cost"] or 0.0) + cost
+        return sorted(
+            groups.values(),
+            key=lambda group: group["prompt_tokens"] + group["completion_tokens"],
+            reverse=True
+        )
+
+
+class MemoryUsageLedger(UsageLedger):
+    """Registro en memoria (se pierde al reiniciar el proceso)."""
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self._rows = []
+
+    def _insert(self, entry):
+        self._rows.append(dict(entry))
+
+    def _load_session_total(self, session_id, since):
+        with self._lock:
+            return sum(
+                entry["prompt_tokens"] + entry["completion_tokens"]
+                for entry in self._rows if entry["session_id"] == session_id and entry["ts"] >= since
+            )
+
+    def rows(self):
+        with self._lock:
+            return [dict(entry) for entry in self._rows]
+
+
+class SQLiteUsageLedger(UsageLedger):
+    """
+    Registro en SQLite (modo WAL) con una fila por llamada al modelo.
+
+    Las filas se acumulan en memoria y se escriben en lotes desde un hilo en
+    segundo plano como máximo USAGE_FLUSH_INTERVAL segundos después.
+    """
+
+    COLUMNS = (
+        "ts", "hunt_id", "question_id", "session_id", "agent", "deployment",
+        "prompt_tokens", "completion_tokens", "cached_tokens", "estimated",
+    )
+
+    def __init__(self, path=DEFAULT_DB_PATH, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 flush_batch=DEFAULT_FLUSH_BATCH, **options):
+        """
+        Args:
+            path (str): Archivo de la base de datos
+            flush_interval (float): Segundos máximos que una fila espera en memoria
+            flush_batch (int): Filas pendientes que fuerzan una escritura anticipada
+            **options: Presupuesto por sesión (ver UsageLedger)
+        """
+        super().__init__(**options)
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self._local = threading.local()
+        # Filas sin escribir (se modifican con self._lock tomado)
+        self._pending = []
+        # Tomado mientras se escribe un lote: quien lo tiene ve el disco y los pendientes sin huecos
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS usage ("
+            " ts REAL NOT NULL,"
+            " hunt_id TEXT,"
+            " question_id TEXT,"
+            " session_id TEXT,"
+            " agent TEXT NOT NULL,"
+            " deployment TEXT,"
+            " prompt_tokens INTEGER NOT NULL,"
+            " completion_tokens INTEGER NOT NULL,"
+            " cached_tokens INTEGER NOT NULL,"
+            " estimated INTEGER NOT NULL)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS usage_session_ts ON usage (session_id, ts)")
+        connection.commit()
+        self._thread = None
+        if flush_interval > 0:
+            self._thread = threading.Thread(target=self._run, name="usage-writer", daemon=True)
+            self._thread.start()
+
+    def _connection(self):
+        """Conexión propia de cada hilo (SQLite no comparte conexiones entre hilos)."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _run(self):
+        """Escribir periódicamente (o antes, si se llena el lote) hasta cerrar el registro."""
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                # El lote volvió a los pendientes en flush(); se reintenta en el próximo ciclo
+                logger.warning("No se pudo escribir el registro de uso en %s", self.path, exc_info=True)
+
+    def _insert(self, entry):
+        self._pending.append(dict(entry))
+
+    def record(self, entry):
+        super().record(entry)
+        if self._thread is None:
+            self.flush()
+        elif len(self._pending) >= self.flush_batch:
+            self._wakeup.set()
+
+    def flush(self):
+        """
+        Escribir las filas pendientes en una sola transacción.
+
+        Si la base falla, las filas vuelven a los pendientes.
+
+        Returns:
+            int: Filas escritas
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            try:
+                connection = self._connection()
+                with connection:
+                    connection.executemany(
+                        f"INSERT INTO usage ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                        [[entry[column] for column in self.COLUMNS] for entry in batch]
+                    )
+            except Exception:
+                with self._lock:
+                    self._pending[:0] = batch
+                raise
+            return len(batch)
+
+    def close(self):
+        """Detener el hilo y escribir lo pendiente (se llama al apagar el proceso)."""
+        self._closed = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=max(1.0, self.flush_interval * 2))
+        self.flush()
+
+    def _load_session_total(self, session_id, since):
+        with self._flush_lock:
+            row = self._connection().execute(
+                "SELECT COALESCE(SUM(prompt_tokens + completion_tokens), 0) FROM usage"
+                " WHERE session_id = ? AND ts >= ?",
+                (session_id, since)
+            ).fetchone()
+            with self._lock:
+                pending = sum(
+                    entry["prompt_tokens"] + entry["completion_tokens"] for entry in self._pending
+                    if entry["session_id"] == session_id and entry["ts"] >= since
+                )
+        return row[0] + pending
+
+    def rows(self):
+        self.flush()
+        cursor = self._connection().execute(f"SELECT {', '.join(self.COLUMNS)} FROM usage")
+        return [dict(zip(self.COLUMNS, row)) for row in cursor]
+
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+
+def create_usage_ledger(backend=DEFAULT_BACKEND, path=DEFAULT_DB_PATH):
+    """
+    Crear un registro de uso.
+
+    Args:
+        backend (str): "sqlite", "memory" u "off"
+        path (str): Archivo de la base de datos (solo para sqlite)
+
+    Returns:
+        UsageLedger: Registro configurado (None si está apagado)
+    """
+    if backend == "off":
+        return None
+    if backend == "memory":
+        return MemoryUsageLedger()
+    if backend == "sqlite":
+        ledger = SQLiteUsageLedger(path)
+        # Escribir lo pendiente al apagar para no perder el consumo registrado
+        atexit.register(ledger.close)
+        return ledger
+    raise ValueError(f"Registro de uso desconocido: {backend}")
+
+
+def get_usage_ledger():
+    """
+    Registro compartido por todas las sesiones del proceso.
+
+    Returns:
+        UsageLedger: Instancia configurada con USAGE_STORE / USAGE_DB_PATH (None si está apagado)
+    """
+    global _ledger
+    if _ledger is None and DEFAULT_BACKEND != "off":
+        with _ledger_lock:
+            if _ledger is None:
+                _ledger = create_usage_ledger()
+    return _ledger
+
+
+def set_usage_ledger(ledger):
+    """Reemplazar el registro compartido (p. ej. por uno en memoria en pruebas)."""
+    global _ledger
+    with _ledger_lock:
+        _ledger = ledger
+
+
+def record_usage(agent, deployment, messages, completion="", usage=None, usage_scope=None):
+    """
+    Registrar los tokens de una llamada al modelo.
+
+    Args:
+        agent (str): Agente que hizo la llamada ("grader", "genie", ...)
+        deployment (str): Deployment usado
+        messages (list): Mensajes enviados (para estimar si no hay `usage`)
+        completion (str): Texto generado (para estimar si no hay `usage`)
+        usage: Uso informado por el modelo (CompletionUsage, dict o None)
+        usage_scope (Mapping): hunt_id, question_id y session_id de la llamada
+    """
+    ledger = get_usage_ledger()
+    if ledger is None:
+        return
+    counts = usage_counts(usage)
+    estimated = counts is None
+    if estimated:
+        counts = (messages_tokens(messages), count_tokens(completion or ""), 0)
+    usage_scope = usage_scope or {}
+    ledger.record({
+        "ts": time.time(),
+        "hunt_id": usage_scope.get("hunt_id"),
+        "question_id": usage_scope.get("question_id"),
+        "session_id": usage_scope.get("session_id"),
+        "agent": agent,
+        "deployment": deployment,
+        "prompt_tokens": counts[0],
+        "completion_tokens": counts[1],
+        "cached_tokens": counts[2],
+        "estimated": int(estimated),
+    })
+
+
+def budget_state(session_id, upcoming=0):
+    """
+    Estado del presupuesto de tokens de una sesión (ver UsageLedger.budget_state).
+
+    Args:
+        session_id (str): Identificador de la sesión/jugador
+        upcoming (int): Tokens estimados de la llamada que se va a hacer
+
+    Returns:
+        str: BUDGET_OK, BUDGET_SHORT o BUDGET_EXHAUSTED
+    """
+    ledger = get_usage_ledger()
+    if ledger is None:
+        return BUDGET_OK
+    return ledger.budget_state(session_id, upcoming)
+
+
+def print_report(groups, group_by):
+    """Mostrar el informe como tabla."""
+    print(f"{group_by:<40}{'llamadas':>10}{'entrada':>12}{'salida':>10}{'cacheados':>11}{'estimadas':>11}{'costo':>11}")
+    for group in groups:
+        cost = f"{group['cost']:.4f}" if group["cost"] is not None else "-"
+        print(
+            f"{str(group[group_by])[:39]:<40}{group['calls']:>10}{group['prompt_tokens']:>12}"
+            f"{group['completion_tokens']:>10}{group['cached_tokens']:>11}{group['estimated']:>11}{cost:>11}"
+        )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "report":
+        sys.exit("Uso: python usage_ledger.py report [hunt|question|session|agent|deployment]")
+    dimension = sys.argv[2] if len(sys.argv) > 2 else "question"
+    if dimension not in GROUP_COLUMNS:
+        sys.exit(f"Dimensión desconocida: {dimension} (opciones: {', '.join(GROUP_COLUMNS)})")
+    report_ledger = get_usage_ledger()
+    if report_ledger is None:
+        sys.exit("El registro de uso está apagado (USAGE_STORE=off)")
+    print_report(report_ledger.report(dimension), dimension)